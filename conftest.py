@@ -0,0 +1,12 @@
+import numpy as np
+from PIL import Image
+
+
+def random_photo(size, seed=0, cells=(32, 24), resample=Image.NEAREST):
+    """
+    A textured test photo: random colour cells scaled up to size
+    纯色的图片通不过质量检查；cells=size 时每个像素都是随机的，压缩后的大小和质量有关
+    """
+    pixels = np.random.default_rng(seed).integers(0, 255, (cells[1], cells[0], 3), dtype=np.uint8)
+    img = Image.fromarray(pixels)
+    return img if img.size == tuple(size) else img.resize(size, resample)
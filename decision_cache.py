@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from loguru import logger
+
+
+DECISION_DB = 'match_cache/decisions.db'
+DECISION_VERSION = 1  # 提示词、模型或者匹配方法变化时加一，旧的决定不再使用
+DECISION_TTL = 30 * 24 * 3600  # seconds, 网站的选项会变化
+
+
+def normalize_name(name):
+    """Case and whitespace insensitive form of a value, 'Maison  Margiela ' and 'maison margiela' are the same decision"""
+    return ' '.join(str(name).split()).casefold()
+
+
+def options_hash(names):
+    """Hash of the option set, independent of the order the page lists them in"""
+    options = sorted({' '.join(name.split()) for name in names if name.strip()})
+    return hashlib.sha1('\n'.join(options).encode('utf-8')).hexdigest()
+
+
+def decision_key(org_name, names, prompt1='', prompt2=''):
+    data = json.dumps([normalize_name(org_name), options_hash(names), prompt1.strip(), prompt2.strip()], ensure_ascii=False)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class DecisionCache:
+    """
+    持久化的选项匹配结果 (SQLite, WAL)，同样的值、同样的选项、同样的提示词只问一次 AI
+    内存里保存已经读过的决定，重复的查询不访问数据库
+    """
+
+    def __init__(self, path=DECISION_DB, ttl=DECISION_TTL, version=DECISION_VERSION):
+        self.path = path
+        self.ttl = ttl
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._memory = {}  # key -> (decision, created_at)
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, isolation_level=None, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS decisions (
+                decision_key TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                org_name TEXT NOT NULL,
+                options_hash TEXT NOT NULL,
+                decision TEXT NOT NULL,
+                source TEXT NOT NULL DEFAULT '',
+                created_at REAL NOT NULL
+            )
+        ''')
+
+    def get(self, org_name, names, prompt1='', prompt2=''):
+        """:return: the cached decision, None when there is none or it expired"""
+        key = decision_key(org_name, names, prompt1, prompt2)
+        with self._lock:
+            if key not in self._memory:
+                row = self.conn.execute('SELECT decision, created_at FROM decisions WHERE decision_key = ? AND version = ?',
+                                        (key, self.version)).fetchone()
+                if row:
+                    self._memory[key] = row
+
+            decision, created_at = self._memory.get(key, (None, 0))
+            if decision is None or time.time() - created_at > self.ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return decision
+
+    def put(self, org_name, names, decision, prompt1='', prompt2='', source='ai'):
+        key = decision_key(org_name, names, prompt1, prompt2)
+        created_at = time.time()
+        with self._lock:
+            self._memory[key] = (decision, created_at)
+            self.conn.execute('INSERT OR REPLACE INTO decisions VALUES (?, ?, ?, ?, ?, ?, ?)',
+                              (key, self.version, normalize_name(org_name), options_hash(names), decision, source, created_at))
+
+    def purge(self):
+        """Delete the expired decisions and the decisions of older versions"""
+        with self._lock:
+            self._memory.clear()
+            deleted = self.conn.execute('DELETE FROM decisions WHERE version != ? OR created_at < ?',
+                                        (self.version, time.time() - self.ttl)).rowcount
+        if deleted:
+            logger.debug(f'Purged {deleted} expired decisions')
+        return deleted
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> DecisionCache:
+    """The decision cache shared by the whole run"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DecisionCache()
+            _cache.purge()
+        return _cache
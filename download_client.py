@@ -0,0 +1,195 @@
+import os
+import uuid
+import atexit
+import asyncio
+import threading
+from typing import Mapping, NamedTuple, Optional, Tuple
+
+import aiohttp
+from multidict import CIMultiDict
+from PIL import ImageFile
+from loguru import logger
+
+import retry
+
+
+MAX_CONNECTIONS = 32  # 所有主机的连接总数
+MAX_CONNECTIONS_PER_HOST = 6  # 每个主机 (CDN、Google Drive) 的连接数
+MAX_CONCURRENT_DOWNLOADS = 8  # 所有产品同时进行的下载数
+DNS_CACHE_TTL = 300  # seconds
+KEEPALIVE_TIMEOUT = 60  # seconds
+TIMEOUT = 30  # seconds
+CHUNK_SIZE = 64 * 1024
+WRITE_BUFFER_SIZE = 1024 * 1024  # 攒够再写盘，写盘在线程池里进行
+SNIFF_LIMIT = 256 * 1024  # 最多读这么多字节来确定图片尺寸
+
+# 图片文件开头的字节
+IMAGE_SIGNATURES = (b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n', b'GIF87a', b'GIF89a')
+
+
+class InvalidImage(retry.PermanentError):
+    """The response is not an image or the image is too small, retrying will not help"""
+
+    def __init__(self, message, url='', content_type='', head=b''):
+        super().__init__(message)
+        self.url = url  # 重定向之后的地址
+        self.content_type = content_type
+        self.head = head  # 已经读到的开头部分，例如 Google Drive 的确认网页
+
+
+def is_image_signature(data: bytes) -> bool:
+    return data.startswith(IMAGE_SIGNATURES) or (data[:4] == b'RIFF' and data[8:12] == b'WEBP')
+
+
+class FetchResult(NamedTuple):
+    status: int
+    headers: Mapping[str, str]  # 不区分大小写
+    path: Optional[str]  # 200 时保存的文件
+    size: int
+
+
+class DownloadClient:
+    """
+    整个运行共用的下载客户端
+    一个 aiohttp 会话在后台线程的事件循环里运行：长连接复用、每个主机的连接数限制、DNS 缓存
+    同步代码 (pics.save_pic) 和其他事件循环里的异步代码 (ImprovedImageHandler) 都通过它下载，全局信号量限制同时下载的数量
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_DOWNLOADS):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='download-client', daemon=True)
+        self._thread.start()
+
+        self._max_concurrent = max_concurrent
+        self._session, self._semaphore = self._run(self._open())
+
+    async def _open(self):
+        connector = aiohttp.TCPConnector(
+            limit=MAX_CONNECTIONS,
+            limit_per_host=MAX_CONNECTIONS_PER_HOST,
+            ttl_dns_cache=DNS_CACHE_TTL,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+        )
+        session = aiohttp.ClientSession(connector=connector, headers={'User-Agent': 'Mozilla/5.0'})
+        return session, asyncio.Semaphore(self._max_concurrent)
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    @staticmethod
+    def _check_image(url, response, head, parser, min_size):
+        """
+        Check the first bytes of an image download
+        :return: True when the check is complete, False when more bytes are needed
+        """
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type and not content_type.startswith('image/') and content_type != 'application/octet-stream':
+            raise InvalidImage(f'Not an image ({content_type}): {url}', str(response.url), content_type, head)
+        if len(head) >= 12 and not is_image_signature(head):
+            raise InvalidImage(f'Not an image (starts with {head[:12]!r}): {url}', str(response.url), content_type, head)
+
+        if parser.image is None:
+            if len(head) >= SNIFF_LIMIT:
+                return True  # 尺寸留给 ImageProcessor 检查
+            return False
+
+        width, height = parser.image.size
+        if width < min_size[0] or height < min_size[1]:
+            raise InvalidImage(f'Image too small ({width}x{height}): {url}')
+        return True
+
+    async def _fetch(self, url, path, headers, timeout, image_min_size):
+        async with self._semaphore:
+            async with self._session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                response_headers = CIMultiDict(response.headers)
+                if response.status != 200:
+                    await response.release()
+                    return FetchResult(response.status, response_headers, None, 0)
+
+                # 先写到唯一的临时文件，完成后原子改名，失败时不会留下不完整的文件
+                tmp_path = f'{path}.{uuid.uuid4().hex}.part'
+                checked = image_min_size is None
+                parser = ImageFile.Parser()
+                head = b''
+                buffer = []
+                buffered = 0
+                size = 0
+
+                f = await asyncio.to_thread(open, tmp_path, 'wb')
+                try:
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        if not checked:
+                            head += chunk
+                            if parser.image is None:
+                                try:
+                                    parser.feed(chunk)
+                                except Exception:
+                                    pass  # 解析失败时只检查文件头
+                            try:
+                                checked = self._check_image(url, response, head, parser, image_min_size)
+                            except InvalidImage as e:
+                                if head.lstrip()[:1] == b'<':
+                                    # 网页（例如 Google Drive 的确认页面），读完给调用方解析
+                                    while len(e.head) < SNIFF_LIMIT and (more := await response.content.read(CHUNK_SIZE)):
+                                        e.head += more
+                                raise
+
+                        buffer.append(chunk)
+                        buffered += len(chunk)
+                        size += len(chunk)
+                        if buffered >= WRITE_BUFFER_SIZE:
+                            await asyncio.to_thread(f.write, b''.join(buffer))
+                            buffer, buffered = [], 0
+
+                    if not checked and not is_image_signature(head):
+                        raise InvalidImage(f'Not an image (starts with {head[:12]!r}): {url}', str(response.url),
+                                           response.headers.get('Content-Type', ''), head)
+                    if buffer:
+                        await asyncio.to_thread(f.write, b''.join(buffer))
+                    await asyncio.to_thread(f.close)
+                    await asyncio.to_thread(os.replace, tmp_path, path)
+                except BaseException:
+                    f.close()
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+
+                return FetchResult(response.status, response_headers, path, size)
+
+    def fetch(self, url, path, headers=None, timeout=TIMEOUT, image_min_size: Optional[Tuple[int, int]] = None) -> FetchResult:
+        """
+        Download url to path, blocking. The body is only saved for a 200 response.
+        :param image_min_size: (width, height), check the content type, the file signature and the dimensions
+            from the first bytes and raise InvalidImage without downloading the rest; (0, 0) only checks it is an image
+        """
+        return self._run(self._fetch(url, path, headers, timeout, image_min_size))
+
+    async def fetch_async(self, url, path, headers=None, timeout=TIMEOUT, image_min_size=None) -> FetchResult:
+        """fetch() for coroutines running in any event loop"""
+        future = asyncio.run_coroutine_threadsafe(self._fetch(url, path, headers, timeout, image_min_size), self._loop)
+        return await asyncio.wrap_future(future)
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+        try:
+            self._run(self._session.close())
+        except Exception as e:
+            logger.debug(f'Failed to close the download session: {e}')
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> DownloadClient:
+    """The download client shared by the whole run"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = DownloadClient()
+            atexit.register(_client.close)
+        return _client
@@ -0,0 +1,89 @@
+import os
+import re
+import math
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+
+
+NGRAM_SIZE = 3
+# 置信度达到这个值时直接用模糊匹配的结果，不再问 AI
+MATCH_THRESHOLD = float(os.getenv('FUZZY_MATCH_THRESHOLD', '0.85'))
+# 不能问 AI 时（没有 API key、出错）模糊匹配结果的最低置信度，低于它用 Other
+FALLBACK_THRESHOLD = float(os.getenv('FUZZY_FALLBACK_THRESHOLD', '0.5'))
+
+
+def fold(text):
+    """Lower case without accents and punctuation: 'Hermès' -> 'hermes', 'Dolce & Gabbana' -> 'dolce gabbana'"""
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(re.sub(r'[\W_]+', ' ', text.casefold()).split())
+
+
+def ngrams(text, n=NGRAM_SIZE):
+    """Character n-grams of the folded text, the padding makes the word starts and ends count"""
+    text = f' {fold(text)} '
+    return Counter(text[i:i + n] for i in range(max(1, len(text) - n + 1)))
+
+
+class FuzzyMatcher:
+    """
+    TF-IDF 字符 n-gram 的余弦相似度，一次矩阵运算给所有选项打分
+    选项矩阵按稀疏格式保存（行、列、权重），上千个品牌也不占多少内存
+    """
+
+    def __init__(self, options):
+        self.options = list(options)
+        self.vocabulary = {}
+        rows, columns, counts = [], [], []
+        for row, option in enumerate(self.options):
+            for gram, count in ngrams(option).items():
+                rows.append(row)
+                columns.append(self.vocabulary.setdefault(gram, len(self.vocabulary)))
+                counts.append(count)
+
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.columns = np.asarray(columns, dtype=np.int64)
+        document_frequency = np.bincount(self.columns, minlength=len(self.vocabulary))
+        self.idf = np.log((1 + len(self.options)) / (1 + document_frequency)) + 1
+        self.unknown_idf = math.log(1 + len(self.options)) + 1  # 选项里没有的 n-gram
+
+        weights = np.asarray(counts, dtype=np.float64) * self.idf[self.columns]
+        norms = np.sqrt(np.bincount(self.rows, weights=weights ** 2, minlength=len(self.options)))
+        self.weights = weights / np.maximum(norms, 1e-12)[self.rows]
+
+    def scores(self, query):
+        """:return: cosine similarity of query with every option, in the order of the options"""
+        if not self.options:
+            return np.zeros(0)
+        vector = np.zeros(len(self.vocabulary))
+        norm = 0.0
+        for gram, count in ngrams(query).items():
+            if (column := self.vocabulary.get(gram)) is not None:
+                vector[column] = count * self.idf[column]
+                norm += vector[column] ** 2
+            else:
+                norm += (count * self.unknown_idf) ** 2
+        if norm == 0:
+            return np.zeros(len(self.options))
+        return np.bincount(self.rows, weights=self.weights * vector[self.columns], minlength=len(self.options)) / math.sqrt(norm)
+
+    def match(self, query):
+        """:return: (best option, confidence between 0 and 1), (None, 0.0) when there is no option"""
+        scores = self.scores(query)
+        if not len(scores):
+            return None, 0.0
+        best = int(np.argmax(scores))  # 分数相同时取列表里靠前的
+        return self.options[best], float(min(1.0, scores[best]))
+
+
+@lru_cache(maxsize=256)
+def _matcher(options):
+    return FuzzyMatcher(options)
+
+
+def best_match(query, options):
+    """FuzzyMatcher(options).match(query), the matcher of a repeated option list is reused"""
+    return _matcher(tuple(options)).match(query)
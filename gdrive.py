@@ -0,0 +1,131 @@
+import re
+import html
+from urllib.parse import urlencode, urlparse, parse_qs
+
+from loguru import logger
+
+import retry
+import download_client
+
+
+DOWNLOAD_URL = 'https://drive.google.com/uc'
+
+# 确认页面和错误页面里的文字
+NOT_FOUND_MARKERS = ('does not exist', 'Not Found', 'file you have requested does not exist')
+PERMISSION_MARKERS = ('You need access', 'Request access', 'You need permission', 'ServiceLogin')
+QUOTA_MARKERS = ('Too many users have viewed or downloaded this file recently', 'download quota')
+
+
+class DriveError(Exception):
+    """Google Drive did not return the file, retrying may help (e.g. download quota exceeded)"""
+
+
+class DrivePermanentError(DriveError, retry.PermanentError):
+    """The file does not exist or is not shared, retrying will not help"""
+
+
+def is_drive_url(url):
+    host = urlparse(url).netloc.lower()
+    return host in ('drive.google.com', 'docs.google.com', 'drive.usercontent.google.com')
+
+
+def file_id(url):
+    """The Drive file id of a link: /file/d/<id>/view, uc?id=<id>, open?id=<id>"""
+    parsed = urlparse(url)
+    if match := re.search(r'/file/d/([0-9A-Za-z_-]+)', parsed.path):
+        return match.group(1)
+    ids = parse_qs(parsed.query).get('id')
+    return ids[0] if ids else None
+
+
+def download_url(url):
+    """The direct download link of a Drive link, other links are returned as they are"""
+    if not is_drive_url(url) or not (drive_id := file_id(url)):
+        return url
+    return f'{DOWNLOAD_URL}?{urlencode({"export": "download", "id": drive_id})}'
+
+
+def confirm_url(page, final_url='', drive_id=None):
+    """
+    Parse a Drive HTML response
+    :return: the url that skips the virus scan interstitial
+    :raise DrivePermanentError: the file does not exist or needs permission
+    :raise DriveError: any other page, e.g. the download quota is exceeded
+    """
+    text = page.decode('utf-8', errors='replace') if isinstance(page, bytes) else page
+
+    # 新的确认页面：<form id="download-form" action="..."> 和隐藏的 id/export/confirm/uuid
+    if form := re.search(r'<form[^>]*id="download-form"[^>]*action="([^"]+)"[^>]*>(.*?)</form>', text, re.S):
+        action = html.unescape(form.group(1))
+        inputs = re.findall(r'<input[^>]*type="hidden"[^>]*name="([^"]+)"[^>]*value="([^"]*)"', form.group(2))
+        return f'{action}?{urlencode({name: html.unescape(value) for name, value in inputs})}'
+
+    if 'accounts.google.com' in final_url or any(marker in text for marker in PERMISSION_MARKERS):
+        raise DrivePermanentError('Permission denied, the file is not shared')
+    if any(marker in text for marker in NOT_FOUND_MARKERS):
+        raise DrivePermanentError('File not found')
+    if any(marker in text for marker in QUOTA_MARKERS):
+        raise DriveError('Download quota exceeded')
+
+    # 旧的确认页面：链接里的 confirm=<token>
+    if match := re.search(r'confirm=([0-9A-Za-z_-]+)', text):
+        drive_id = drive_id or file_id(final_url)
+        if drive_id:
+            return f'{DOWNLOAD_URL}?{urlencode({"export": "download", "confirm": match.group(1), "id": drive_id})}'
+
+    raise DriveError('Unexpected Drive page')
+
+
+def _check_status(result):
+    if result.status == 404:
+        raise DrivePermanentError('File not found (HTTP 404)')
+    if result.status in (401, 403):
+        raise DrivePermanentError(f'Permission denied (HTTP {result.status})')
+    if result.status != 200:
+        raise DriveError(f'HTTP {result.status}')
+
+
+def fetch(url, path, image_min_size=(0, 0), client=None):
+    """
+    Download a Drive image to path, following the virus scan confirmation page.
+    Only image bytes are written, an HTML page is never saved as an image.
+    :raise DrivePermanentError: not worth retrying
+    """
+    client = client or download_client.get_client()
+    url = download_url(url)
+    drive_id = file_id(url)
+
+    for _ in range(2):  # 原链接，确认页面之后的链接
+        try:
+            result = client.fetch(url, path, image_min_size=image_min_size)
+            _check_status(result)
+            return result
+        except download_client.InvalidImage as e:
+            if not e.head.lstrip().startswith(b'<'):
+                raise
+            url = confirm_url(e.head, e.url, drive_id)
+            logger.debug(f'Following the Drive confirmation page: {url}')
+
+    raise DriveError('Drive kept returning the confirmation page')
+
+
+async def fetch_async(url, path, headers=None, timeout=download_client.TIMEOUT, image_min_size=(0, 0), client=None):
+    """fetch() for coroutines"""
+    client = client or download_client.get_client()
+    url = download_url(url)
+    drive_id = file_id(url)
+
+    for _ in range(2):
+        try:
+            result = await client.fetch_async(url, path, headers=headers, timeout=timeout, image_min_size=image_min_size)
+            if result.status == 304:
+                return result
+            _check_status(result)
+            return result
+        except download_client.InvalidImage as e:
+            if not e.head.lstrip().startswith(b'<'):
+                raise
+            url = confirm_url(e.head, e.url, drive_id)
+            logger.debug(f'Following the Drive confirmation page: {url}')
+
+    raise DriveError('Drive kept returning the confirmation page')
@@ -1,12 +1,22 @@
 import os
+import atexit
 import hashlib
 import asyncio
-import aiohttp
 import json
 import time
-from PIL import Image
+import uuid
+import dataclasses
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps
 from loguru import logger
-from functools import lru_cache
+
+import download_client
+import gdrive
+import retry
+import image_quality
 from typing import List, Dict, Optional
 from datetime import datetime, timedelta
 
@@ -17,113 +27,233 @@ class ImageConfig:
     MIN_HEIGHT = 800
     ALLOWED_FORMATS = ['jpg', 'jpeg', 'png']
     COMPRESSION_QUALITY = 85
+    MAX_DIMENSION = 3000  # 长边超过的图片缩小
+    WORKERS = os.cpu_count() or 1  # 图片处理的进程数
+    # 上传用的图片（image_variants），按目标大小查找 JPEG 质量
+    UPLOAD_MAX_DIMENSION = 2048
+    UPLOAD_TARGET_BYTES = 300_000
+    UPLOAD_MIN_QUALITY = 70
+    UPLOAD_MAX_QUALITY = 92
+    # 质量检查（image_quality），在 256 像素的灰度缩略图上计算；产品照片的清晰度最低约 120，模糊的照片低于 30
+    MIN_SHARPNESS = 40  # 拉普拉斯方差
+    MIN_CONTRAST = 6  # 亮度的标准差
+    MAX_HISTOGRAM_PEAK = 0.97  # 最多的亮度区间占的比例，空白、过曝的照片接近 1
+    MAX_BACKGROUND_FRACTION = 0.97  # 和背景颜色相同的像素比例，产品太小时接近 1
     MAX_RETRIES = 3
     TIMEOUT = 30  # seconds
     CHUNK_SIZE = 8192
     CACHE_DIR = "image_cache"
     DOWNLOAD_DIR = "download"
-    CACHE_METADATA_FILE = "cache_metadata.json"
+    CACHE_METADATA_FILE = "cache_metadata.json"  # 旧版本的元数据，会导入到 CACHE_DB_FILE
+    CACHE_DB_FILE = "cache.db"
+    CACHE_MAX_BYTES = 2 * 1024 ** 3  # 缓存总大小上限，超过后按 LRU 淘汰
+    FRONT_CACHE_SIZE = 256  # 内存里缓存的条目数
     CACHE_EXPIRY_DAYS = 7  # 缓存过期时间（天）
     CACHE_CLEANUP_INTERVAL = 24  # 清理间隔（小时）
 
 class ImageCache:
-    """图片缓存管理"""
+    """
+    图片缓存管理
+    元数据保存在 SQLite (WAL)，每次插入、访问、删除只更新一行
+    超过 CACHE_MAX_BYTES 时按最近访问时间淘汰 (LRU)，内存里的前置缓存每次都会确认文件还在、没有过期
+    """
     def __init__(self, cache_dir: str = ImageConfig.CACHE_DIR):
         self.cache_dir = cache_dir
-        self.metadata_file = os.path.join(cache_dir, ImageConfig.CACHE_METADATA_FILE)
-        self.metadata = self._load_metadata()
         os.makedirs(cache_dir, exist_ok=True)
-        
-    def _load_metadata(self) -> Dict:
-        """加载缓存元数据"""
-        if os.path.exists(self.metadata_file):
-            try:
-                with open(self.metadata_file, 'r') as f:
-                    return json.load(f)
-            except Exception as e:
-                logger.error(f"Failed to load cache metadata: {e}")
-        return {}
-    
-    def _save_metadata(self):
-        """保存缓存元数据"""
+        self.metadata_file = os.path.join(cache_dir, ImageConfig.CACHE_METADATA_FILE)  # 旧版本的元数据
+
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(cache_dir, ImageConfig.CACHE_DB_FILE),
+                                    isolation_level=None, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS entries (
+                cache_key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_time REAL NOT NULL,
+                last_access REAL NOT NULL,
+                etag TEXT NOT NULL DEFAULT '',
+                last_modified TEXT NOT NULL DEFAULT ''
+            );
+            CREATE INDEX IF NOT EXISTS idx_entries_access ON entries (last_access);
+        ''')
+        self._migrate()
+        self._import_metadata()
+
+        self.total_bytes = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        self._front = OrderedDict()  # cache_key -> (file_path, expiry_time)
+
+    def _migrate(self):
+        """Add the validator columns to a cache created by an older version"""
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(entries)')}
+        if 'etag' not in columns:
+            self.conn.execute("ALTER TABLE entries ADD COLUMN etag TEXT NOT NULL DEFAULT ''")
+        if 'last_modified' not in columns:
+            self.conn.execute("ALTER TABLE entries ADD COLUMN last_modified TEXT NOT NULL DEFAULT ''")
+
+    def _import_metadata(self):
+        """导入旧版本的 cache_metadata.json，只在第一次运行时进行"""
+        if not os.path.exists(self.metadata_file):
+            return
         try:
-            with open(self.metadata_file, 'w') as f:
-                json.dump(self.metadata, f)
+            with open(self.metadata_file, 'r') as f:
+                metadata = json.load(f)
+            rows = []
+            for cache_key, item in metadata.items():
+                file_path = item.get('file_path', '')
+                if file_path and os.path.exists(file_path):
+                    created_time = item.get('created_time', 0)
+                    rows.append((cache_key, item.get('url', ''), file_path, os.path.getsize(file_path), created_time, created_time))
+            with self._lock:
+                self.conn.executemany('INSERT OR IGNORE INTO entries (cache_key, url, file_path, size, created_time, last_access) '
+                                      'VALUES (?, ?, ?, ?, ?, ?)', rows)
+            os.remove(self.metadata_file)
+            logger.info(f"Imported {len(rows)} entries from the old cache metadata")
         except Exception as e:
-            logger.error(f"Failed to save cache metadata: {e}")
-    
+            logger.error(f"Failed to import cache metadata: {e}")
+
+    @staticmethod
+    def _expiry_time(created_time: float) -> float:
+        return created_time + ImageConfig.CACHE_EXPIRY_DAYS * 24 * 3600
+
     def get_cache_key(self, url: str) -> str:
         return hashlib.md5(url.encode()).hexdigest()
-    
-    @lru_cache(maxsize=100)
+
+    def _remember(self, cache_key: str, file_path: str, expiry_time: float):
+        self._front[cache_key] = (file_path, expiry_time)
+        self._front.move_to_end(cache_key)
+        while len(self._front) > ImageConfig.FRONT_CACHE_SIZE:
+            self._front.popitem(last=False)
+
     def get_cached_image(self, url: str) -> Optional[str]:
         cache_key = self.get_cache_key(url)
-        cache_path = os.path.join(self.cache_dir, f"{cache_key}.jpg")
-        
+
+        if cache_key in self._front:
+            cache_path, expiry_time = self._front[cache_key]
+        else:
+            with self._lock:
+                row = self.conn.execute('SELECT file_path, created_time FROM entries WHERE cache_key = ?', (cache_key,)).fetchone()
+            if not row:
+                return None
+            cache_path, expiry_time = row[0], self._expiry_time(row[1])
+
         # 检查文件是否存在且未过期
-        if os.path.exists(cache_path):
-            metadata = self.metadata.get(cache_key, {})
-            created_time = metadata.get('created_time', 0)
-            expiry_time = created_time + (ImageConfig.CACHE_EXPIRY_DAYS * 24 * 3600)
-            
-            if time.time() < expiry_time:
-                return cache_path
-            else:
-                # 文件已过期，删除它
+        if not os.path.exists(cache_path):
+            self.remove_cached_file(cache_key)
+            return None
+        if time.time() >= expiry_time:
+            # 已过期：有 ETag/Last-Modified 的保留下来，用条件请求确认 (get_revalidation_headers)，否则删除
+            self._front.pop(cache_key, None)
+            if not self.get_revalidation_headers(url):
                 self.remove_cached_file(cache_key)
-                
-        return None
+            return None
 
-    def save_to_cache(self, url: str, file_path: str) -> str:
+        self._remember(cache_key, cache_path, expiry_time)
+        with self._lock:
+            self.conn.execute('UPDATE entries SET last_access = ? WHERE cache_key = ?', (time.time(), cache_key))
+        return cache_path
+
+    def get_revalidation_headers(self, url: str) -> Dict[str, str]:
+        """If-None-Match / If-Modified-Since headers of a cached image, {} when there is nothing to revalidate"""
+        with self._lock:
+            row = self.conn.execute('SELECT file_path, etag, last_modified FROM entries WHERE cache_key = ?',
+                                    (self.get_cache_key(url),)).fetchone()
+        if not row or not os.path.exists(row[0]):
+            return {}
+
+        headers = {}
+        if row[1]:
+            headers['If-None-Match'] = row[1]
+        if row[2]:
+            headers['If-Modified-Since'] = row[2]
+        return headers
+
+    def refresh(self, url: str) -> Optional[str]:
+        """The server answered 304 Not Modified: the cached image is valid for another CACHE_EXPIRY_DAYS"""
+        cache_key = self.get_cache_key(url)
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute('UPDATE entries SET created_time = ?, last_access = ? WHERE cache_key = ? RETURNING file_path',
+                                    (now, now, cache_key)).fetchone()
+        if not row:
+            return None
+        self._remember(cache_key, row[0], self._expiry_time(now))
+        return row[0]
+
+    def save_to_cache(self, url: str, file_path: str, etag: str = '', last_modified: str = '') -> str:
         cache_key = self.get_cache_key(url)
         cache_path = os.path.join(self.cache_dir, f"{cache_key}.jpg")
         os.replace(file_path, cache_path)
-        
+
         # 更新元数据
-        self.metadata[cache_key] = {
-            'url': url,
-            'created_time': int(time.time()),
-            'file_path': cache_path
-        }
-        self._save_metadata()
-        
+        now = time.time()
+        size = os.path.getsize(cache_path)
+        with self._lock:
+            old = self.conn.execute('SELECT size FROM entries WHERE cache_key = ?', (cache_key,)).fetchone()
+            self.conn.execute('INSERT OR REPLACE INTO entries (cache_key, url, file_path, size, created_time, last_access, etag, last_modified) '
+                              'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                              (cache_key, url, cache_path, size, now, now, etag or '', last_modified or ''))
+            self.total_bytes += size - (old[0] if old else 0)
+        self._remember(cache_key, cache_path, self._expiry_time(now))
+
+        self.evict()
         return cache_path
 
     def remove_cached_file(self, cache_key: str):
         """删除缓存文件"""
         try:
-            cache_path = os.path.join(self.cache_dir, f"{cache_key}.jpg")
+            self._front.pop(cache_key, None)
+            with self._lock:
+                row = self.conn.execute('DELETE FROM entries WHERE cache_key = ? RETURNING file_path, size', (cache_key,)).fetchone()
+                if row:
+                    self.total_bytes -= row[1]
+            cache_path = row[0] if row else os.path.join(self.cache_dir, f"{cache_key}.jpg")
             if os.path.exists(cache_path):
                 os.remove(cache_path)
-            if cache_key in self.metadata:
-                del self.metadata[cache_key]
-                self._save_metadata()
         except Exception as e:
             logger.error(f"Failed to remove cached file: {e}")
 
+    def evict(self, max_bytes: int = None) -> int:
+        """按最近访问时间删除缓存，直到总大小不超过 max_bytes"""
+        max_bytes = ImageConfig.CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        evicted = 0
+        while self.total_bytes > max_bytes:
+            with self._lock:
+                rows = self.conn.execute('SELECT cache_key FROM entries ORDER BY last_access LIMIT 100').fetchall()
+            if not rows:
+                break
+            for (cache_key,) in rows:
+                if self.total_bytes <= max_bytes:
+                    break
+                self.remove_cached_file(cache_key)
+                evicted += 1
+
+        if evicted:
+            logger.info(f"Evicted {evicted} least recently used cache files, cache size {self.total_bytes/1024/1024:.2f}MB")
+        return evicted
+
     def cleanup_expired_cache(self, force: bool = False):
-        """清理过期的缓存文件"""
-        current_time = time.time()
-        cleaned_count = 0
-        total_size_freed = 0
-
-        for cache_key, metadata in list(self.metadata.items()):
-            created_time = metadata.get('created_time', 0)
-            expiry_time = created_time + (ImageConfig.CACHE_EXPIRY_DAYS * 24 * 3600)
-            
-            if force or current_time > expiry_time:
-                file_path = metadata.get('file_path')
-                if file_path and os.path.exists(file_path):
-                    size = os.path.getsize(file_path)
-                    os.remove(file_path)
-                    total_size_freed += size
-                    cleaned_count += 1
-                
-                del self.metadata[cache_key]
+        """
+        清理过期的缓存文件，force 时清理所有缓存
+        有 ETag/Last-Modified 的过期图片保留，下次使用时重新验证，由 LRU 淘汰
+        """
+        expired_before = time.time() - ImageConfig.CACHE_EXPIRY_DAYS * 24 * 3600
+        with self._lock:
+            if force:
+                rows = self.conn.execute('SELECT cache_key, size FROM entries').fetchall()
+            else:
+                rows = self.conn.execute("SELECT cache_key, size FROM entries WHERE created_time < ? AND etag = '' AND last_modified = ''",
+                                         (expired_before,)).fetchall()
 
-        if cleaned_count > 0:
-            self._save_metadata()
-            logger.info(f"Cleaned {cleaned_count} expired cache files, freed {total_size_freed/1024/1024:.2f}MB")
+        for cache_key, _ in rows:
+            self.remove_cached_file(cache_key)
+
+        if rows:
+            total_size_freed = sum(size for _, size in rows)
+            logger.info(f"Cleaned {len(rows)} expired cache files, freed {total_size_freed/1024/1024:.2f}MB")
 
     async def start_cleanup_task(self):
         """启动定期清理任务"""
@@ -151,6 +281,103 @@ class UploadProgressTracker:
         progress = (self.uploaded_files / self.total_files) * 100 if self.total_files > 0 else 0
         logger.info(f"Upload progress: {progress:.2f}% ({self.uploaded_files}/{self.total_files})")
 
+EXIF_ORIENTATION = 0x0112
+
+
+def quality_thresholds() -> Dict:
+    return {
+        'min_sharpness': ImageConfig.MIN_SHARPNESS,
+        'min_contrast': ImageConfig.MIN_CONTRAST,
+        'max_histogram_peak': ImageConfig.MAX_HISTOGRAM_PEAK,
+        'max_background': ImageConfig.MAX_BACKGROUND_FRACTION,
+    }
+
+
+def prepare_image(file_path: str) -> Dict:
+    """
+    验证、转正、缩小和重新编码一张图片，在进程池里运行
+    尺寸只读文件头，不需要解码；需要重新编码时 JPEG 用 draft 模式按 1/2、1/4、1/8 直接解码成较小的图片
+    :return: {'path', 'valid', 'width', 'height', 'error'}
+    """
+    result = {'path': file_path, 'valid': False, 'width': 0, 'height': 0, 'error': ''}
+    try:
+        with Image.open(file_path) as img:
+            image_format = (img.format or '').lower()
+            if image_format not in ('jpeg', 'png'):
+                result['error'] = f"Unsupported format: {image_format}"
+                return result
+
+            orientation = img.getexif().get(EXIF_ORIENTATION, 1)
+            width, height = img.size
+            if orientation in (5, 6, 7, 8):  # 旋转90度的图片，宽高互换
+                width, height = height, width
+
+            # 检查尺寸
+            if width < ImageConfig.MIN_WIDTH or height < ImageConfig.MIN_HEIGHT:
+                result['error'] = f"Image too small: {width}x{height}"
+                return result
+
+            # 空白、模糊、产品太小的照片不上传
+            quality = image_quality.assess(file_path, quality_thresholds())
+            if not quality['ok']:
+                result['error'] = f"Low quality: {', '.join(quality['reasons'])}"
+                return result
+
+            scale = min(1.0, ImageConfig.MAX_DIMENSION / max(width, height))
+            needs_encode = (scale < 1 or orientation != 1 or image_format != 'jpeg'
+                            or os.path.getsize(file_path) > ImageConfig.MAX_SIZE)
+
+            if needs_encode:
+                img.draft('RGB', (round(img.size[0] * scale), round(img.size[1] * scale)))
+                processed = ImageOps.exif_transpose(img)
+                if processed.mode != 'RGB':
+                    processed = processed.convert('RGB')
+                processed.thumbnail((ImageConfig.MAX_DIMENSION, ImageConfig.MAX_DIMENSION), Image.LANCZOS)
+                width, height = processed.size
+
+                tmp_path = f"{file_path}.{os.getpid()}.tmp"
+                processed.save(tmp_path, 'JPEG', quality=ImageConfig.COMPRESSION_QUALITY, optimize=True)
+
+        if needs_encode:
+            os.replace(tmp_path, file_path)
+
+        result.update(valid=True, width=width, height=height)
+    except Exception as e:
+        result['error'] = str(e)
+    return result
+
+
+def check_image(file_path: str, thresholds: Dict, digest: Optional[str] = None) -> Dict:
+    """
+    上传前的检查，在进程池里运行，不修改图片（image_store 里的文件按内容哈希保存）
+    尺寸只读文件头，和 prepare_image 一样；够大的图片再检查质量 (image_quality.assess)
+    :return: {'path', 'ok', 'reasons', 'scores'}
+    """
+    try:
+        with Image.open(file_path) as img:
+            width, height = img.size
+            if img.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8):
+                width, height = height, width
+    except Exception as e:
+        return {'path': file_path, 'ok': False, 'reasons': [f'not an image: {e}'], 'scores': {}}
+
+    if width < ImageConfig.MIN_WIDTH or height < ImageConfig.MIN_HEIGHT:
+        return {'path': file_path, 'ok': False, 'reasons': [f'too small: {width}x{height}'], 'scores': {}}
+    return image_quality.assess(file_path, thresholds, digest)
+
+
+_process_pool = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """整个运行共用的图片处理进程池"""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=ImageConfig.WORKERS)
+        atexit.register(_process_pool.shutdown)
+    return _process_pool
+
+
 class ImageProcessor:
     """图片处理器"""
     def __init__(self):
@@ -159,22 +386,52 @@ class ImageProcessor:
         
     def validate_and_process_image(self, file_path: str) -> bool:
         """验证和处理图片"""
-        try:
-            with Image.open(file_path) as img:
-                # 检查尺寸
-                if img.size[0] < ImageConfig.MIN_WIDTH or img.size[1] < ImageConfig.MIN_HEIGHT:
-                    logger.warning(f"Image too small: {file_path}")
-                    return False
-                
-                # 检查文件大小并压缩
-                if os.path.getsize(file_path) > ImageConfig.MAX_SIZE:
-                    logger.info(f"Compressing large image: {file_path}")
-                    img.save(file_path, quality=ImageConfig.COMPRESSION_QUALITY, optimize=True)
-                
-                return True
-        except Exception as e:
-            logger.error(f"Image validation failed for {file_path}: {e}")
-            return False
+        result = prepare_image(file_path)
+        if not result['valid']:
+            logger.warning(f"Image validation failed for {file_path}: {result['error']}")
+        return result['valid']
+
+    def prepare_images(self, file_paths: List[str]) -> List[Dict]:
+        """在进程池里并行处理一个产品的所有图片，结果和 file_paths 的顺序一致"""
+        if len(file_paths) <= 1 or ImageConfig.WORKERS <= 1:
+            results = [prepare_image(file_path) for file_path in file_paths]
+        else:
+            results = list(get_process_pool().map(prepare_image, file_paths))
+        self._log_results(results)
+        return results
+
+    def check_quality(self, file_paths: List[str], digests: Optional[List[str]] = None) -> List[Dict]:
+        """
+        在进程池里检查图片的尺寸和质量 (check_image)，不修改图片，结果和 file_paths 的顺序一致
+        digests: 已知的内容哈希（例如 image_store 的），没有时每张图片计算一次
+        """
+        thresholds = quality_thresholds()
+        digests = digests or [None] * len(file_paths)
+        if len(file_paths) <= 1 or ImageConfig.WORKERS <= 1:
+            results = [check_image(file_path, thresholds, digest) for file_path, digest in zip(file_paths, digests)]
+        else:
+            results = list(get_process_pool().map(check_image, file_paths, [thresholds] * len(file_paths), digests))
+        for result in results:
+            if not result['ok']:
+                logger.warning(f"Low quality image {result['path']}: {', '.join(result['reasons'])} {result['scores']}")
+        return results
+
+    async def prepare_images_async(self, file_paths: List[str]) -> List[Dict]:
+        """prepare_images 的异步版本，不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        if len(file_paths) <= 1 or ImageConfig.WORKERS <= 1:
+            results = [await loop.run_in_executor(None, prepare_image, file_path) for file_path in file_paths]
+        else:
+            pool = get_process_pool()
+            results = await asyncio.gather(*(loop.run_in_executor(pool, prepare_image, file_path) for file_path in file_paths))
+        self._log_results(results)
+        return list(results)
+
+    @staticmethod
+    def _log_results(results: List[Dict]):
+        for result in results:
+            if not result['valid']:
+                logger.warning(f"Image validation failed for {result['path']}: {result['error']}")
 
     async def retry_failed_operations(self):
         """重试失败的操作"""
@@ -204,43 +461,51 @@ class ImprovedImageHandler:
         self.progress = UploadProgressTracker()
         self.download_dir = ImageConfig.DOWNLOAD_DIR
         os.makedirs(self.download_dir, exist_ok=True)
+        self._validators: Dict[str, tuple] = {}  # 下载的文件 -> (ETag, Last-Modified)
+        self.retry_policy = dataclasses.replace(retry.DOWNLOAD_POLICY, attempts=ImageConfig.MAX_RETRIES)
         
-    async def download_single_image(self, session: aiohttp.ClientSession, url: str, index: int) -> Optional[str]:
+    async def download_single_image(self, url: str, index: int) -> Optional[str]:
         """下载单个图片"""
         # 首先检查缓存
         if cached_path := self.cache.get_cached_image(url):
             logger.debug(f"Using cached image for {url}")
             return cached_path
-            
-        for retry in range(ImageConfig.MAX_RETRIES):
-            try:
-                file_path = os.path.join(self.download_dir, f"image_{index}.jpg")
-                
-                async with session.get(url, timeout=ImageConfig.TIMEOUT) as response:
-                    if response.status != 200:
-                        raise Exception(f"HTTP {response.status}")
-                        
-                    with open(file_path, 'wb') as f:
-                        async for chunk in response.content.iter_chunked(ImageConfig.CHUNK_SIZE):
-                            f.write(chunk)
-                            
-                # 验证和处理图片
-                if not self.processor.validate_and_process_image(file_path):
-                    raise Exception("Image validation failed")
-                    
-                # 保存到缓存
-                cached_path = self.cache.save_to_cache(url, file_path)
-                logger.success(f"Successfully downloaded and processed {url}")
-                return cached_path
-                
-            except Exception as e:
-                logger.warning(f"Download attempt {retry + 1} failed for {url}: {e}")
-                if retry == ImageConfig.MAX_RETRIES - 1:
-                    self.processor.failed_downloads.append(url)
-                    logger.error(f"Failed to download {url} after {ImageConfig.MAX_RETRIES} attempts")
-                await asyncio.sleep(1)  # 失败后等待1秒再重试
-                
-        return None
+
+        # 过期的缓存用条件请求确认，图片没有变化 (304) 时不需要重新下载
+        revalidation_headers = self.cache.get_revalidation_headers(url)
+
+        async def fetch_once():
+            # 每次下载用唯一的文件名，同时准备多个产品也不会互相覆盖
+            file_path = os.path.join(self.download_dir, f"image_{index}_{uuid.uuid4().hex}.jpg")
+
+            # 整个运行共用的下载客户端，连接和 DNS 在产品之间复用
+            # 响应头或者开头的字节显示不是图片、尺寸太小时，不会下载剩下的内容
+            # Google Drive 链接会处理确认页面
+            fetch = gdrive.fetch_async if gdrive.is_drive_url(url) else download_client.get_client().fetch_async
+            response = await fetch(
+                url, file_path, headers=revalidation_headers or None, timeout=ImageConfig.TIMEOUT,
+                image_min_size=(ImageConfig.MIN_WIDTH, ImageConfig.MIN_HEIGHT))
+            if response.status == 304 and revalidation_headers:
+                logger.debug(f"Cached image not modified, refreshed: {url}")
+                return self.cache.refresh(url)
+            if response.status != 200:
+                raise retry.HTTPStatusError(response.status, url)
+
+            self._validators[file_path] = (response.headers.get('ETag', ''), response.headers.get('Last-Modified', ''))
+            return file_path
+
+        try:
+            # 指数退避重试，永久错误（不是图片、没有权限、404）不重试，同一主机连续失败后直接失败
+            file_path = await retry.call_async(fetch_once, policy=self.retry_policy, breaker=retry.breaker_for(url),
+                                               name=f'Download {url}')
+        except Exception as e:
+            self.processor.failed_downloads.append(url)
+            logger.error(f"Failed to download {url}: {e}")
+            return None
+
+        # 验证和处理在 download_images_async 里对所有新下载的图片一起进行
+        logger.success(f"Successfully downloaded {url}")
+        return file_path
 
     async def download_images_async(self, product_data: Dict) -> List[str]:
         """异步下载所有图片"""
@@ -257,21 +522,37 @@ class ImprovedImageHandler:
         self.progress.total_files = len(image_urls)
         downloaded_images = []
 
-        async with aiohttp.ClientSession() as session:
-            tasks = []
-            for url, index in image_urls:
-                task = asyncio.create_task(self.download_single_image(session, url, index))
-                tasks.append(task)
+        tasks = []
+        for url, index in image_urls:
+            task = asyncio.create_task(self.download_single_image(url, index))
+            tasks.append(task)
 
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            for result, (url, _) in zip(results, image_urls):
-                if isinstance(result, str):  # 成功下载的图片路径
-                    downloaded_images.append(result)
-                    self.progress.update_progress(True)
-                else:  # 下载失败
-                    logger.error(f"Failed to download {url}: {result}")
-                    self.progress.update_progress(False)
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        # 新下载的图片在进程池里并行验证和处理，每张图片只处理一次；缓存里的图片已经处理过
+        fresh = [(url, path) for path, (url, _) in zip(results, image_urls)
+                 if isinstance(path, str) and os.path.dirname(path) == self.download_dir]
+        prepared = await self.processor.prepare_images_async([path for _, path in fresh])
+        prepared_paths = {}
+        for (url, path), result in zip(fresh, prepared):
+            if result['valid']:
+                etag, last_modified = self._validators.pop(path, ('', ''))
+                prepared_paths[path] = self.cache.save_to_cache(url, path, etag, last_modified)  # 保存到缓存
+            else:
+                self.processor.failed_downloads.append(url)
+                if os.path.exists(path):
+                    os.remove(path)
+                prepared_paths[path] = None
+
+        for result, (url, _) in zip(results, image_urls):
+            if isinstance(result, str):
+                result = prepared_paths.get(result, result)
+            if isinstance(result, str):  # 成功下载的图片路径
+                downloaded_images.append(result)
+                self.progress.update_progress(True)
+            else:  # 下载或验证失败
+                logger.error(f"Failed to download {url}: {result}")
+                self.progress.update_progress(False)
 
         if not downloaded_images:
             logger.error("No images were successfully downloaded")
@@ -289,13 +570,13 @@ class ImprovedImageHandler:
             if not downloaded_images:
                 raise Exception("No images were successfully downloaded")
 
-            # 验证所有下载的图片
+            # 下载时已经验证过，这里只确认文件还在
             valid_images = []
             for img_path in downloaded_images:
-                if os.path.exists(img_path) and self.processor.validate_and_process_image(img_path):
+                if os.path.exists(img_path):
                     valid_images.append(img_path)
                 else:
-                    logger.warning(f"Skipping invalid image: {img_path}")
+                    logger.warning(f"Skipping missing image: {img_path}")
 
             if not valid_images:
                 raise Exception("No valid images after processing")
@@ -323,8 +604,9 @@ class ImprovedImageHandler:
                     except Exception as e:
                         logger.error(f"Failed to remove file {file_path}: {e}")
             
-            # 强制清理过期缓存
-            self.cache.cleanup_expired_cache(force=True)
+            # 只清理过期的缓存，其他缓存留给后面的产品和下次运行
+            self.cache.cleanup_expired_cache()
+            self.cache.evict()
             
         except Exception as e:
             logger.error(f"Cleanup error: {e}") 
\ No newline at end of file
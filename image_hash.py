@@ -0,0 +1,101 @@
+import numpy as np
+from PIL import Image
+
+
+# 16x16 = 256 位：同款包装、同样背景的不同产品照片，64 位的哈希分不开
+HASH_SIZE = 16
+DCT_SIZE = 64
+DUPLICATE_DISTANCE = 10  # 汉明距离不超过这个值的两张图片算作相同（256 位里）；重新保存、缩小的副本通常是 0
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT = _dct_matrix(DCT_SIZE)
+
+
+def phash(path):
+    """
+    Perceptual hash of an image (DCT of the 64x64 grayscale thumbnail, 16x16 low frequencies compared to their median)
+    Resaved, resized or slightly recompressed copies of a photo get the same or a close hash
+    :return: 256-bit int
+    """
+    with Image.open(path) as img:
+        img.draft('L', (DCT_SIZE * 2, DCT_SIZE * 2))  # JPEG 直接按 1/2 ~ 1/8 解码
+        pixels = np.asarray(img.convert('L').resize((DCT_SIZE, DCT_SIZE), Image.LANCZOS), dtype=np.float64)
+
+    low = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    median = np.median(low.flatten()[1:])  # 不算直流分量
+    bits = (low > median).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def to_hex(value):
+    return f'{value:0{HASH_SIZE * HASH_SIZE // 4}x}'
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """BK-tree of hashes, finds every item within a Hamming distance without comparing against all of them"""
+
+    def __init__(self):
+        self.root = None  # [hash, [items], {distance: child}]
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            if distance not in node[2]:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = node[2][distance]
+
+    def query(self, value, radius):
+        """:return: [(distance, item), ...] of every item within radius"""
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                found.extend((distance, item) for item in node[1])
+            for child_distance, child in node[2].items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return found
+
+
+def unique_images(paths, hash_of, radius=DUPLICATE_DISTANCE):
+    """
+    Drop the near-duplicate photos of a product, the first of each group is kept
+    :param hash_of: function path -> hash, None when the image can not be hashed (kept as it is)
+    :return: (kept paths, [(dropped path, kept path it duplicates)])
+    """
+    tree = BKTree()
+    kept, dropped = [], []
+    for path in paths:
+        value = hash_of(path)
+        if value is not None and (matches := tree.query(value, radius)):
+            dropped.append((path, min(matches, key=lambda match: match[0])[1]))
+            continue
+        if value is not None:
+            tree.add(value, path)
+        kept.append(path)
+    return kept, dropped
@@ -0,0 +1,194 @@
+import os
+import re
+import json
+
+from loguru import logger
+
+import image_hash
+
+
+PRODUCTS_DIR = 'products'
+INDEX_FILE = os.path.join('image_cache', 'image_index.json')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg')
+
+
+def natural_key(name):
+    """'_2' sorts before '_10'"""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', name)]
+
+
+def ref_of_filename(filename):
+    """
+    The External reference of a product photo, the file names are '<External reference>_<n>.jpg'
+    :return: the reference, or None when the file is not an image
+    """
+    stem, ext = os.path.splitext(filename)
+    if ext.lower() not in IMAGE_EXTENSIONS:
+        return None
+
+    ref, _, number = stem.rpartition('_')
+    if ref and number.isdigit():
+        return ref.strip()
+    return stem.strip()
+
+
+class ImageIndex:
+    """
+    products 文件夹的图片索引：External reference（完全匹配）-> 按自然顺序排列的图片路径
+    索引保存在 image_cache/image_index.json，products 文件夹的修改时间变化（增加、删除、改名文件）后自动重建
+    每张图片的感知哈希 (pHash) 也保存在索引里，只在文件变化时重新计算
+    """
+
+    def __init__(self, folder=PRODUCTS_DIR, index_file=INDEX_FILE):
+        self.folder = os.path.abspath(folder)
+        self.index_file = index_file
+        self.mtime_ns = None
+        self.refs = {}  # External reference -> [file name, ...]
+        self.hashes = {}  # file name -> [size, mtime_ns, pHash hex]
+        self._hashes_changed = False
+        self._load()
+
+    def _folder_mtime(self):
+        try:
+            return os.stat(self.folder).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('folder') == self.folder:
+                self.hashes = data.get('hashes', {})  # 文件没变的哈希在重建后还能用
+            if data.get('folder') == self.folder and data.get('mtime_ns') == self._folder_mtime():
+                self.mtime_ns = data['mtime_ns']
+                self.refs = data['refs']
+                return
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f'Failed to load the image index, rebuild it: {e}')
+
+        self.rebuild()
+
+    def rebuild(self):
+        """Scan the products folder once and save the index"""
+        mtime_ns = self._folder_mtime()
+        refs = {}
+
+        if mtime_ns is not None:
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    if not entry.is_file():
+                        continue
+                    if ref := ref_of_filename(entry.name):
+                        refs.setdefault(ref, []).append(entry.name)
+
+        for names in refs.values():
+            names.sort(key=natural_key)
+
+        self.mtime_ns = mtime_ns
+        self.refs = refs
+        names = {name for names in refs.values() for name in names}
+        self.hashes = {name: value for name, value in self.hashes.items() if name in names}
+        self._save()
+        logger.debug(f'Indexed the images of {len(refs)} products in {self.folder}')
+
+    def _save(self):
+        try:
+            if os.path.dirname(self.index_file):
+                os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+            tmp_file = f'{self.index_file}.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({'folder': self.folder, 'mtime_ns': self.mtime_ns, 'refs': self.refs, 'hashes': self.hashes},
+                          f, ensure_ascii=False)
+            os.replace(tmp_file, self.index_file)
+            self._hashes_changed = False
+        except Exception as e:
+            logger.error(f'Failed to save the image index: {e}')
+
+    def lookup(self, ref):
+        """
+        The image paths of a product, naturally sorted
+        Only a stat of the products folder and a dict lookup, the folder is scanned again only when it changed
+        """
+        if self._folder_mtime() != self.mtime_ns:
+            self.rebuild()
+
+        return [os.path.join(self.folder, name) for name in self.refs.get(str(ref).strip(), [])]
+
+    def hash_of(self, path):
+        """
+        Perceptual hash of an image, cached in the index for the photos of the products folder
+        :return: int, None when the image can not be read
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        name = os.path.basename(path) if os.path.dirname(os.path.abspath(path)) == self.folder else None
+        cached = self.hashes.get(name) if name else None
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return int(cached[2], 16)
+
+        try:
+            value = image_hash.phash(path)
+        except Exception as e:
+            logger.warning(f'Failed to hash image {path}: {e}')
+            return None
+
+        if name:
+            self.hashes[name] = [stat.st_size, stat.st_mtime_ns, image_hash.to_hex(value)]
+            self._hashes_changed = True
+        return value
+
+    def save_hashes(self):
+        if self._hashes_changed:
+            self._save()
+
+    def unique_images(self, paths, radius=image_hash.DUPLICATE_DISTANCE):
+        """The photos of a product without the near-duplicates, in the same order"""
+        kept, dropped = image_hash.unique_images(paths, self.hash_of, radius)
+        self.save_hashes()
+        for path, original in dropped:
+            logger.warning(f'Skip duplicate photo {os.path.basename(path)}, same as {os.path.basename(original)}')
+        return kept
+
+    def collisions(self, radius=image_hash.DUPLICATE_DISTANCE):
+        """
+        Photos that look the same but are filed under different External references, e.g. a misfiled photo
+        :return: {External reference: ['A_2.jpg looks like B_1.jpg', ...]}
+        """
+        if self._folder_mtime() != self.mtime_ns:
+            self.rebuild()
+
+        entries = []
+        tree = image_hash.BKTree()
+        for ref, names in self.refs.items():
+            for name in names:
+                value = self.hash_of(os.path.join(self.folder, name))
+                if value is not None:
+                    entries.append((value, ref, name))
+                    tree.add(value, (ref, name))
+        self.save_hashes()
+
+        collisions = {}
+        for value, ref, name in entries:
+            for _, (other_ref, other_name) in tree.query(value, radius):
+                if other_ref != ref:
+                    collisions.setdefault(ref, []).append(f'{name} looks like {other_name}')
+
+        logger.info(f'Hashed {len(entries)} photos, {len(collisions)} products share photos with another product')
+        return collisions
+
+
+_index = None
+
+
+def get_index():
+    """The image index of the products folder, shared by the whole run"""
+    global _index
+    if _index is None:
+        _index = ImageIndex()
+    return _index
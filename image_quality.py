@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+import numpy as np
+from PIL import Image
+
+import image_store
+
+
+QUALITY_DB = os.path.join('image_cache', 'quality.db')
+SCORE_VERSION = 1  # 评分方法变化时加一，旧的分数不再使用
+
+THUMBNAIL_SIZE = 256
+BACKGROUND_TOLERANCE = 12  # 和边缘颜色相差不超过这个值的像素算作背景
+
+
+def score_image(path):
+    """
+    Score a photo on its grayscale thumbnail (JPEG draft decoding, no full-size decode):
+    - sharpness: variance of the Laplacian, low for blurred photos
+    - contrast: standard deviation of the luminance, histogram_peak: share of the fullest of 32 bins, both for blank photos
+    - background: share of the pixels close to the border colour, high when the subject is tiny
+    """
+    with Image.open(path) as img:
+        img.draft('L', (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        img = img.convert('L')
+        img.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        pixels = np.asarray(img, dtype=np.float32)
+
+    laplacian = (4 * pixels[1:-1, 1:-1] - pixels[:-2, 1:-1] - pixels[2:, 1:-1]
+                 - pixels[1:-1, :-2] - pixels[1:-1, 2:])
+    histogram = np.bincount((pixels // 8).astype(np.int64).ravel(), minlength=32) / pixels.size
+    border = np.concatenate([pixels[0], pixels[-1], pixels[:, 0], pixels[:, -1]])
+    background = np.abs(pixels - np.median(border)) <= BACKGROUND_TOLERANCE
+
+    return {
+        'sharpness': round(float(laplacian.var()), 2),
+        'contrast': round(float(pixels.std()), 2),
+        'histogram_peak': round(float(histogram.max()), 4),
+        'background': round(float(background.mean()), 4),
+    }
+
+
+def verdict(scores, thresholds):
+    """:return: list of the reasons the photo is rejected, [] when it is fine"""
+    reasons = []
+    if scores['contrast'] < thresholds['min_contrast']:
+        reasons.append('blank')
+    elif scores['histogram_peak'] > thresholds['max_histogram_peak']:
+        reasons.append('nearly uniform')
+    if scores['background'] > thresholds['max_background']:
+        reasons.append('subject too small')
+    # 大部分是背景时拉普拉斯方差也很低，只有其他检查都通过时才算模糊
+    if not reasons and scores['sharpness'] < thresholds['min_sharpness']:
+        reasons.append('blurred')
+    return reasons
+
+
+_conn = None
+_conn_pid = None
+_lock = threading.Lock()  # 异步处理时 prepare_image 也会在线程池里运行
+
+
+def _connect():
+    """One connection per process, the scores are shared by all the image workers"""
+    global _conn, _conn_pid
+    if _conn is None or _conn_pid != os.getpid():
+        os.makedirs(os.path.dirname(QUALITY_DB), exist_ok=True)
+        _conn = sqlite3.connect(QUALITY_DB, isolation_level=None, timeout=30, check_same_thread=False)
+        _conn.execute('PRAGMA journal_mode=WAL')
+        _conn.execute('''
+            CREATE TABLE IF NOT EXISTS scores (
+                digest TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                scores TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (digest, version)
+            )
+        ''')
+        _conn_pid = os.getpid()
+    return _conn
+
+
+def assess(path, thresholds, digest=None):
+    """
+    Quality verdict of a photo, run in the image worker pool.
+    The scores are cached by content hash, each photo is scored once whatever its name or folder;
+    the thresholds are applied on every call so changing them does not need a rescore.
+    :param digest: content hash of the photo when the caller knows it, e.g. from the image store
+    :return: {'path', 'ok', 'reasons', 'scores'}
+    """
+    result = {'path': path, 'ok': True, 'reasons': [], 'scores': {}}
+    try:
+        digest = digest or image_store.file_digest(path)
+        with _lock:
+            row = _connect().execute('SELECT scores FROM scores WHERE digest = ? AND version = ?',
+                                     (digest, SCORE_VERSION)).fetchone()
+        if row:
+            scores = json.loads(row[0])
+        else:
+            scores = score_image(path)
+            with _lock:
+                _connect().execute('INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?)', (digest, SCORE_VERSION, json.dumps(scores), time.time()))
+    except Exception as e:
+        result['reasons'] = [f'quality check failed: {e}']  # 检查失败时不拦截照片
+        return result
+
+    result['scores'] = scores
+    result['reasons'] = verdict(scores, thresholds)
+    result['ok'] = not result['reasons']
+    return result
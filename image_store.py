@@ -0,0 +1,192 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+
+from loguru import logger
+
+
+STORE_DIR = os.path.join('image_cache', 'store')
+
+# 上传前的暂存目录，可以用环境变量指到 tmpfs（例如 /dev/shm/vc_download）
+STAGING_DIR = os.getenv('VC_STAGING_DIR', 'download')
+
+FICLONE = 0x40049409  # Linux ioctl, btrfs/xfs 等文件系统的 reflink
+
+
+def file_digest(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _reflink(src, dst):
+    if sys.platform != 'linux':
+        raise OSError('reflink is only supported on Linux')
+
+    import fcntl
+    try:
+        with open(src, 'rb') as s, open(dst, 'wb') as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        raise
+
+
+def link_or_copy(src, dst, hard_link=True):
+    """
+    Put src at dst without copying the data when possible: hard link, then reflink, then a normal copy.
+    dst is replaced atomically.
+    :param hard_link: False for files the user may edit in place (e.g. products/), a hard link would change dst too
+    :return: 'link', 'reflink' or 'copy'
+    """
+    tmp_dst = f'{dst}.tmp'
+    if os.path.lexists(tmp_dst):
+        os.remove(tmp_dst)
+
+    try:
+        if not hard_link:
+            raise OSError('no hard link')
+        os.link(src, tmp_dst)
+        method = 'link'
+    except OSError:
+        try:
+            _reflink(src, tmp_dst)
+            method = 'reflink'
+        except OSError:
+            shutil.copyfile(src, tmp_dst)
+            method = 'copy'
+
+    os.replace(tmp_dst, dst)
+    return method
+
+
+class ImageStore:
+    """
+    按内容哈希 (sha256) 保存图片的存储
+    objects/<前两位>/<digest>.jpg 是原图，variants/ 是处理过的图片（按原图哈希和处理参数保存，跨运行复用）
+    上传前用硬链接把图片放到暂存目录，不再每个产品复制一次整张图片
+    用户的原图 (products/) 用 reflink 或者复制放进来，不用硬链接：原图被修改时 store 里的文件会跟着变，和哈希对不上
+    """
+
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.variants_dir = os.path.join(root, 'variants')
+        self.incoming_dir = os.path.join(root, 'incoming')  # 下载中的图片
+        for folder in (self.objects_dir, self.variants_dir, self.incoming_dir):
+            os.makedirs(folder, exist_ok=True)
+
+        # 文件路径 -> [size, mtime_ns, digest]，文件没变就不用重新计算哈希
+        self.digests_file = os.path.join(root, 'digests.json')
+        self.digests = self._load_digests()
+        self._digests_changed = False
+
+    def _load_digests(self):
+        try:
+            with open(self.digests_file, 'r', encoding='utf-8') as f:
+                digests = json.load(f)
+            # 下载中的图片放进 store 后就不在了，旧版本保存的记录去掉
+            incoming = os.path.abspath(self.incoming_dir) + os.sep
+            return {path: entry for path, entry in digests.items() if not path.startswith(incoming)}
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f'Failed to load the image digests: {e}')
+            return {}
+
+    def save_digests(self):
+        if not self._digests_changed:
+            return
+        try:
+            tmp_file = f'{self.digests_file}.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.digests, f, ensure_ascii=False)
+            os.replace(tmp_file, self.digests_file)
+            self._digests_changed = False
+        except Exception as e:
+            logger.error(f'Failed to save the image digests: {e}')
+
+    def digest(self, path):
+        """Content hash of a file, cached by path, size and mtime"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+
+        cached = self.digests.get(path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+
+        digest = file_digest(path)
+        self.digests[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        self._digests_changed = True
+        return digest
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], f'{digest}.jpg')
+
+    def variant_path(self, digest, params_key):
+        """Where the processed variant of an image is stored, params_key identifies the processing parameters"""
+        return os.path.join(self.variants_dir, digest[:2], f'{digest}_{params_key}.jpg')
+
+    def put(self, path, move=False):
+        """
+        Add a file to the store, files with the same content are stored once
+        :param move: move the file into the store (for downloaded files in incoming/) instead of copying it
+        :return: (digest, object path)
+        """
+        # 下载的文件马上就不在原来的路径了，它的哈希不记录
+        digest = file_digest(path) if move else self.digest(path)
+        object_path = self.object_path(digest)
+
+        if os.path.exists(object_path):
+            if move:
+                os.remove(path)
+            elif os.path.samefile(path, object_path):
+                # 旧版本用硬链接放进来的原图，换成独立的文件
+                link_or_copy(path, object_path, hard_link=False)
+            return digest, object_path
+
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        if move:
+            os.replace(path, object_path)
+        else:
+            link_or_copy(path, object_path, hard_link=False)
+
+        return digest, object_path
+
+    def stage(self, paths, staging_dir=STAGING_DIR):
+        """
+        Put the images into the staging directory as 1.jpg ... N.jpg, hard linked to the store when possible
+        :return: the absolute paths of the staged images
+        """
+        os.makedirs(staging_dir, exist_ok=True)
+        staged = []
+        methods = {}
+
+        for i, path in enumerate(paths, 1):
+            dst_path = os.path.abspath(os.path.join(staging_dir, f'{i}.jpg'))
+            try:
+                method = link_or_copy(path, dst_path)
+                methods[method] = methods.get(method, 0) + 1
+                staged.append(dst_path)
+            except Exception as e:
+                logger.error(f'Failed to stage image {path}: {e}')
+
+        self.save_digests()
+        logger.debug(f'Staged {len(staged)} images in {staging_dir}: {methods}')
+        return staged
+
+
+_store = None
+
+
+def get_store():
+    """The image store shared by the whole run"""
+    global _store
+    if _store is None:
+        _store = ImageStore()
+    return _store
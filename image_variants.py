@@ -0,0 +1,105 @@
+import os
+import json
+import hashlib
+from io import BytesIO
+
+from PIL import Image, ImageOps
+from loguru import logger
+
+import image_store
+from image_handler import ImageConfig, get_process_pool
+
+
+VARIANT_VERSION = 2  # 生成方式变化时加一，旧的变体不再使用
+
+
+def upload_params():
+    return {
+        'version': VARIANT_VERSION,
+        'max_dimension': ImageConfig.UPLOAD_MAX_DIMENSION,
+        'target_bytes': ImageConfig.UPLOAD_TARGET_BYTES,
+        'min_quality': ImageConfig.UPLOAD_MIN_QUALITY,
+        'max_quality': ImageConfig.UPLOAD_MAX_QUALITY,
+    }
+
+
+def params_key(params):
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def _encode(img, quality, icc_profile):
+    buffer = BytesIO()
+    # 不传 exif，EXIF 信息被去掉；保留 ICC 颜色配置
+    img.save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True, icc_profile=icc_profile)
+    return buffer.getvalue()
+
+
+def make_variant(source_path, variant_path, params):
+    """
+    生成上传用的图片：缩小到 max_dimension，去掉 EXIF，渐进式 + 优化 Huffman 表
+    二分查找不超过 target_bytes 的最高质量（不低于 min_quality）
+    在进程池里运行
+    :return: variant_path
+    """
+    max_dimension = params['max_dimension']
+
+    with Image.open(source_path) as img:
+        icc_profile = img.info.get('icc_profile')
+
+        scale = min(1.0, max_dimension / max(img.size))
+        img.draft('RGB', (round(img.size[0] * scale), round(img.size[1] * scale)))
+        variant = ImageOps.exif_transpose(img)
+        if variant.mode != 'RGB':
+            variant = variant.convert('RGB')
+        variant.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    low, high = params['min_quality'], params['max_quality']
+    best = _encode(variant, low, icc_profile)
+    while low <= high:
+        quality = (low + high) // 2
+        data = _encode(variant, quality, icc_profile)
+        if len(data) <= params['target_bytes']:
+            best = data
+            low = quality + 1
+        else:
+            high = quality - 1
+
+    # 原图更小时也用重新编码的结果，原图带着 EXIF（位置、相机）而且不是渐进式的
+    os.makedirs(os.path.dirname(variant_path), exist_ok=True)
+    tmp_path = f'{variant_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(best)
+    os.replace(tmp_path, variant_path)
+    return variant_path
+
+
+def upload_variants(paths, store=None, params=None):
+    """
+    The upload variants of the images, in the same order.
+    Variants are cached in the image store by (source hash, parameters), only the missing ones are generated, in parallel.
+    An image whose variant fails is uploaded as it is.
+    """
+    store = store or image_store.get_store()
+    params = params or upload_params()
+    key = params_key(params)
+
+    variants = []
+    missing = []  # (position, source, variant path)
+    for i, path in enumerate(paths):
+        variant_path = store.variant_path(store.digest(path), key)
+        variants.append(variant_path)
+        if not os.path.exists(variant_path):
+            missing.append((i, path, variant_path))
+
+    if missing:
+        pool = get_process_pool()
+        futures = [(i, path, pool.submit(make_variant, path, variant_path, params)) for i, path, variant_path in missing]
+        for i, path, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                logger.warning(f'Failed to make the upload variant of {path}, upload the original: {e}')
+                variants[i] = path
+
+    logger.debug(f'Upload variants: {len(paths) - len(missing)} cached, {len(missing)} generated')
+    return variants
@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import atexit
+import asyncio
+import threading
+import dataclasses
+from typing import NamedTuple, Optional
+
+import openai
+from openai import AsyncOpenAI
+from loguru import logger
+
+import retry
+import fuzzy_match
+
+
+LLM_BASE_URL = os.getenv('OPENAI_BASE_URL') or None  # 任何 OpenAI 兼容的服务，例如离线测试用的本地服务
+LLM_MODEL = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
+LLM_DEADLINE = float(os.getenv('LLM_DEADLINE', '8'))  # seconds, 一次匹配最多等这么久，包括排队和重试
+# 批量请求每个值最多输出 40 个 token，期限按值的数量增加
+LLM_BATCH_SECONDS_PER_VALUE = float(os.getenv('LLM_BATCH_SECONDS_PER_VALUE', '1.5'))
+MAX_CONCURRENT_LLM_REQUESTS = 4
+
+# 重试的等待和次数都在期限之内
+LLM_POLICY = retry.RetryPolicy(attempts=3, base_delay=0.5, max_delay=2)
+
+SYSTEM_PROMPT = 'You are a helpful assistant that matches names to predefined options.'
+
+
+def match_prompt(org_name, names, prompt1='', prompt2=''):
+    return f"""Given the original name '{org_name}', find the best match from these options: {', '.join(names)}.
+        Consider the context and return the most appropriate option.
+        {prompt1}
+        {prompt2}
+        Return only the exact name from the options list, nothing else."""
+
+
+def batch_prompt(field, candidates):
+    items = [{'value': value, 'options': options} for value, options in candidates.items()]
+    return f"""For each item, choose the option that best matches the value of the '{field}' field of a luxury second-hand product.
+    Items: {json.dumps(items, ensure_ascii=False)}
+    Return only a JSON object mapping each value to the exact name of the chosen option, nothing else."""
+
+
+def parse_json(text):
+    """The JSON of an answer, also when the model wraps it in a ```json code fence or adds a sentence around it"""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        start, end = text.find('{'), text.rfind('}')
+        if 0 <= start < end:
+            return json.loads(text[start:end + 1])
+        raise
+
+
+class Decision(NamedTuple):
+    name: Optional[str]
+    degraded: bool  # AI 没有在期限内给出有效的答案，name 是本地模糊匹配的结果
+    error: str = ''
+    elapsed: float = 0.0  # seconds
+
+
+class LLMClient:
+    """
+    整个运行共用的 AI 匹配客户端
+    AsyncOpenAI 在后台线程的事件循环里运行，同步代码 (smart) 也可以调用；同时进行的请求数有上限
+    每次匹配有期限（包括排队和重试），超过期限时返回本地模糊匹配的结果并记录为降级，一次 AI 调用卡住不会拖住浏览器
+    """
+
+    def __init__(self, api_key=None, base_url=LLM_BASE_URL, model=LLM_MODEL, deadline=LLM_DEADLINE,
+                 max_concurrent=MAX_CONCURRENT_LLM_REQUESTS, policy=LLM_POLICY,
+                 batch_seconds_per_value=LLM_BATCH_SECONDS_PER_VALUE):
+        self.model = model
+        self.deadline = deadline
+        self.batch_seconds_per_value = batch_seconds_per_value
+        self.policy = policy
+        self.calls = 0
+        self.degraded = []  # [{'value', 'name', 'error'}, ...]
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='llm-client', daemon=True)
+        self._thread.start()
+
+        self._max_concurrent = max_concurrent
+        self._client, self._semaphore = self._run(self._open(api_key or os.getenv('OPENAI_API_KEY'), base_url))
+
+    async def _open(self, api_key, base_url):
+        # 自己控制重试，超时在每个请求里按期限设置
+        client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        return client, asyncio.Semaphore(self._max_concurrent)
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _in_loop(self, coro):
+        """Run a coroutine of this client from any event loop"""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._loop))
+
+    def batch_deadline(self, size):
+        """The deadline of a batch request of size values"""
+        return self.deadline + self.batch_seconds_per_value * size
+
+    async def _complete(self, prompt, max_tokens, deadline=None, **kwargs):
+        """
+        One completion within deadline (self.deadline by default), including queueing and retries.
+        A single request times out after half of the deadline, so a retry still fits.
+        kwargs are passed to chat.completions.create, e.g. response_format.
+        """
+        deadline = deadline or self.deadline
+        policy = dataclasses.replace(self.policy, budget=deadline)
+
+        async def once():
+            async with self._semaphore:
+                self.calls += 1
+                try:
+                    response = await self._client.chat.completions.create(
+                        model=self.model,
+                        messages=[
+                            {'role': 'system', 'content': SYSTEM_PROMPT},
+                            {'role': 'user', 'content': prompt}
+                        ],
+                        temperature=0.3,
+                        max_tokens=max_tokens,
+                        timeout=deadline / 2,
+                        **kwargs
+                    )
+                except openai.APIStatusError as e:
+                    raise retry.HTTPStatusError(e.status_code) from e  # 4xx（除了 429 等）不重试
+            return response.choices[0].message.content.strip()
+
+        return await asyncio.wait_for(retry.call_async(once, policy=policy, name='LLM request'), deadline)
+
+    async def _choose(self, org_name, names, prompt1, prompt2):
+        started = time.monotonic()
+        try:
+            answer = await self._complete(match_prompt(org_name, names, prompt1, prompt2), 50)
+            if answer in names:
+                return Decision(answer, False, elapsed=time.monotonic() - started)
+            error = f'invalid answer: {answer}'
+        except asyncio.TimeoutError:
+            error = f'no answer within {self.deadline}s'
+        except Exception as e:
+            error = str(e) or type(e).__name__
+
+        # 降级：本地模糊匹配的最佳选项，分数太低时用 Other
+        name, confidence = fuzzy_match.best_match(org_name, names)
+        if confidence < fuzzy_match.FALLBACK_THRESHOLD and 'Other' in names:
+            name = 'Other'
+        self.degraded.append({'value': org_name, 'name': name, 'error': error})
+        logger.warning(f'AI match of {org_name} degraded to {name} ({confidence:.2f}): {error}')
+        return Decision(name, True, error, time.monotonic() - started)
+
+    async def choose(self, org_name, names, prompt1='', prompt2='') -> Decision:
+        """The best option for org_name, from the AI or, when it fails or misses the deadline, from the fuzzy matcher"""
+        return await self._in_loop(self._choose(org_name, names, prompt1, prompt2))
+
+    def choose_sync(self, org_name, names, prompt1='', prompt2='') -> Decision:
+        return self._run(self._choose(org_name, names, prompt1, prompt2))
+
+    async def _choose_batch(self, field, candidates):
+        deadline = self.batch_deadline(len(candidates))
+        try:
+            answer = await self._complete(batch_prompt(field, candidates), 40 * len(candidates) + 20, deadline,
+                                          response_format={'type': 'json_object'})
+            result = parse_json(answer)
+        except asyncio.TimeoutError:
+            logger.warning(f'No AI answer for {len(candidates)} {field} values within {deadline:.1f}s')
+            return {}
+        except Exception as e:
+            logger.error(f'Error using the AI for {len(candidates)} {field} values: {e}')
+            return {}
+
+        if not isinstance(result, dict):
+            logger.warning(f'AI returned invalid result for {field}: {result}')
+            return {}
+        return {value: option for value, option in result.items() if option in candidates.get(value, ())}
+
+    async def choose_batch(self, field, candidates):
+        """
+        The best options of many values of the same field in one request
+        :param candidates: {value: [option, ...]}
+        :return: {value: option}, only the valid answers, {} when the AI failed or missed the deadline
+        """
+        return await self._in_loop(self._choose_batch(field, candidates))
+
+    def choose_batch_sync(self, field, candidates):
+        return self._run(self._choose_batch(field, candidates))
+
+    def stats(self):
+        return {'calls': self.calls, 'degraded': len(self.degraded)}
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+        try:
+            self._run(self._client.close())
+        except Exception as e:
+            logger.debug(f'Failed to close the LLM client: {e}')
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> LLMClient:
+    """The LLM client shared by the whole run"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient()
+            atexit.register(_client.close)
+        return _client
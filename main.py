@@ -1,5 +1,12 @@
 import table
 import vestiaire
+import page_state
+import preflight
+import odoo_manifest
+import image_index
+import decision_cache
+import pre_resolve
+import llm_client
 import traceback
 import os
 import json
@@ -7,6 +14,8 @@ from dotenv import load_dotenv
 import socket
 
 from plugin import init_chrome
+from work_queue import WorkQueue
+from result_sink import ResultSink
 from datetime import datetime
 from loguru import logger
 
@@ -19,19 +28,6 @@ import time
 # 加载环境变量
 load_dotenv()
 
-# 添加日志文件配置
-log_file = f'logs/vestiaire_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log'
-os.makedirs('logs', exist_ok=True)
-logger.add(log_file, rotation="500 MB", level="DEBUG")
-
-# 从环境变量获取凭据
-user = os.getenv('VESTIAIRE_USER')
-password = os.getenv('VESTIAIRE_PASSWORD')
-
-if not user or not password:
-    logger.error('请在.env文件中设置VESTIAIRE_USER和VESTIAIRE_PASSWORD')
-    exit(1)
-
 def get_chrome_profiles():
     """获取Chrome配置文件列表"""
     profiles = []
@@ -69,7 +65,22 @@ def is_port_in_use(port):
             return True
 
 # Press the green button in the gutter to run the script.
+# 图片进程池在 macOS/Windows 上用 spawn 启动，每个子进程都会重新导入本模块，
+# 所以日志文件和凭据只在主进程里设置
 if __name__ == '__main__':
+    # 添加日志文件配置
+    log_file = f'logs/vestiaire_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log'
+    os.makedirs('logs', exist_ok=True)
+    logger.add(log_file, rotation="500 MB", level="DEBUG")
+
+    # 从环境变量获取凭据
+    user = os.getenv('VESTIAIRE_USER')
+    password = os.getenv('VESTIAIRE_PASSWORD')
+
+    if not user or not password:
+        logger.error('请在.env文件中设置VESTIAIRE_USER和VESTIAIRE_PASSWORD')
+        exit(1)
+
     excel_file = 'Vestiaire Collective Product Information.xlsx'
     launch_date = datetime.now().strftime('%Y-%m-%d %H_%M_%S')  # use current time as the launch date for Excel name
 
@@ -117,18 +128,44 @@ if __name__ == '__main__':
 
     logger.info(f"选择的Chrome配置文件: {selected_profile}")
 
-    # If there are files in the queue folder, the bot will continue from the first file in the queue folder
-    # Else the bot will split the excel file into Json files and save them in the queue folder
+    # If the excel file is there, only its new or changed rows are pushed to the queue (unchanged rows are skipped)
+    # Then the bot goes on from the first pending product in the queue
     try:
-        if table.get_queue():
-            queue_files = table.get_queue()
-            logger.info(f'Init: Queue has not finished yet, bot will go on from queue/{queue_files[0]}')
-        else:
-            logger.info(f'Init: Queue folder is empty, split the {excel_file} to queue folder')
+        work_queue = WorkQueue()
+        work_queue.recover()  # products left in progress by a crashed run go back to pending
+
+        if os.path.exists(excel_file):
+            logger.info(f'Init: push the new and changed rows of {excel_file} to the queue')
+
+            # Stream the rows straight into the queue, the workbook is never fully loaded in memory
+            # Rows that can not succeed in the browser are dropped by the pre-flight check and listed in the report
+            # with their Excel row numbers
+            rows = table.iter_excel_rows(excel_file, row_numbers=True)
 
-            excel_data = table.excel_to_list_of_dicts(excel_file)
+            # Photos that look the same under different References (e.g. misfiled) are flagged in the report
+            photo_collisions = image_index.get_index().collisions() if os.path.isdir('products') else {}
+            rows = preflight.validate_rows(rows, f'result/Preflight_{launch_date}.csv', warnings=photo_collisions)
+
+            # Add the image URLs of the Odoo export in products/ to the rows, looked up by External reference
+            if manifest := odoo_manifest.load_manifest():
+                rows = manifest.merge(rows)
+
+            table.dicts_to_queue(rows, work_queue)
             os.rename(excel_file, f'{excel_file.split(".")[0]} - {launch_date} - Pushed_To_Queue.xlsx')  # Mark the original Excel file as Pushed_to_queue
-            queue_files = table.dicts_to_queue(excel_data)
+
+        result_sink = ResultSink(launch_date)  # results are exported to result/Result_<launch date>.csv/xlsx at the end
+
+        if work_queue.has_pending():
+            logger.info(f'Init: bot will go on from row {work_queue.next_pending_index()}')
+        else:
+            raise Exception(f'Queue is empty and there is no new or changed row in {excel_file}')
+
+        # Resolve the distinct Brand/Category/Material/Color... values of the queue before the browser starts,
+        # the values the option catalog can not resolve are sent to the AI in batches
+        try:
+            pre_resolve.pre_resolve(work_queue.iter_pending())
+        except Exception as e:
+            logger.warning(f'Failed to pre-resolve the option values, they are matched on the page: {e}')
     except Exception as e:
         logger.critical(f'Failed to load the Excel file: {e}')
         exit(1)
@@ -287,47 +324,92 @@ if __name__ == '__main__':
                 raise Exception("无法点击'Sell an item'按钮")
         
         # 处理队列中的商品数据
-        for queue_file in queue_files:
-            index, row = table.load_json_data(queue_file)
+        while item := work_queue.claim():
+            item_id, index, row = item
             logger.info(f"处理第 {index} 条数据")
             logger.debug(f"数据内容: {row}")
 
             reason = ''
+            interrupted = False
 
             try:
-                vestiaire.goto_the_position(tab, type=row['Gender'], cat=row['Category'], brand=row['Brand'])
-                tab.wait(3)
+                finished_steps, draft_url = work_queue.get_checkpoint(item_id)
+
+                # A crashed run already created the draft, continue it instead of starting over
+                if draft_url:
+                    try:
+                        vestiaire.resume_draft(tab, draft_url, finished_steps)
+                        logger.info(f'Resume the draft {draft_url} from step {finished_steps + 1}')
+                    except Exception as e:
+                        logger.warning(f'Can not resume the draft, start over: {e}')
+                        draft_url = ''
+                        finished_steps = 0
 
-                vestiaire.submit_step1_details(tab, row)
-                tab.wait(3)
+                if not draft_url:
+                    vestiaire.goto_the_position(tab, type=row['Gender'], cat=row['Category'], brand=row['Brand'])
+                    work_queue.save_checkpoint(item_id, 0, tab.url)
+                    tab.wait(3)
 
-                vestiaire.submit_step2_photos(tab, row)
-                tab.wait(3)
+                steps = [
+                    (vestiaire.submit_step1_details, (tab, row)),
+                    (vestiaire.submit_step2_photos, (tab, row)),
+                    (vestiaire.submit_step3_description, (tab, row)),
+                    (vestiaire.submit_step4_address, (tab,)),
+                    (vestiaire.submit_step5_price, (tab, row)),
+                ]
 
-                vestiaire.submit_step3_description(tab, row)
-                tab.wait(3)
+                for step, (submit_step, args) in enumerate(steps, start=1):
+                    if step <= finished_steps:
+                        continue
 
-                vestiaire.submit_step4_address(tab)
-                tab.wait(3)
+                    # Some steps report failure by returning False instead of raising
+                    if submit_step(*args) is False:
+                        raise Exception(f'{submit_step.__name__} failed')
+
+                    work_queue.save_checkpoint(item_id, step, tab.url)
+                    if step < len(steps):
+                        tab.wait(3)
 
-                vestiaire.submit_step5_price(tab, row)
-                
             except Exception as e:
                 traceback.print_exc()
                 reason = traceback.format_exc()
                 logger.error(f'处理失败: {e}')
+                logger.debug(f'页面状态: {page_state.probe(tab)}')
+            except BaseException:
+                interrupted = True
+                raise
             finally:
-                table.save_result_to_excel(tab, launch_date, row, index, reason)
-                os.remove(f'queue/{queue_file}')
-                tab.wait(5)
-                logger.info('----------------------------------------')
+                if interrupted:
+                    # Ctrl-C: the product is neither done nor failed, it goes back to the queue with its checkpoint
+                    # and the next run continues the same draft
+                    work_queue.release(item_id)
+                    logger.warning(f'Interrupted, row {index} goes back to the queue')
+                else:
+                    table.save_result_to_excel(tab, launch_date, row, index, reason, result_sink)
+                    if reason:
+                        work_queue.fail(item_id, reason)  # the draft is kept, pushing the row again continues it
+                    else:
+                        work_queue.complete(item_id)
+                    tab.wait(5)
+                    logger.info('----------------------------------------')
 
         logger.success('所有产品处理完成')
+        logger.info(f'Option decisions: {decision_cache.get_cache().stats()}')
+        if os.getenv('OPENAI_API_KEY'):
+            logger.info(f'AI requests: {llm_client.get_client().stats()}')
             
     except Exception as e:
         logger.error(f"程序执行出错: {str(e)}")
         logger.exception("详细错误信息:")
     finally:
+        # 导出本次运行的结果
+        try:
+            result_sink.close()
+            result_sink.export('csv')
+            result_sink.export('xlsx')
+        except Exception as e:
+            logger.error(f"导出结果时出错: {str(e)}")
+
         # 清理资源
         try:
             input("测试完成，按回车键关闭浏览器...")
@@ -0,0 +1,150 @@
+import os
+import csv
+import json
+
+from loguru import logger
+
+
+ODOO_DIR = 'products'
+DETAILED_IMAGES_FILE = 'detailed_images.csv'
+ODOO_JSON_FILE = 'odoo_import.json'
+ODOO_CSV_FILE = 'odoo_import.csv'
+
+REF_COLUMN = 'External reference'
+MAX_IMAGES = 15  # 和 pics.save_all_pics 一样，最多15张图片
+
+
+def _split_urls(value, separator):
+    return [url.strip() for url in str(value or '').split(separator) if url.strip()]
+
+
+class OdooManifest:
+    """
+    Odoo 导出清单（products/ 下的 detailed_images.csv、odoo_import.json、odoo_import.csv）的索引
+    三个文件只在创建时各读取一次，按 产品编号 (= External reference) 建立字典，每个产品的查询都是 O(1)
+    """
+
+    def __init__(self, folder=ODOO_DIR):
+        self.folder = folder
+        self.products = {}  # External reference -> {'main_image': url, 'images': [url, ...], 'image_count': n}
+
+        # 按信息的详细程度依次读取，前面的文件已有的产品不会被后面的覆盖
+        self._load_detailed_images()
+        self._load_json()
+        self._load_csv()
+
+        logger.info(f'Loaded the Odoo manifests of {len(self.products)} products from {folder}')
+
+    def _path(self, filename):
+        return os.path.join(self.folder, filename)
+
+    def _add(self, ref, images, main_image='', image_count=None):
+        ref = str(ref).strip()
+        if not ref or ref in self.products or not images:
+            return
+
+        # 主图放在第一张
+        if main_image and main_image in images:
+            images = [main_image] + [url for url in images if url != main_image]
+        elif main_image:
+            images = [main_image] + images
+
+        self.products[ref] = {
+            'main_image': images[0],
+            'images': images,
+            'image_count': int(image_count) if image_count else len(images),
+        }
+
+    def _load_detailed_images(self):
+        path = self._path(DETAILED_IMAGES_FILE)
+        if not os.path.exists(path):
+            return
+
+        grouped = {}  # ref -> [(序号, url, 是否主图)]
+        with open(path, newline='', encoding='utf-8-sig') as csvfile:
+            for row in csv.DictReader(csvfile):
+                ref = row.get('产品编号', '').strip()
+                url = row.get('CDN_URL', '').strip()
+                if not ref or not url:
+                    continue
+                try:
+                    number = int(row.get('图片序号') or 0)
+                except ValueError:
+                    number = 0
+                grouped.setdefault(ref, []).append((number, url, row.get('是否主图', '').strip() == '是'))
+
+        for ref, images in grouped.items():
+            images.sort(key=lambda image: image[0])
+            main_image = next((url for _, url, is_main in images if is_main), '')
+            self._add(ref, [url for _, url, _ in images], main_image)
+
+    def _load_json(self):
+        path = self._path(ODOO_JSON_FILE)
+        if not os.path.exists(path):
+            return
+
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+
+        for ref, info in data.items():
+            main_image = info.get('main_image_url', '')
+            images = _split_urls(info.get('spaces_image_urls'), '\n') or _split_urls(info.get('gallery_image_urls'), '\n')
+            self._add(ref, images, main_image, info.get('image_count'))
+
+    def _load_csv(self):
+        path = self._path(ODOO_CSV_FILE)
+        if not os.path.exists(path):
+            return
+
+        with open(path, newline='', encoding='utf-8-sig') as csvfile:
+            for row in csv.DictReader(csvfile):
+                main_image = row.get('主图URL', '').strip()
+                images = _split_urls(row.get('所有图片URLs'), ' | ') or _split_urls(row.get('展示图片URLs'), ' | ')
+                self._add(row.get('产品编号', ''), images, main_image, row.get('图片数量'))
+
+    def __contains__(self, ref):
+        return str(ref).strip() in self.products
+
+    def __len__(self):
+        return len(self.products)
+
+    def get(self, ref):
+        return self.products.get(str(ref).strip())
+
+    def image_fields(self, ref):
+        """The manifest images of a product as the workbook columns 'Image 1' ... 'Image N'"""
+        product = self.get(ref)
+        if not product:
+            return {}
+        return {f'Image {i}': url for i, url in enumerate(product['images'][:MAX_IMAGES], start=1)}
+
+    def merge(self, rows):
+        """
+        Merge the manifest images into the workbook rows, rows can be any iterable and is consumed lazily.
+        The workbook wins: rows that already have image URLs are left as they are.
+        """
+        matched = 0
+        for row in rows:
+            has_images = any(str(value).strip() for key, value in row.items() if key.startswith('Image '))
+            images = self.image_fields(row.get(REF_COLUMN, ''))
+
+            if images and not has_images:
+                row = {**row, **images}
+                matched += 1
+
+            yield row
+
+        logger.info(f'Added the Odoo manifest images to {matched} products')
+
+
+def load_manifest(folder=ODOO_DIR):
+    """The manifest of the folder, or None when there is no Odoo export in it"""
+    if not any(os.path.exists(os.path.join(folder, name)) for name in (DETAILED_IMAGES_FILE, ODOO_JSON_FILE, ODOO_CSV_FILE)):
+        return None
+    return OdooManifest(folder)
+
+
+if __name__ == '__main__':
+    manifest = OdooManifest()
+    for ref, product in list(manifest.products.items())[:3]:
+        print(ref, product['image_count'], product['main_image'])
@@ -0,0 +1,226 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+from loguru import logger
+
+import fuzzy_match
+from decision_cache import normalize_name
+
+
+CATALOG_DB = 'match_cache/catalog.db'
+CATALOG_VERSION = 1  # 保存格式或者网站的表单变化时加一，旧的选项不再使用
+
+NO_RESULTS = 'No Results Found'
+CATCH_ALL = ('Other', 'Others')
+
+
+# 表单字段的名字，分类、子分类的选项和上一级的选择有关
+def category_field(gender):
+    return f'category/{gender}'
+
+
+def subcategory_field(category):
+    return f'subcategory/{normalize_name(category)}'
+
+
+def product_fields(product):
+    """
+    The (field, value) pairs the browser will choose for a product, in the same way as vestiaire does
+    :return: [(field, value), ...]
+    """
+    fields = [
+        (category_field(product.get('Gender', '')), product.get('Category', '')),
+        ('brand', product.get('Brand', '')),
+        (subcategory_field(product.get('Category', '')), product.get('Details - Category') or product.get('Category', '')),
+        ('material', product.get('Material')),
+        ('color', product.get('Color')),
+        ('pattern', product.get('Pattern')),
+    ]
+    if str(product.get('Category', '')).lower() in ('watches', 'watch'):
+        fields += [('material_watch_strap', product.get('Bracelet')), ('watch_mechanism', product.get('Mechanism'))]
+    # 空的值在页面上选 Other
+    return [(field, str(value).strip() if value else 'Other') for field, value in fields]
+
+
+class OptionCatalog:
+    """
+    每个表单字段见过的选项 (SQLite, WAL)，浏览器每次读到下拉列表时记录下来
+    自动补全的列表只显示和输入相关的结果，所以选项是累加的；有新选项时字段的版本加一
+    另外保存 值 -> 选项 的匹配结果，下次同样的值可以直接输入、点击选项，不需要读列表再匹配
+    批量 AI 只看到了部分选项，它的答案另外保存为提示 (hints)，要在页面的列表里确认后才使用
+    """
+
+    def __init__(self, path=CATALOG_DB, version=CATALOG_VERSION):
+        self.path = path
+        self.version = version
+        self._options = {}  # field -> [option, ...]
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, isolation_level=None, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS options (
+                field TEXT NOT NULL,
+                option TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                PRIMARY KEY (field, option, version)
+            );
+            CREATE TABLE IF NOT EXISTS fields (
+                field TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                field_version INTEGER NOT NULL,
+                options_hash TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (field, version)
+            );
+            CREATE TABLE IF NOT EXISTS answers (
+                field TEXT NOT NULL,
+                value TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                option TEXT NOT NULL,
+                source TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (field, value, version)
+            );
+            CREATE TABLE IF NOT EXISTS hints (
+                field TEXT NOT NULL,
+                value TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                option TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (field, value, version)
+            );
+        ''')
+
+    def options(self, field):
+        """The options seen for a field, in the order they were first seen"""
+        with self._lock:
+            if field not in self._options:
+                self._options[field] = [row[0] for row in self.conn.execute(
+                    'SELECT option FROM options WHERE field = ? AND version = ? ORDER BY first_seen, rowid',
+                    (field, self.version))]
+            return self._options[field]
+
+    def field_version(self, field):
+        """Incremented every time new options are seen for the field, 0 when it was never seen"""
+        row = self.conn.execute('SELECT field_version FROM fields WHERE field = ? AND version = ?', (field, self.version)).fetchone()
+        return row[0] if row else 0
+
+    def record(self, field, names):
+        """
+        Record the options listed on the page for a field
+        :return: number of new options
+        """
+        names = [' '.join(name.split()) for name in names if name.strip() and name.strip() != NO_RESULTS]
+        if not field or not names:
+            return 0
+
+        known = set(self.options(field))
+        new = list(dict.fromkeys(name for name in names if name not in known))
+        now = time.time()
+        with self._lock:
+            self.conn.execute('BEGIN')
+            try:
+                self.conn.executemany('UPDATE options SET last_seen = ? WHERE field = ? AND option = ? AND version = ?',
+                                      [(now, field, name, self.version) for name in names if name in known])
+                if new:
+                    self.conn.executemany('INSERT INTO options VALUES (?, ?, ?, ?, ?)',
+                                          [(field, name, self.version, now + i * 1e-6, now) for i, name in enumerate(new)])
+                    options = self._options[field] + new
+                    options_hash = hashlib.sha1('\n'.join(sorted(options)).encode('utf-8')).hexdigest()
+                    self.conn.execute('''
+                        INSERT INTO fields VALUES (?, ?, 1, ?, ?)
+                        ON CONFLICT (field, version) DO UPDATE SET
+                            field_version = field_version + 1, options_hash = excluded.options_hash, updated_at = excluded.updated_at
+                    ''', (field, self.version, options_hash, now))
+                    self._options[field] = options
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+
+        if new:
+            logger.debug(f'{len(new)} new options for {field}: {new[:10]}')
+        return len(new)
+
+    def remember(self, field, value, option, source):
+        """Save the option chosen for a value, e.g. after matching the list on the page"""
+        if not field or not option or option == NO_RESULTS:
+            return
+        with self._lock:
+            self.conn.execute('INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)',
+                              (field, normalize_name(value), self.version, option, source, time.time()))
+
+    def remember_hint(self, field, value, option):
+        """
+        Save an option suggested without the full list (pre_resolve), resolve() does not return it
+        Other / Others are not saved: picked from part of the options they are usually wrong
+        """
+        if not field or not option or option == NO_RESULTS or option in CATCH_ALL:
+            return False
+        with self._lock:
+            self.conn.execute('INSERT OR REPLACE INTO hints VALUES (?, ?, ?, ?, ?)',
+                              (field, normalize_name(value), self.version, option, time.time()))
+        return True
+
+    def hint(self, field, value):
+        """The suggested option of a value, to be checked against the list on the page before choosing it"""
+        row = self.conn.execute('SELECT option FROM hints WHERE field = ? AND value = ? AND version = ?',
+                                (field, normalize_name(value), self.version)).fetchone()
+        return row[0] if row else None
+
+    def resolve(self, field, value):
+        """
+        The option to choose for a value, without reading the page: a saved answer, an exact match
+        or a confident fuzzy match among the options seen for the field
+        :return: the option, None when it needs the list on the page (or the AI)
+        """
+        options = self.options(field)
+        if not options:
+            return None
+
+        row = self.conn.execute('SELECT option FROM answers WHERE field = ? AND value = ? AND version = ?',
+                                (field, normalize_name(value), self.version)).fetchone()
+        if row and row[0] in options:
+            return row[0]
+
+        folded = fuzzy_match.fold(value)
+        for option in options:
+            if fuzzy_match.fold(option) == folded:
+                return option
+
+        option, confidence = fuzzy_match.best_match(value, options)
+        if confidence >= fuzzy_match.MATCH_THRESHOLD:
+            return option
+        return None
+
+    def resolve_product(self, product):
+        """
+        Resolve all the values of a product before the browser gets to the form
+        :return: {field: option} of the values that could be resolved
+        """
+        answers = {}
+        for field, value in product_fields(product):
+            if option := self.resolve(field, value):
+                answers[field] = option
+        return answers
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> OptionCatalog:
+    """The option catalog shared by the whole run"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = OptionCatalog()
+        return _catalog
@@ -0,0 +1,86 @@
+from loguru import logger
+
+
+# 一次注入脚本，只返回页面的关键状态，避免通过 CDP 传输整个 tab.html
+PROBE_JS = '''
+const visible = (el) => !!(el && (el.offsetWidth || el.offsetHeight || el.getClientRects().length));
+
+// 左侧步骤菜单里已完成步骤的图标
+const completed = document.querySelectorAll('[class*="AsideMenu_aside__menu__li__item__icon--desktop"]').length;
+
+// 当前显示的表单步骤，按每一步特有的元素判断，0 为选择类别的页面
+const markers = [
+    [5, 'input#priceField, input[data-cy="pvpInput"]'],
+    [4, 'input[name="selectedAddress"]'],
+    [3, 'input[name="serial_number"], textarea[class*="TextArea_textarea"]'],
+    [2, 'input#newPic0, [class*="PhotoBulkUpload_photoArea"]'],
+    [1, 'input#external_reference, input#subcategory, div[data-component-id="material"]'],
+    [0, '#preductAddCategory, input[data-role="search"]'],
+];
+let step = null;
+for (const [number, selector] of markers) {
+    if (Array.from(document.querySelectorAll(selector)).some(visible)) {
+        step = number;
+        break;
+    }
+}
+
+// 草稿里已经上传好的照片（不算正在上传的）
+const photos = document.querySelectorAll(
+    '[class*="PhotoBulkUpload_photoArea"] img[src]:not([alt="upload in progress"])'
+).length;
+
+// 可见的错误提示
+const errors = [];
+for (const el of document.querySelectorAll('[class*="error"], [class*="alert"], [role="alert"]')) {
+    const text = (el.innerText || '').trim();
+    if (text && visible(el) && !errors.includes(text)) {
+        errors.push(text.slice(0, 200));
+        if (errors.length >= 5) break;
+    }
+}
+
+// Continue / Complete steps 按钮状态
+const button = Array.from(document.querySelectorAll('button')).find(
+    (el) => ['Continue', 'Complete steps'].includes((el.innerText || '').trim()) && visible(el)
+);
+
+return {
+    url: location.href,
+    title: document.title,
+    ready_state: document.readyState,
+    completed_steps: completed,
+    step: step,
+    photos: photos,
+    errors: errors,
+    continue_button: button ? (button.disabled ? 'disabled' : 'enabled') : 'missing',
+};
+'''
+
+
+def probe(tab):
+    """
+    Get a compact state of the current page with one injected script
+    :return: dict with url, title, ready_state, completed_steps, step, photos, errors and continue_button
+    """
+    try:
+        state = tab.run_js(PROBE_JS)
+        if isinstance(state, dict):
+            return state
+        raise Exception(f'unexpected probe result: {state}')
+    except Exception as e:
+        logger.debug(f'Page state probe failed: {e}')
+        try:
+            url = tab.url
+        except Exception:
+            url = ''
+        return {
+            'url': url,
+            'title': '',
+            'ready_state': '',
+            'completed_steps': 0,
+            'step': None,
+            'photos': 0,
+            'errors': [],
+            'continue_button': 'missing',
+        }
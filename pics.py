@@ -1,11 +1,16 @@
-import requests
 import os
-import time
-import shutil
 
-from io import BytesIO
+from urllib.parse import unquote, urlparse
 from loguru import logger
 
+import image_index
+import image_handler
+import download_client
+import gdrive
+import retry
+import image_store
+import image_variants
+
 
 def convert_gdrive_link(url):
     """Convert Google Drive link from view to download"""
@@ -14,17 +19,40 @@ def convert_gdrive_link(url):
     return url
 
 
+def _image_urls(product_data):
+    """The 'Image 1' ... 'Image 17' URLs of the product, e.g. merged from the Odoo manifest"""
+    urls = []
+    for i in range(1, 18):
+        url = product_data.get(f'Image {i}')
+        if url and isinstance(url, str) and url.strip():
+            urls.append(url.strip())
+    return urls
+
+
+def _local_file_of_url(products_path, url):
+    """The products folder file with the same name as the URL (the Odoo CDN keeps the file names)"""
+    filename = unquote(os.path.basename(urlparse(url).path))
+    file_path = os.path.join(products_path, filename)
+    if filename.lower().endswith('.jpg') and os.path.isfile(file_path):
+        return file_path
+    return None
+
+
 def save_all_pics(product_data):
     """
-    从本地products文件夹获取图片并复制到download文件夹
+    从本地products文件夹获取图片，通过硬链接放到暂存文件夹（默认 download，可指到 tmpfs）
+    如果产品有图片链接（例如 Odoo 清单），按链接的顺序取图，本地已有同名文件时直接使用，否则下载
+    图片先放进按内容哈希保存的 image_store，同样的图片只保存一份
     :param product_data: 产品字典
     :return: 本地图片保存的绝对地址
     """
 
-    # empty the download folder
-    clear_jpg_files('download')
+    store = image_store.get_store()
+    staging_dir = image_store.STAGING_DIR
+
+    # empty the staging folder
+    clear_jpg_files(staging_dir)
 
-    abs_path = os.path.abspath('download')
     products_path = os.path.abspath('products')
 
     saved_pic_paths = []
@@ -35,44 +63,52 @@ def save_all_pics(product_data):
         logger.error("No External reference found in product data")
         return saved_pic_paths
 
+    image_urls = _image_urls(product_data)
+    source_paths = []
+
+    if image_urls:
+        for i, url in enumerate(image_urls[:15], 1):  # 最多15张图片
+            if src_path := _local_file_of_url(products_path, url):
+                source_paths.append(src_path)
+            elif downloaded := save_pic(convert_gdrive_link(url), i, store.incoming_dir):
+                # 下载的图片移动到 store 里
+                source_paths.append(store.put(os.path.join(store.incoming_dir, downloaded), move=True)[1])
+
     # 查找匹配的图片文件
-    if os.path.exists(products_path):
-        # 获取所有匹配的图片文件
-        matching_files = []
-        for filename in os.listdir(products_path):
-            if filename.startswith(external_ref) and filename.lower().endswith('.jpg'):
-                matching_files.append(filename)
-        
-        # 按文件名排序，确保顺序一致
-        matching_files.sort()
-        
-        # 复制图片到download文件夹
-        for i, filename in enumerate(matching_files, 1):
-            if i > 15:  # 最多15张图片
-                break
-                
-            src_path = os.path.join(products_path, filename)
-            dst_filename = f'{i}.jpg'
-            dst_path = os.path.join('download', dst_filename)
-            
-            try:
-                # 确保输出目录存在
-                os.makedirs('download', exist_ok=True)
-                
-                # 复制文件
-                shutil.copy2(src_path, dst_path)
-                
-                pic_abs_path = os.path.join(abs_path, dst_filename)
-                saved_pic_paths.append(pic_abs_path)
-                
-                logger.debug(f'Copied image from {src_path} to {dst_path}')
-                
-            except Exception as e:
-                logger.error(f'Failed to copy image {filename}: {str(e)}')
-                continue
-    
+    elif os.path.exists(products_path):
+        # 从图片索引获取 External reference 完全匹配的图片，已按自然顺序排序（_2 在 _10 前面）
+        source_paths = image_index.get_index().lookup(external_ref)[:15]  # 最多15张图片
+
     else:
         logger.error(f"Products folder not found: {products_path}")
+
+    # 去掉同一个产品里相同或几乎相同的照片（感知哈希）
+    source_paths = image_index.get_index().unique_images(source_paths)
+
+    digests = []
+    for src_path in source_paths:
+        try:
+            digest, object_path = store.put(src_path)
+            saved_pic_paths.append(object_path)
+            digests.append(digest)
+        except Exception as e:
+            logger.error(f'Failed to add image {src_path} to the store: {str(e)}')
+
+    # 空白、模糊、产品太小的照片不上传，同样内容的照片只检查一次
+    try:
+        quality = image_handler.ImageProcessor().check_quality(saved_pic_paths, digests)
+        saved_pic_paths = [result['path'] for result in quality if result['ok']]
+    except Exception as e:
+        logger.error(f'Failed to check the image quality: {str(e)}')
+
+    # 上传用的小图（缩小、去掉 EXIF、按目标大小压缩），已生成过的直接复用
+    try:
+        saved_pic_paths = image_variants.upload_variants(saved_pic_paths, store)
+    except Exception as e:
+        logger.error(f'Failed to make the upload variants, upload the originals: {str(e)}')
+
+    # 硬链接到暂存文件夹，命名为 1.jpg ... N.jpg
+    saved_pic_paths = store.stage(saved_pic_paths, staging_dir)
     
     if not saved_pic_paths:
         logger.error(f"No images found for product: {external_ref}")
@@ -82,35 +118,36 @@ def save_all_pics(product_data):
     return saved_pic_paths
 
 
-def save_pic(url, num):
-    # 从链接获取图片
-    save_path = os.path.join('download', f'{num}.jpg')
+def _fetch_pic(url, save_path):
+    logger.debug(f'Fetching image from {url}')
 
-    for i in range(5):
-        try:
-            logger.debug(f'Fetching image from {url}')
-            response = requests.get(url, stream=True)
-            response.raise_for_status()  # 检查请求是否成功
+    # 共用的下载客户端，分块写入文件，连接在图片和产品之间复用
+    # 返回的不是图片（例如网页）时不会保存，也不再重试
+    if gdrive.is_drive_url(url):
+        # Google Drive 的大文件会先返回确认页面
+        gdrive.fetch(url, save_path)
+    else:
+        response = download_client.get_client().fetch(url, save_path, image_min_size=(0, 0))
+        if response.status != 200:  # 检查请求是否成功
+            raise retry.HTTPStatusError(response.status, url)
 
-            # 确保输出目录存在
-            os.makedirs('download', exist_ok=True)
 
-            # 以二进制写入模式保存图片到本地
-            with open(save_path, 'wb') as file:
-                for chunk in response.iter_content(chunk_size=8192):  # 分块下载
-                    file.write(chunk)
+def save_pic(url, num, folder='download'):
+    # 从链接获取图片
+    save_path = os.path.join(folder, f'{num}.jpg')
 
-                # 保存图片为 JPG 格式
-                logger.debug(f'Saving image to {save_path}')
-                return f'{num}.jpg'
+    # 确保输出目录存在
+    os.makedirs(folder, exist_ok=True)
 
-        except Exception as e:
-            logger.error(f'url save failed, retry after 5s: {str(e)}')
-            time.sleep(5)
-            continue
+    try:
+        # 指数退避重试，永久错误（不是图片、没有权限、404）不重试，同一主机连续失败后直接失败
+        retry.call(_fetch_pic, url, save_path, policy=retry.DOWNLOAD_POLICY, breaker=retry.breaker_for(url), name='save_pic')
+    except Exception as e:
+        logger.error(f'Failed to download image {url}: {str(e)}')
+        return None
 
-    logger.error(f'Failed to download image after 5 retries: {url}')
-    return None
+    logger.debug(f'Saving image to {save_path}')
+    return f'{num}.jpg'
 
 
 def clear_jpg_files(folder_path):
@@ -24,8 +24,8 @@ def clear_jpg_files(folder_path):
     """保持旧接口的文件清理函数"""
     try:
         handler = ImprovedImageHandler()
-        handler.cache.cleanup_expired_cache(force=True)
-        logger.info(f"Cleaned cache files in {folder_path}")
+        handler.cleanup()
+        logger.info(f"Cleaned download files and expired cache files in {folder_path}")
     except Exception as e:
         logger.error(f"Failed to clear files: {e}")
 
@@ -0,0 +1,79 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from loguru import logger
+
+import smart
+import fuzzy_match
+import option_catalog
+from decision_cache import normalize_name
+
+
+BATCH_SIZE = 25  # 一个 AI 请求里的值的数量
+MAX_CONCURRENT_REQUESTS = 4
+CANDIDATES = 15  # 每个值只给 AI 模糊匹配分数最高的几个选项，品牌有上千个
+
+
+def distinct_pairs(products):
+    """
+    The distinct (field, value) pairs of the products, values that only differ in case or spaces count once
+    :return: {(field, value): number of products}
+    """
+    pairs = {}
+    seen = {}
+    for product in products:
+        for field, value in option_catalog.product_fields(product):
+            key = seen.setdefault((field, normalize_name(value)), (field, value))
+            pairs[key] = pairs.get(key, 0) + 1
+    return pairs
+
+
+def candidates(value, options, limit=CANDIDATES):
+    """The options closest to value, with Other / Others so the AI can choose them"""
+    scores = fuzzy_match.FuzzyMatcher(options).scores(value) if len(options) > limit else np.zeros(len(options))
+    best = [options[i] for i in np.argsort(-scores, kind='stable')[:limit]]
+    return best + [option for option in ('Other', 'Others') if option in options and option not in best]
+
+
+def pre_resolve(products, catalog=None, ask=None, batch_size=BATCH_SIZE, max_concurrent=MAX_CONCURRENT_REQUESTS):
+    """
+    在浏览器开始之前确定队列里所有不同的值应该选择的选项
+    能用选项目录确定的（之前的结果、精确匹配、模糊匹配）直接确定，剩下的按字段分批问 AI，同时进行的请求数有上限
+    AI 只看到了目录里的部分选项，答案保存为提示，浏览器在页面的列表里确认后才点击；已有提示的值不再问
+    :param ask: function (field, {value: candidates}) -> {value: option}, smart.ask_ai_batch by default
+    :return: {'values', 'resolved', 'ai', 'unresolved'} counts of distinct values
+    """
+    catalog = catalog or option_catalog.get_catalog()
+    ask = ask or smart.ask_ai_batch
+
+    pairs = distinct_pairs(products)
+    pending = defaultdict(dict)  # field -> {value: candidates}
+    resolved = 0
+    hinted = 0
+    for field, value in pairs:
+        if catalog.resolve(field, value):
+            resolved += 1
+        elif catalog.hint(field, value):
+            hinted += 1
+        elif options := catalog.options(field):
+            pending[field][value] = candidates(value, options)
+        # 还没见过这个字段的选项时只能在页面上匹配
+
+    batches = []
+    for field, values in pending.items():
+        items = list(values.items())
+        batches += [(field, dict(items[i:i + batch_size])) for i in range(0, len(items), batch_size)]
+
+    answered = hinted
+    if batches:
+        logger.info(f'Ask the AI about {sum(len(values) for values in pending.values())} values in {len(batches)} requests')
+        with ThreadPoolExecutor(max_workers=max_concurrent) as pool:
+            for (field, batch), answers in zip(batches, pool.map(lambda args: ask(*args), batches)):
+                for value, option in (answers or {}).items():
+                    if option in batch.get(value, ()) and catalog.remember_hint(field, value, option):
+                        answered += 1
+
+    stats = {'values': len(pairs), 'resolved': resolved, 'ai': answered, 'unresolved': len(pairs) - resolved - answered}
+    logger.info(f'Pre-resolved the option values of the queue: {stats}')
+    return stats
@@ -0,0 +1,173 @@
+import os
+import csv
+
+import pandas as pd
+
+from loguru import logger
+
+
+# 每个产品都必须填写的字段
+REQUIRED_FIELDS = ['External reference', 'Gender', 'Category', 'Brand', 'Conditions', 'Price']
+
+# 手表类别额外需要的字段，见 vestiaire.submit_step1_details
+WATCH_CATEGORIES = ['watches', 'watch']
+WATCH_FIELDS = ['Bracelet', 'Mechanism']
+
+REPORT_FIELDS = ['Row', 'External reference', 'Errors', 'Warnings']
+
+
+def _chunks(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _plain(value):
+    """A cell back as a plain Python value: numpy scalars unwrapped, NaN -> None, whole floats -> int"""
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float):
+        if value != value:
+            return None
+        if value.is_integer():
+            return int(value)
+    return value
+
+
+def _text(df, column):
+    """The column as trimmed strings, a missing column is all ''"""
+    if column not in df.columns:
+        return pd.Series('', index=df.index)
+    return df[column].astype(str).str.strip()
+
+
+def normalize_frame(df):
+    """
+    Normalize a chunk of product rows in place:
+    - trim every text cell
+    - coerce Price to a number (an empty price becomes NaN, an invalid one keeps its text; both are reported by validate_frame)
+    - parse Size - value to the same text _format_num would select, e.g. '38,5 EU' -> '38.5', 40.0 -> '40'
+    """
+    for column in df.columns:
+        try:
+            stripped = df[column].str.strip()
+        except AttributeError:
+            continue  # 纯数字的列
+        df[column] = stripped.where(stripped.notna(), df[column])
+
+    if 'Price' in df.columns:
+        # 去掉货币符号和空格，'1,200' 的千位分隔符去掉，'99,5' 的小数逗号换成点
+        text = df['Price'].where(df['Price'].notna(), '').astype(str).str.strip()
+        price = text.str.replace(r'[^\d.,-]', '', regex=True)
+        price = price.str.replace(r',(?=\d{3}(?:\D|$))', '', regex=True).str.replace(',', '.', regex=False)
+        number = pd.to_numeric(price, errors='coerce')
+        df['Price'] = number.where(number.notna() | (text == ''), text)
+
+    if 'Size - value' in df.columns:
+        size = df['Size - value'].astype(str).str.replace(',', '.', regex=False)
+        number = pd.to_numeric(size.str.extract(r'(\d+(?:\.\d+)?)', expand=False), errors='coerce')
+        is_integer = number.notna() & (number % 1 == 0)
+
+        formatted = number.astype(str).str.rstrip('0').str.rstrip('.')
+        formatted = formatted.where(~is_integer, number.round().astype('Int64').astype(str))
+
+        # 没有数字的尺码（例如 Medium）保持原样
+        df['Size - value'] = formatted.where(number.notna(), df['Size - value'])
+
+    return df
+
+
+def validate_frame(df):
+    """
+    Validate a normalized chunk of product rows
+    :return: Series of error messages, '' for the rows that can go through the browser flow
+    """
+    errors = pd.Series('', index=df.index)
+
+    def add_error(mask, message):
+        nonlocal errors
+        errors = errors.where(~mask, errors + message + '; ')
+
+    for field in REQUIRED_FIELDS:
+        if field == 'Price':
+            continue
+        add_error(_text(df, field) == '', f'Missing {field}')
+
+    if 'Price' in df.columns:
+        price = pd.to_numeric(df['Price'], errors='coerce')
+        add_error(df['Price'].isna(), 'Missing Price')
+        add_error(df['Price'].notna() & price.isna(), 'Price is not a number')
+        add_error(price.notna() & (price <= 0), 'Price must be greater than 0')
+    else:
+        add_error(pd.Series(True, index=df.index), 'Missing Price')
+
+    is_watch = _text(df, 'Category').str.lower().isin(WATCH_CATEGORIES)
+    for field in WATCH_FIELDS:
+        add_error(is_watch & (_text(df, field) == ''), f'Missing {field} for watches')
+
+    add_error((_text(df, 'Size - standard') != '') & (_text(df, 'Size - value') == ''), 'Missing Size - value')
+
+    return errors.str.rstrip('; ')
+
+
+def validate_rows(rows, report_path, chunk_size=500, warnings=None):
+    """
+    Normalize and validate the product rows in vectorized chunks, memory stays flat whatever the sheet size.
+    Invalid rows are written to the report (CSV) and dropped, only the rows that can succeed are yielded.
+    :param rows: dictionaries, or (Excel row number, dictionary) pairs (table.iter_excel_rows(row_numbers=True))
+        so the report shows the row numbers of the sheet; otherwise the rows are numbered from 1
+    :param warnings: {External reference: [message, ...]}, e.g. photos shared with another product,
+        reported for the rows of these products but the rows are still yielded
+    """
+    warnings = {ref: '; '.join(messages) for ref, messages in (warnings or {}).items()}
+    if os.path.dirname(report_path):
+        os.makedirs(os.path.dirname(report_path), exist_ok=True)
+
+    valid_count = 0
+    invalid_count = 0
+    row_offset = 0
+
+    with open(report_path, mode='w', newline='', encoding='utf-8') as report_file:
+        writer = csv.DictWriter(report_file, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+
+        for chunk in _chunks(rows, chunk_size):
+            if isinstance(chunk[0], tuple):
+                numbers, chunk = zip(*chunk)
+            else:
+                numbers = range(row_offset + 1, row_offset + 1 + len(chunk))  # 数据行号，从 1 开始（不含表头）
+            row_offset += len(chunk)
+
+            df = pd.DataFrame.from_records(chunk)
+            df.index = list(numbers)
+
+            df = normalize_frame(df)
+            errors = validate_frame(df)
+            is_valid = errors == ''
+            row_warnings = _text(df, 'External reference').map(warnings).fillna('')
+
+            for row_number in df.index[~is_valid | (row_warnings != '')]:
+                writer.writerow({
+                    'Row': row_number,
+                    'External reference': df.at[row_number, 'External reference'] if 'External reference' in df.columns else '',
+                    'Errors': errors[row_number],
+                    'Warnings': row_warnings[row_number],
+                })
+            report_file.flush()
+
+            invalid_count += int((~is_valid).sum())
+            valid_count += int(is_valid.sum())
+
+            # 每行只输出它原来的字段，值和同一批的其他行无关，否则行的指纹 (work_queue.row_fingerprint) 会变化
+            for position in is_valid.to_numpy().nonzero()[0]:
+                row_number = df.index[position]
+                yield {key: _plain(df.at[row_number, key]) for key in chunk[position]}
+
+    if invalid_count:
+        logger.warning(f'Pre-flight: {invalid_count} invalid rows are not queued, see {report_path}')
+    logger.info(f'Pre-flight: {valid_count} rows passed the validation')
@@ -0,0 +1,183 @@
+import os
+import csv
+import sys
+import json
+import time
+import queue
+import sqlite3
+import tempfile
+import threading
+
+from openpyxl import Workbook
+from loguru import logger
+
+
+RESULT_DB = 'result/results.db'
+RESULT_DIR = 'result'
+
+# 固定在最前面的结果字段，后面跟着产品表格里面的字段
+STATUS_FIELDS = ['Unfinished Steps', 'Draft URL', 'Error']
+
+
+def _connect(path):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            launch TEXT NOT NULL,
+            row_index INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_results_launch ON results (launch, id);
+    ''')
+    return conn
+
+
+class ResultSink:
+    """
+    产品结果存储
+    结果先追加写入 SQLite，由后台线程完成，不会阻塞浏览器流程
+    CSV/XLSX 文件在需要时或程序结束时一次性生成（先写临时文件再改名），运行中打开结果文件也不会影响写入
+    """
+
+    def __init__(self, launch_datetime, path=RESULT_DB):
+        self.launch = launch_datetime
+        self.path = path
+
+        # 先在当前线程建表，写入线程和读取方都可以直接使用
+        _connect(path).close()
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._writer, name='result-sink', daemon=True)
+        self._thread.start()
+
+    def write(self, row_index, record):
+        """Queue a result record, returns immediately"""
+        self._queue.put((row_index, record))
+
+    def _writer(self):
+        conn = _connect(self.path)
+        try:
+            while True:
+                item = self._queue.get()
+                try:
+                    if item is None:
+                        return
+                    row_index, record = item
+                    conn.execute(
+                        'INSERT INTO results (launch, row_index, data, created_at) VALUES (?, ?, ?, ?)',
+                        (self.launch, row_index, json.dumps(record, ensure_ascii=False, default=str), time.time())
+                    )
+                except Exception as e:
+                    logger.error(f'Failed to save the result: {e}')
+                finally:
+                    self._queue.task_done()
+        finally:
+            conn.close()
+
+    def flush(self):
+        """Wait until all queued records are written"""
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def records(self):
+        return load_records(self.launch, self.path)
+
+    def export(self, fmt='csv'):
+        self.flush()
+        return export_results(self.launch, fmt, self.path)
+
+
+def load_records(launch_datetime, path=RESULT_DB):
+    conn = _connect(path)
+    try:
+        rows = conn.execute('SELECT data FROM results WHERE launch = ? ORDER BY id', (launch_datetime,)).fetchall()
+    finally:
+        conn.close()
+    return [json.loads(row[0]) for row in rows]
+
+
+def result_columns(records):
+    """The fixed schema: the status fields first, then every product field in the order it was first seen"""
+    columns = list(STATUS_FIELDS)
+    seen = set(columns)
+    for record in records:
+        for key in record:
+            if key not in seen:
+                seen.add(key)
+                columns.append(key)
+    return columns
+
+
+def export_results(launch_datetime, fmt='csv', path=RESULT_DB, result_dir=RESULT_DIR):
+    """
+    Render the results of a launch to result/Result_<launch>.csv or .xlsx
+    The file is written to a temporary file first and then renamed, readers never see a half written file.
+    :return: the exported file path, or None when the file could not be replaced
+    """
+    records = load_records(launch_datetime, path)
+    columns = result_columns(records)
+    save_path = os.path.join(result_dir, f'Result_{launch_datetime}.{fmt}')
+    os.makedirs(result_dir, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(prefix='.Result_', suffix=f'.{fmt}', dir=result_dir)
+    try:
+        if fmt == 'csv':
+            with os.fdopen(fd, mode='w', newline='', encoding='utf-8') as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=columns, restval='')
+                writer.writeheader()
+                writer.writerows(records)
+        elif fmt == 'xlsx':
+            os.close(fd)
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet('Result')
+            sheet.append(columns)
+            for record in records:
+                sheet.append([record.get(column, '') for column in columns])
+            workbook.save(tmp_path)
+        else:
+            os.close(fd)
+            raise ValueError(f'Unsupported result format: {fmt}')
+
+        os.replace(tmp_path, save_path)
+
+    except PermissionError as e:
+        # Windows 下结果文件被 Excel 打开时不能替换，保留旧文件，下次导出再试
+        logger.warning(f'Can not replace {save_path}, is it opened in Excel? {e}')
+        os.remove(tmp_path)
+        return None
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    logger.info(f'Export {len(records)} results to {save_path}')
+    return save_path
+
+
+def latest_launch(path=RESULT_DB):
+    conn = _connect(path)
+    try:
+        row = conn.execute('SELECT launch FROM results ORDER BY id DESC LIMIT 1').fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+if __name__ == '__main__':
+    # 运行中随时导出结果: python3 result_sink.py [launch datetime]
+    launch = sys.argv[1] if len(sys.argv) > 1 else latest_launch()
+    if not launch:
+        logger.error('No result found')
+    else:
+        export_results(launch, 'csv')
+        export_results(launch, 'xlsx')
@@ -0,0 +1,201 @@
+import time
+import random
+import asyncio
+import threading
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlparse
+
+from loguru import logger
+
+
+class PermanentError(Exception):
+    """Retrying will not help (not found, permission denied, not an image ...)"""
+
+
+class HTTPStatusError(Exception):
+    """An HTTP error status, 4xx except 408/425/429 are permanent"""
+
+    def __init__(self, status, url=''):
+        super().__init__(f'HTTP {status}' + (f': {url}' if url else ''))
+        self.status = status
+
+
+class CircuitOpenError(PermanentError):
+    """The host failed too often recently, calls fail fast until the breaker half-opens"""
+
+
+RETRYABLE_STATUSES = (408, 425, 429)
+
+
+def is_retryable(error):
+    """Classify an error: permanent errors and 4xx statuses are not retried, everything else is (timeouts, 5xx, resets)"""
+    if isinstance(error, PermanentError):
+        return False
+    status = getattr(error, 'status', None)
+    if isinstance(status, int) and 400 <= status < 500 and status not in RETRYABLE_STATUSES:
+        return False
+    return True
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    指数退避 + full jitter：第 n 次重试前等待 random(min_delay, min(max_delay, base_delay * multiplier ** n)) 秒
+    budget 是整个调用（包括等待）最多花的秒数
+    """
+    attempts: int = 4
+    base_delay: float = 0.5
+    min_delay: float = 0.0
+    max_delay: float = 10.0
+    multiplier: float = 2.0
+    budget: Optional[float] = None
+    jitter: bool = True
+
+    def delay(self, retry_number):
+        """The wait before retry number retry_number (0 for the first retry)"""
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** retry_number)
+        return random.uniform(min(self.min_delay, delay), delay) if self.jitter else delay
+
+
+# 图片下载：CDN 或 Drive 短暂出错时很快重试
+DOWNLOAD_POLICY = RetryPolicy(attempts=4, base_delay=0.5, max_delay=8, budget=60)
+
+# 浏览器登录：页面元素没出现时，等待时间逐次增加
+BROWSER_POLICY = RetryPolicy(attempts=3, base_delay=10, min_delay=3, max_delay=30)
+
+
+class CircuitBreaker:
+    """
+    连续失败 failure_threshold 次后打开，reset_timeout 秒内所有调用直接失败
+    之后半开，放一个调用过去试探，成功就关闭，失败再打开
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=60):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == 'open' or (state == 'half-open' and self._probing):
+                raise CircuitOpenError(f'Circuit open for {self.name}, {self.failures} consecutive failures')
+            if state == 'half-open':
+                self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def end_probe(self):
+        """The call that probed the half-open breaker ended without a verdict (e.g. cancelled), allow another probe"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                if self.opened_at is None:
+                    logger.warning(f'Circuit opened for {self.name} after {self.failures} consecutive failures')
+                self.opened_at = time.monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(url_or_host):
+    """The circuit breaker of a host, shared by the whole run"""
+    host = urlparse(url_or_host).netloc or url_or_host
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host)
+        return _breakers[host]
+
+
+def _should_retry(error, policy, breaker, attempt, started, delay):
+    if not is_retryable(error) or attempt + 1 >= policy.attempts:
+        return False
+    if breaker and breaker.state == 'open':
+        return False  # 这次失败打开了断路器，不用再试
+    if policy.budget is not None and time.monotonic() - started + delay > policy.budget:
+        return False
+    return True
+
+
+def call(func, *args, policy=DOWNLOAD_POLICY, breaker=None, name='', **kwargs):
+    """
+    Call func with retries. Permanent errors and the last error are raised.
+    :param breaker: CircuitBreaker of the host, only retryable failures count against it
+    """
+    started = time.monotonic()
+    for attempt in range(policy.attempts):
+        if breaker:
+            breaker.before_call()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if breaker:
+                # 永久错误（404、不是图片）说明主机在正常响应，和成功一样关闭断路器
+                if is_retryable(e):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+            delay = policy.delay(attempt)
+            if not _should_retry(e, policy, breaker, attempt, started, delay):
+                raise
+            logger.warning(f'{name or func.__name__} failed (attempt {attempt + 1}/{policy.attempts}), retry after {delay:.1f}s: {e}')
+            time.sleep(delay)
+        else:
+            if breaker:
+                breaker.record_success()
+            return result
+        finally:
+            if breaker:
+                breaker.end_probe()
+
+
+async def call_async(func, *args, policy=DOWNLOAD_POLICY, breaker=None, name='', **kwargs):
+    """call() for coroutine functions"""
+    started = time.monotonic()
+    for attempt in range(policy.attempts):
+        if breaker:
+            breaker.before_call()
+        try:
+            result = await func(*args, **kwargs)
+        except Exception as e:
+            if breaker:
+                # 永久错误（404、不是图片）说明主机在正常响应，和成功一样关闭断路器
+                if is_retryable(e):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+            delay = policy.delay(attempt)
+            if not _should_retry(e, policy, breaker, attempt, started, delay):
+                raise
+            logger.warning(f'{name or func.__name__} failed (attempt {attempt + 1}/{policy.attempts}), retry after {delay:.1f}s: {e}')
+            await asyncio.sleep(delay)
+        else:
+            if breaker:
+                breaker.record_success()
+            return result
+        finally:
+            if breaker:
+                breaker.end_probe()
@@ -4,58 +4,53 @@ import os
 import random
 from dotenv import load_dotenv
 
-from openai import OpenAI
 from loguru import logger
 from bs4 import BeautifulSoup
 
+import decision_cache
+import fuzzy_match
+import option_catalog
+import llm_client
+
 # Load environment variables from .env file
 load_dotenv()
 
-# 初始化OpenAI客户端
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
 def ChatGpt(org_name, names, prompt1, prompt2):
     """
     Use OpenAI API to find the best match, fallback to simple matching if API key is not available.
     """
+    decision = ask_ai(org_name, names, prompt1, prompt2)
+    return decision.name if decision else simple_match(org_name, names)
+
+
+def ask_ai(org_name, names, prompt1, prompt2):
+    """
+    Ask OpenAI for the best match, within the deadline of llm_client (LLM_DEADLINE)
+    :return: llm_client.Decision, when the call failed, missed the deadline or the answer is not an option
+             it is degraded and its name is the fuzzy fallback of the client; None when the API key is missing
+    """
     api_key = os.getenv('OPENAI_API_KEY')
     if not api_key:
         logger.warning("OpenAI API key not found, using simple matching strategy")
-        return simple_match(org_name, names)
-    
-    try:
-        # Prepare the prompt
-        prompt = f"""Given the original name '{org_name}', find the best match from these options: {', '.join(names)}.
-        Consider the context and return the most appropriate option.
-        {prompt1}
-        {prompt2}
-        Return only the exact name from the options list, nothing else."""
-        
-        # Call OpenAI API
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that matches names to predefined options."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=50
-        )
-        
-        # Extract the response
-        result = response.choices[0].message.content.strip()
-        
-        # Validate the result
-        if result in names:
-            logger.debug(f'AI found match: {result}')
-            return result
-        else:
-            logger.warning(f'AI returned invalid result: {result}, falling back to simple matching')
-            return simple_match(org_name, names)
-            
-    except Exception as e:
-        logger.error(f'Error using OpenAI API: {str(e)}, falling back to simple matching')
-        return simple_match(org_name, names)
+        return None
+
+    # 失败和超时由客户端记录为降级，名字是客户端的模糊匹配结果
+    decision = llm_client.get_client().choose_sync(org_name, names, prompt1, prompt2)
+    if not decision.degraded:
+        logger.debug(f'AI found match: {decision.name} ({decision.elapsed:.2f}s)')
+    return decision
+
+
+def ask_ai_batch(field, candidates):
+    """
+    Ask OpenAI for the best match of many values of the same field in one request
+    :param candidates: {value: [option, ...]}
+    :return: {value: option}, only the answers that are one of the options of their value
+    """
+    if not os.getenv('OPENAI_API_KEY') or not candidates:
+        return {}
+    return llm_client.get_client().choose_batch_sync(field, candidates)
+
 
 def simple_match(org_name, names):
     """
@@ -74,6 +69,12 @@ def simple_match(org_name, names):
         if name.lower() == org_name:
             logger.debug(f'Found exact match: {name}')
             return name
+
+    # Try fuzzy match (character n-grams, accents ignored)
+    name, confidence = fuzzy_match.best_match(org_name, names)
+    if confidence >= fuzzy_match.FALLBACK_THRESHOLD:
+        logger.debug(f'Found fuzzy match: {name} ({confidence:.2f})')
+        return name
             
     # Try partial match
     for name in names:
@@ -90,17 +91,31 @@ def simple_match(org_name, names):
         return names[0]
 
 
-def smart_click(tab, mode, options_css_xpath, click_rule, org_name, prompt1='', prompt2=''):
+def smart_click(tab, mode, options_css_xpath, click_rule, org_name, prompt1='', prompt2='', field='', resolved=None):
     """
     智能点选相应的选项
     mode: select 和 click,有 select-options 这种和 li span 点击选择两种模式
     click_rule: 当 mode 为  select 模式时，不需要指定点击处的 xpath/css
     choose_rule: 里面需要被替换的部分用 {{replace_name}} 代替
+    field: 表单字段的名字 (option_catalog)，读到的选项列表和匹配结果会保存下来
+    resolved: 提前确定的选项 (OptionCatalog.resolve)，能直接点到时不再读列表和匹配
+    批量 AI 的提示 (OptionCatalog.hint) 只在读到的列表里有这个选项时使用
     """
+    if resolved and _choose_resolved(tab, mode, options_css_xpath, click_rule, resolved):
+        logger.debug(f'Choose the resolved option: {org_name} -> {resolved}')
+        return
+
     main_note = tab.ele(options_css_xpath)
     name_list = main_note.text.split('\n')
 
-    the_best_match = ai_compare_option(org_name, name_list, prompt1, prompt2)
+    catalog = option_catalog.get_catalog()
+    if field:
+        catalog.record(field, name_list)
+
+    hint = catalog.hint(field, org_name) if field else None
+    the_best_match, source = match_option(org_name, name_list, prompt1, prompt2, hint)
+    if field and source in ('exact', 'fuzzy', 'cache', 'ai'):
+        catalog.remember(field, org_name, the_best_match, source)
 
     if the_best_match == 'No Results Found':
         # 当出现 No Results Found 时说明 Material Color Pattern 这种没有搜索到结果，那么就情况输入框，重新指定 Other 为其值
@@ -131,41 +146,89 @@ def smart_click(tab, mode, options_css_xpath, click_rule, org_name, prompt1='',
     return
 
 
+def _choose_resolved(tab, mode, options_css_xpath, click_rule, resolved):
+    """Choose an option without reading the list, False when it is not on the page"""
+    try:
+        if mode == 'select':
+            return bool(tab.ele(options_css_xpath, timeout=2).select.by_text(resolved))
+        option = tab.ele(click_rule.replace('{replace_name}', resolved), timeout=2)
+        if not option:
+            return False
+        option.click()
+        return True
+    except Exception as e:
+        logger.debug(f'Can not choose the resolved option {resolved}: {e}')
+        return False
+
+
 def ai_compare_option(org_name, names, prompt1, prompt2):
     """
     使用人工智能去比较，然后返回最适合的名称
     """
+    return match_option(org_name, names, prompt1, prompt2)[0]
+
+
+def match_option(org_name, names, prompt1, prompt2, hint=None):
+    """
+    ai_compare_option，同时返回结果的来源
+    :param hint: 批量 AI 提示的选项，在 names 里时使用
+    :return: (name, source), source 是 'none' (No Results Found), 'exact', 'fuzzy', 'hint', 'cache', 'ai' 或者 'fallback'
+    """
     # 清理和标准化输入
     org_name = org_name.strip()
     names = [name.strip() for name in names if name.strip()]
     
     # 如果列表为空或只包含"No Results Found"
     if not names or (len(names) == 1 and names[0] == 'No Results Found'):
-        return 'No Results Found'
+        return 'No Results Found', 'none'
         
     # 尝试精确匹配（不区分大小写）
     org_name_lower = org_name.lower()
     for name in names:
         if name.lower() == org_name_lower:
             logger.debug(f'找到精确匹配: {name}')
-            return name
+            return name, 'exact'
             
     # 如果有"No Results Found"但不是唯一选项
     if 'No Results Found' in names:
-        return 'No Results Found'
+        return 'No Results Found', 'none'
         
-    # 使用AI进行模糊匹配
-    best_match_name = ChatGpt(org_name, names, prompt1=prompt1, prompt2=prompt2)
+    # 模糊匹配的置信度足够高时不需要问 AI，例如 Hermes -> Hermès
+    fuzzy_name, confidence = fuzzy_match.best_match(org_name, names)
+    if confidence >= fuzzy_match.MATCH_THRESHOLD:
+        logger.debug(f'模糊匹配: {org_name} -> {fuzzy_name} ({confidence:.2f})')
+        return fuzzy_name, 'fuzzy'
+
+    # 批量 AI 的提示，页面的列表里有这个选项才使用
+    if hint and hint in names:
+        logger.debug(f'使用批量 AI 的提示: {org_name} -> {hint}')
+        return hint, 'hint'
+
+    # 同样的值和选项之前问过 AI 的，直接用保存的结果
+    cache = decision_cache.get_cache()
+    if (cached := cache.get(org_name, names, prompt1, prompt2)) in names:
+        logger.debug(f'使用保存的匹配结果: {org_name} -> {cached}')
+        return cached, 'cache'
+
+    # 使用AI进行模糊匹配，只保存 AI 给出的结果，降级和简单匹配的后备结果下次还会问 AI
+    if decision := ask_ai(org_name, names, prompt1, prompt2):
+        if not decision.degraded:
+            cache.put(org_name, names, decision.name, prompt1, prompt2)
+            return decision.name, 'ai'
+        if decision.name in names:
+            return decision.name, 'fallback'
+
+    best_match_name = simple_match(org_name, names)
     
-    # 验证AI返回的匹配结果
+    # 验证简单匹配的结果
     if best_match_name and best_match_name in names:
-        return best_match_name
+        return best_match_name, 'fallback'
     elif 'Other' in names:
         logger.warning(f'AI匹配结果无效，使用Other作为后备选项')
-        return 'Other'
+        return 'Other', 'fallback'
     else:
         logger.warning(f'AI匹配结果无效，使用第一个选项作为后备')
-        return names[0]
+        return names[0], 'fallback'
 
 
 if __name__ == '__main__':
@@ -1,65 +1,108 @@
-import os
-import csv
-import time
-
-import pandas as pd
-import json
+import math
+import datetime
 
+from openpyxl import load_workbook
 from loguru import logger
 
+import page_state
 
-def excel_to_list_of_dicts(path, sheet_name=None):
+
+def _normalize_cell(value):
     """
-    Reads an Excel file and converts its contents into a list of dictionaries.
+    Normalize a cell value the same way the old pandas reader did: empty cells become '',
+    whole floats become int, dates become strings so the row stays JSON serializable.
     """
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        if math.isnan(value):
+            return ''
+        if value.is_integer():
+            return int(value)
+        return value
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat(sep=' ') if isinstance(value, datetime.datetime) else value.isoformat()
+    return value
+
+
+def iter_excel_rows(path, sheet_name=None, row_numbers=False):
+    """
+    Stream an Excel file row by row and yield one normalized dictionary per product.
+
+    The workbook is opened in openpyxl read-only mode, so memory stays flat whatever the sheet size.
+    The first row is the header, completely empty rows are skipped.
+    :param row_numbers: yield (Excel row number, row) pairs, e.g. for the pre-flight report
+    """
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        # 其他工具写的文件里保存的范围 (dimension) 经常不对，按它读会截断或者补齐行
+        sheet.reset_dimensions()
+        rows = sheet.iter_rows(values_only=True)
 
-    with pd.ExcelFile(path) as excel_data:
-        df = excel_data.parse(sheet_name if sheet_name else excel_data.sheet_names[0])
-        df.fillna('', inplace=True)  # Change Nan value to ''
-        list_of_dicts = df.to_dict(orient='records')
+        header = next(rows, None)
+        if header is None:
+            return
 
-    return list_of_dicts
+        # Same naming as pandas for columns without a title
+        columns = [str(name).strip() if name is not None else f'Unnamed: {i}' for i, name in enumerate(header)]
 
+        for row_number, values in enumerate(rows, start=2):
+            if values is None or all(value is None or value == '' for value in values):
+                continue
 
-def dicts_to_queue(product_list):
+            row = {column: '' for column in columns}
+            for column, value in zip(columns, values):
+                row[column] = _normalize_cell(value)
+
+            yield (row_number, row) if row_numbers else row
+    finally:
+        workbook.close()
+
+
+def excel_to_list_of_dicts(path, sheet_name=None):
     """
-    Save the list of dictionaries to queue folder as Json files
+    Reads an Excel file and converts its contents into a list of dictionaries.
+    Prefer iter_excel_rows for big workbooks, this one keeps every row in memory.
     """
 
-    # Clear the queue folder
-    for file in get_queue():
-        os.remove(f'queue/{file}')
+    return list(iter_excel_rows(path, sheet_name))
 
-    time.sleep(1)
 
-    for index, product in enumerate(product_list, start=1):
-        json_path = f'queue/{str(index).rjust(3,"0")}.json'
-        with open(json_path, 'w') as file:
-            json.dump(product, file, indent=4)
+def dicts_to_queue(product_list, queue):
+    """
+    Push the dictionaries to the SQLite work queue.
+    product_list can be any iterable (e.g. iter_excel_rows), it is consumed lazily one row at a time.
+    Rows already queued with the same content (by External reference) are skipped.
+    :return: the number of queued products
+    """
 
-    time.sleep(1)
+    count, skipped = queue.push_many(product_list)
+    logger.info(f'Pushed {count} new or changed products to the queue')
 
-    # list the files in queue folder
-    files = get_queue()
-    return files
+    if skipped:
+        logger.info(f'Skipped {len(skipped)} unchanged products: {", ".join(skipped)}')
 
+    return count
 
-def save_result_to_excel(tab, launch_datetime, product_data, row_index, reason):
+
+def save_result_to_excel(tab, launch_datetime, product_data, row_index, reason, sink):
     """
-    Save the finished/unfinished product to the vestiairecollective.com
+    Save the finished/unfinished product to the result sink, the CSV/XLSX is exported from it at the end
     :param tab:
     :param launch_datetime:
     :param product_data:
     :param row_index:
     :param reason:
+    :param sink: result_sink.ResultSink of this launch
     :return:
     """
-    current_url = tab.url
-    finished_steps = tab.html.count('AsideMenu_aside__menu__li__item__icon--desktop')
+    state = page_state.probe(tab)  # 只取页面关键状态，不传输整个页面 HTML
+    current_url = state['url']
+    finished_steps = state['completed_steps']
     unfinished_steps = 5 - finished_steps  # 计算出未完成的步骤数量
 
-    save_path = f'result/Result_{launch_datetime}.csv'
-
     if current_url == 'https://us.vestiairecollective.com/sell-clothes-online/':
         reason = 'Failed in the Category step'
     elif reason == '':
@@ -72,45 +115,10 @@ def save_result_to_excel(tab, launch_datetime, product_data, row_index, reason):
         **product_data
     }
 
-    # 检查文件是否存在
-    file_exists = os.path.exists(save_path)
-
-    # 确保目录存在
-    os.makedirs(os.path.dirname(save_path), exist_ok=True)
-
-    # 写入文件
-    with open(save_path, mode='a', newline='', encoding='utf-8') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=['Unfinished Steps', 'Draft URL', 'Error'] + list(product_data.keys()))
-
-        # 如果文件不存在，则写入表头
-        if not file_exists:
-            writer.writeheader()
-
-        # 写入数据
-        writer.writerow(new_product_data)
-
-    logger.warning(f"Save product to {save_path}")
-
-
-def load_json_data(path):
-    """
-    Load the JSON data from the specified file
-    """
-    with open(f'queue/{path}', 'r') as file:
-        data = json.load(file)
-
-    index = int(path.split('.')[0])
-
-    return index, data
-
+    # 后台线程写入，这里不会阻塞
+    sink.write(row_index, new_product_data)
 
-def get_queue():
-    files = os.listdir('queue')
-    json_files = []
-    for f in files:
-        if f.endswith('.json'):
-            json_files.append(f)
-    return json_files
+    logger.warning(f"Save product {row_index} to the results of {launch_datetime}")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,65 @@
+import decision_cache
+import smart
+from decision_cache import DecisionCache
+from llm_client import Decision
+
+
+OPTIONS = ['Gucci', 'Gucci X Adidas', 'Other']
+
+
+def test_decision_survives_restart(tmp_path):
+    path = str(tmp_path / 'decisions.db')
+    DecisionCache(path).put('gucci ', OPTIONS, 'Gucci')
+
+    cache = DecisionCache(path)
+
+    # 大小写、空格、选项顺序不影响
+    assert cache.get('Gucci', list(reversed(OPTIONS))) == 'Gucci'
+    assert cache.get('Gucci', OPTIONS, prompt1='The brand') is None
+    assert cache.get('Gucci', OPTIONS[:2]) is None
+    assert cache.stats() == {'hits': 1, 'misses': 2, 'hit_rate': 1 / 3}
+
+
+def test_expired_and_old_version_decisions_are_ignored(tmp_path):
+    path = str(tmp_path / 'decisions.db')
+    DecisionCache(path).put('Gucci', OPTIONS, 'Gucci')
+
+    assert DecisionCache(path, version=2).get('Gucci', OPTIONS) is None
+    assert DecisionCache(path, ttl=-1).get('Gucci', OPTIONS) is None
+
+    assert DecisionCache(path, version=2).purge() == 1
+    assert DecisionCache(path).get('Gucci', OPTIONS) is None
+
+
+def test_ai_is_asked_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(decision_cache, '_cache', DecisionCache(str(tmp_path / 'decisions.db')))
+    calls = []
+
+    def ask_ai(org_name, names, prompt1, prompt2):
+        calls.append(org_name)
+        return Decision('Gucci X Adidas', False)
+    monkeypatch.setattr(smart, 'ask_ai', ask_ai)
+
+    assert smart.ai_compare_option('Gucci Adidas', OPTIONS, '', '') == 'Gucci X Adidas'
+    assert smart.ai_compare_option(' gucci  adidas', OPTIONS, '', '') == 'Gucci X Adidas'
+    assert calls == ['Gucci Adidas']
+
+
+def test_fallback_is_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(decision_cache, '_cache', DecisionCache(str(tmp_path / 'decisions.db')))
+    monkeypatch.setattr(smart, 'ask_ai', lambda *args: None)
+
+    assert smart.ai_compare_option('Prada', OPTIONS, '', '') == 'Other'
+    assert decision_cache.get_cache().get('Prada', OPTIONS) is None
+
+
+def test_degraded_decision_is_used_but_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(decision_cache, '_cache', DecisionCache(str(tmp_path / 'decisions.db')))
+    monkeypatch.setattr(smart, 'ask_ai', lambda *args: Decision('Gucci', True, 'no answer within 8s'))
+
+    def simple_match(*args):
+        raise AssertionError('the client already matched')
+    monkeypatch.setattr(smart, 'simple_match', simple_match)
+
+    assert smart.match_option('Gucci Adidas', OPTIONS, '', '') == ('Gucci', 'fallback')
+    assert decision_cache.get_cache().get('Gucci Adidas', OPTIONS) is None
@@ -0,0 +1,100 @@
+import io
+import os
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+from download_client import DownloadClient, InvalidImage
+
+
+def _jpeg(size):
+    buffer = io.BytesIO()
+    Image.new('RGB', size).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/missing.jpg':
+            self.send_error(404)
+            return
+        content_type = 'image/jpeg'
+        if self.path == '/page.jpg':
+            body, content_type = b'<html>virus scan warning</html>', 'text/html'
+        elif self.path == '/untyped.jpg':
+            body, content_type = b'<!DOCTYPE html><html></html>', ''
+        elif self.path == '/small.jpg':
+            body = _jpeg((100, 100))
+        elif self.path == '/large.jpg':
+            body = _jpeg((900, 800))
+        else:
+            body = b'\xff\xd8\xff' + b'x' * 1000
+        self.send_response(200)
+        if content_type:
+            self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{httpd.server_port}'
+    httpd.shutdown()
+
+
+@pytest.fixture
+def client():
+    client = DownloadClient()
+    yield client
+    client.close()
+
+
+def test_fetch_saves_body(server, client, tmp_path):
+    result = client.fetch(f'{server}/a.jpg', str(tmp_path / 'a.jpg'))
+
+    assert result.status == 200
+    assert result.size == 1003
+    assert (tmp_path / 'a.jpg').read_bytes().startswith(b'\xff\xd8\xff')
+
+
+def test_fetch_error_saves_nothing(server, client, tmp_path):
+    result = client.fetch(f'{server}/missing.jpg', str(tmp_path / 'b.jpg'))
+
+    assert result.status == 404
+    assert result.path is None
+    assert not (tmp_path / 'b.jpg').exists()
+
+
+def test_fetch_async_from_another_loop(server, client, tmp_path):
+    async def fetch_all():
+        return await asyncio.gather(*(client.fetch_async(f'{server}/{i}.jpg', str(tmp_path / f'{i}.jpg')) for i in range(5)))
+
+    results = asyncio.run(fetch_all())
+
+    assert [result.status for result in results] == [200] * 5
+
+
+@pytest.mark.parametrize('name', ['page.jpg', 'untyped.jpg', 'small.jpg'])
+def test_invalid_image_is_aborted(server, client, tmp_path, name):
+    with pytest.raises(InvalidImage):
+        client.fetch(f'{server}/{name}', str(tmp_path / name), image_min_size=(800, 800))
+
+    assert os.listdir(tmp_path) == []  # 没有留下临时文件
+
+
+def test_valid_image_passes_the_check(server, client, tmp_path):
+    result = client.fetch(f'{server}/large.jpg', str(tmp_path / 'large.jpg'), image_min_size=(800, 800))
+
+    assert result.status == 200
+    with Image.open(tmp_path / 'large.jpg') as img:
+        assert img.size == (900, 800)
+    assert os.listdir(tmp_path) == ['large.jpg']
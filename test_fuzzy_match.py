@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+import fuzzy_match
+import smart
+from fuzzy_match import FuzzyMatcher
+
+
+def test_fold():
+    assert fuzzy_match.fold(' Hermès ') == 'hermes'
+    assert fuzzy_match.fold('Dolce & Gabbana') == 'dolce gabbana'
+    assert fuzzy_match.fold('CÉLINE') == 'celine'
+
+
+@pytest.mark.parametrize('query, options, expected', [
+    ('Hermes', ['Hermès X Apple', 'Hermès', 'Other'], 'Hermès'),
+    ('Ankle boots', ['Boots', 'Ankle Boots', 'Chelsea Boots', 'Other'], 'Ankle Boots'),
+    ('Dolce Gabbana', ['D&G', 'Dolce & Gabbana'], 'Dolce & Gabbana'),
+    ('Louis Vuiton', ['Louis Féraud', 'Louis Vuitton'], 'Louis Vuitton'),
+])
+def test_best_match(query, options, expected):
+    assert fuzzy_match.best_match(query, options)[0] == expected
+
+
+def test_scores_match_dense_cosine():
+    options = ['Patent leather', 'Leather', 'Suede', 'Faux leather']
+    matcher = FuzzyMatcher(options)
+
+    # 同样的 TF-IDF 用稠密矩阵计算，查询里选项没有的 n-gram 只算进查询的长度
+    grams = list(matcher.vocabulary)
+    dense = np.array([[fuzzy_match.ngrams(option)[gram] for gram in grams] for option in options]) * matcher.idf
+    query_grams = fuzzy_match.ngrams('leathr')
+    query = np.array([query_grams[gram] for gram in grams]) * matcher.idf
+    unknown = sum((count * matcher.unknown_idf) ** 2 for gram, count in query_grams.items() if gram not in matcher.vocabulary)
+    expected = dense @ query / np.linalg.norm(dense, axis=1) / np.sqrt(query @ query + unknown)
+
+    assert np.allclose(matcher.scores('leathr'), expected)
+
+
+def test_no_option():
+    assert FuzzyMatcher([]).match('Gucci') == (None, 0.0)
+
+
+def test_confident_match_skips_ai(monkeypatch):
+    def ask_ai(*args):
+        raise AssertionError('AI should not be asked')
+    monkeypatch.setattr(smart, 'ask_ai', ask_ai)
+
+    assert smart.ai_compare_option('Hermes', ['Hermès', 'Hermès X Apple', 'Other'], '', '') == 'Hermès'
+
+
+def test_offline_fallback_uses_fuzzy_match():
+    assert smart.simple_match('Navy blue', ['Black', 'Navy', 'Other']) == 'Navy'
+    assert smart.simple_match('Prada', ['Gucci', 'Other']) == 'Other'
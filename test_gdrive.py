@@ -0,0 +1,84 @@
+import io
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+import gdrive
+from download_client import DownloadClient
+
+
+INTERSTITIAL = '''<html><body>Google Drive can't scan this file for viruses.
+<form id="download-form" action="{action}" method="get">
+<input type="submit" value="Download anyway"/>
+<input type="hidden" name="id" value="FILE123">
+<input type="hidden" name="export" value="download">
+<input type="hidden" name="confirm" value="t">
+<input type="hidden" name="uuid" value="abc-1">
+</form></body></html>'''
+
+
+def test_file_id_and_download_url():
+    assert gdrive.file_id('https://drive.google.com/file/d/FILE123/view?usp=sharing') == 'FILE123'
+    assert gdrive.file_id('https://drive.google.com/uc?export=view&id=FILE123') == 'FILE123'
+    assert gdrive.download_url('https://drive.google.com/open?id=FILE123') == 'https://drive.google.com/uc?export=download&id=FILE123'
+    assert gdrive.download_url('https://cdn.example.com/a.jpg') == 'https://cdn.example.com/a.jpg'
+
+
+def test_confirm_url():
+    page = INTERSTITIAL.format(action='https://drive.usercontent.google.com/download')
+    assert gdrive.confirm_url(page) == 'https://drive.usercontent.google.com/download?id=FILE123&export=download&confirm=t&uuid=abc-1'
+
+    old_page = '<a href="/uc?export=download&amp;confirm=Ab_1&amp;id=FILE123">Download anyway</a>'
+    assert gdrive.confirm_url(old_page, drive_id='FILE123') == 'https://drive.google.com/uc?export=download&confirm=Ab_1&id=FILE123'
+
+
+@pytest.mark.parametrize('page, final_url', [
+    ('<html>You need access</html>', ''),
+    ('<html>Sign in</html>', 'https://accounts.google.com/ServiceLogin?continue=x'),
+    ('<html>Sorry, the file you have requested does not exist.</html>', ''),
+])
+def test_permanent_errors(page, final_url):
+    with pytest.raises(gdrive.DrivePermanentError):
+        gdrive.confirm_url(page, final_url)
+
+
+def test_quota_is_not_permanent():
+    with pytest.raises(gdrive.DriveError) as error:
+        gdrive.confirm_url('<html>Too many users have viewed or downloaded this file recently.</html>')
+    assert not isinstance(error.value, gdrive.DrivePermanentError)
+
+
+def test_fetch_follows_the_interstitial(tmp_path):
+    buffer = io.BytesIO()
+    Image.new('RGB', (10, 10)).save(buffer, 'JPEG')
+    image = buffer.getvalue()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith('/download?') and 'confirm=t' in self.path:
+                body, content_type = image, 'image/jpeg'
+            else:
+                body = INTERSTITIAL.format(action=f'http://127.0.0.1:{self.server.server_port}/download').encode()
+                content_type = 'text/html; charset=utf-8'
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    client = DownloadClient()
+    try:
+        result = gdrive.fetch(f'http://127.0.0.1:{httpd.server_port}/uc?id=FILE123', str(tmp_path / '1.jpg'), client=client)
+    finally:
+        client.close()
+        httpd.shutdown()
+
+    assert result.status == 200
+    assert (tmp_path / '1.jpg').read_bytes() == image
@@ -0,0 +1,123 @@
+import io
+import os
+import json
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from conftest import random_photo
+from image_handler import ImageCache, ImageConfig, ImprovedImageHandler
+
+
+def _download(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(b'x' * size)
+    return str(path)
+
+
+def test_hit_across_instances(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    cache = ImageCache(cache_dir)
+    cached_path = cache.save_to_cache('https://a/1.jpg', _download(tmp_path, 'a.jpg', 10))
+
+    assert cache.get_cached_image('https://a/1.jpg') == cached_path
+    assert ImageCache(cache_dir).get_cached_image('https://a/1.jpg') == cached_path
+    assert cache.get_cached_image('https://a/2.jpg') is None
+
+
+def test_deleted_file_is_not_returned(tmp_path):
+    cache = ImageCache(str(tmp_path / 'cache'))
+    cached_path = cache.save_to_cache('https://a/1.jpg', _download(tmp_path, 'a.jpg', 10))
+    assert cache.get_cached_image('https://a/1.jpg') == cached_path  # 进入内存缓存
+
+    os.remove(cached_path)
+
+    assert cache.get_cached_image('https://a/1.jpg') is None
+    assert cache.total_bytes == 0
+
+
+def test_expired_entry_is_removed(tmp_path, monkeypatch):
+    cache = ImageCache(str(tmp_path / 'cache'))
+    cached_path = cache.save_to_cache('https://a/1.jpg', _download(tmp_path, 'a.jpg', 10))
+
+    later = time.time() + ImageConfig.CACHE_EXPIRY_DAYS * 24 * 3600 + 1
+    monkeypatch.setattr(time, 'time', lambda: later)
+
+    assert cache.get_cached_image('https://a/1.jpg') is None
+    assert not os.path.exists(cached_path)
+
+
+def test_lru_eviction_by_bytes(tmp_path, monkeypatch):
+    monkeypatch.setattr(ImageConfig, 'CACHE_MAX_BYTES', 250)
+    cache = ImageCache(str(tmp_path / 'cache'))
+    cache.save_to_cache('https://a/1.jpg', _download(tmp_path, '1.jpg', 100))
+    cache.save_to_cache('https://a/2.jpg', _download(tmp_path, '2.jpg', 100))
+    time.sleep(0.01)
+    cache.get_cached_image('https://a/1.jpg')  # 1 最近被访问过
+
+    cache.save_to_cache('https://a/3.jpg', _download(tmp_path, '3.jpg', 100))
+
+    assert cache.total_bytes == 200
+    assert cache.get_cached_image('https://a/1.jpg')
+    assert cache.get_cached_image('https://a/2.jpg') is None
+    assert cache.get_cached_image('https://a/3.jpg')
+
+
+def test_old_metadata_is_imported(tmp_path):
+    cache_dir = tmp_path / 'cache'
+    cache_dir.mkdir()
+    file_path = _download(cache_dir, 'abc.jpg', 10)
+    (cache_dir / ImageConfig.CACHE_METADATA_FILE).write_text(json.dumps({
+        ImageCache.get_cache_key(None, 'https://a/1.jpg'): {'url': 'https://a/1.jpg', 'created_time': int(time.time()), 'file_path': file_path},
+    }))
+
+    cache = ImageCache(str(cache_dir))
+
+    assert cache.get_cached_image('https://a/1.jpg') == file_path
+    assert not (cache_dir / ImageConfig.CACHE_METADATA_FILE).exists()
+
+
+def test_expired_entry_is_revalidated(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    buffer = io.BytesIO()
+    random_photo((800, 800), cells=(24, 24)).save(buffer, 'JPEG')
+    body = buffer.getvalue()
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(self.headers.get('If-None-Match'))
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('ETag', '"v1"')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{httpd.server_port}/a.jpg'
+
+    try:
+        handler = ImprovedImageHandler()
+        first, = asyncio.run(handler.download_images_async({'Image 1': url}))
+
+        # 过期
+        handler.cache.conn.execute('UPDATE entries SET created_time = 0')
+        handler.cache._front.clear()
+        assert handler.cache.get_cached_image(url) is None
+
+        second, = asyncio.run(handler.download_images_async({'Image 1': url}))
+    finally:
+        httpd.shutdown()
+
+    assert requests == [None, '"v1"']
+    assert second == first
+    assert handler.cache.get_cached_image(url) == first
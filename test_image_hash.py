@@ -0,0 +1,54 @@
+import random
+
+from PIL import Image
+
+import image_hash
+from conftest import random_photo
+from image_index import ImageIndex
+
+
+def _photo(path, seed, size=(400, 300)):
+    random_photo(size, seed, resample=Image.BICUBIC).save(path, 'JPEG', quality=90)
+    return str(path)
+
+
+def test_bk_tree_matches_brute_force():
+    rng = random.Random(1)
+    values = [rng.getrandbits(64) for _ in range(300)]
+    tree = image_hash.BKTree()
+    for i, value in enumerate(values):
+        tree.add(value, i)
+
+    query = values[0] ^ 0b1011
+    expected = sorted(i for i, value in enumerate(values) if image_hash.hamming(query, value) <= 20)
+    assert sorted(item for _, item in tree.query(query, 20)) == expected
+
+
+def test_phash_of_a_resized_copy(tmp_path):
+    original = _photo(tmp_path / 'a.jpg', 1)
+    with Image.open(original) as img:
+        img.resize((200, 150)).save(tmp_path / 'copy.jpg', 'JPEG', quality=60)
+    other = _photo(tmp_path / 'b.jpg', 2)
+
+    assert image_hash.hamming(image_hash.phash(original), image_hash.phash(str(tmp_path / 'copy.jpg'))) <= image_hash.DUPLICATE_DISTANCE
+    assert image_hash.hamming(image_hash.phash(original), image_hash.phash(other)) > image_hash.DUPLICATE_DISTANCE
+
+
+def test_duplicates_and_collisions(tmp_path):
+    folder = tmp_path / 'products'
+    folder.mkdir()
+    _photo(folder / 'A_1.jpg', 1)
+    _photo(folder / 'A_2.jpg', 2)
+    _photo(folder / 'A_3.jpg', 1)  # A_1 的副本
+    _photo(folder / 'B_1.jpg', 3)
+    _photo(folder / 'B_2.jpg', 2)  # 放错了产品的 A_2
+    index_file = str(tmp_path / 'image_index.json')
+
+    index = ImageIndex(str(folder), index_file)
+
+    assert [path.rsplit('/', 1)[-1] for path in index.unique_images(index.lookup('A'))] == ['A_1.jpg', 'A_2.jpg']
+    collisions = index.collisions()
+    assert collisions == {'A': ['A_2.jpg looks like B_2.jpg'], 'B': ['B_2.jpg looks like A_2.jpg']}
+
+    # 哈希保存在索引里
+    assert set(ImageIndex(str(folder), index_file).hashes) == {'A_1.jpg', 'A_2.jpg', 'A_3.jpg', 'B_1.jpg', 'B_2.jpg'}
@@ -0,0 +1,36 @@
+import os
+
+from image_index import ImageIndex
+
+
+def _touch(folder, *names):
+    for name in names:
+        with open(os.path.join(folder, name), 'wb') as f:
+            f.write(b'\xff\xd8\xff')
+
+
+def test_lookup_exact_ref_natural_order(tmp_path):
+    folder = tmp_path / 'products'
+    folder.mkdir()
+    _touch(folder, 'REF1_1.jpg', 'REF1_10.jpg', 'REF1_2.jpg', 'REF10_1.jpg', 'REF1_notes.txt')
+
+    index = ImageIndex(str(folder), str(tmp_path / 'image_index.json'))
+
+    # REF10 不会被当成 REF1 的图片
+    assert [os.path.basename(path) for path in index.lookup('REF1')] == ['REF1_1.jpg', 'REF1_2.jpg', 'REF1_10.jpg']
+    assert [os.path.basename(path) for path in index.lookup('REF10')] == ['REF10_1.jpg']
+    assert index.lookup('REF2') == []
+
+
+def test_index_is_persisted_and_invalidated(tmp_path):
+    folder = tmp_path / 'products'
+    folder.mkdir()
+    index_file = str(tmp_path / 'image_index.json')
+    _touch(folder, 'A_1.jpg')
+
+    ImageIndex(str(folder), index_file)
+    assert ImageIndex(str(folder), index_file).refs == {'A': ['A_1.jpg']}
+
+    _touch(folder, 'A_2.jpg')
+    os.utime(folder, ns=(0, os.stat(folder).st_mtime_ns + 1_000_000))
+    assert len(ImageIndex(str(folder), index_file).lookup('A')) == 2
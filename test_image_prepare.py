@@ -0,0 +1,69 @@
+import os
+
+import pytest
+from PIL import Image
+
+from conftest import random_photo
+from image_handler import ImageConfig, ImageProcessor, prepare_image
+
+
+@pytest.fixture(autouse=True)
+def _quality_db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # 质量检查的缓存写到 image_cache/quality.db
+
+
+def _save(path, size, **kwargs):
+    random_photo(size).save(path, 'JPEG', **kwargs)
+    return str(path)
+
+
+def test_too_small_is_rejected(tmp_path):
+    result = prepare_image(_save(tmp_path / 'small.jpg', (400, 900)))
+    assert not result['valid']
+    assert 'too small' in result['error']
+
+
+def test_large_image_is_downscaled(tmp_path, monkeypatch):
+    monkeypatch.setattr(ImageConfig, 'MAX_DIMENSION', 1000)
+    path = _save(tmp_path / 'large.jpg', (2400, 1200))
+
+    result = prepare_image(path)
+
+    assert result['valid']
+    assert max(result['width'], result['height']) == 1000
+    with Image.open(path) as img:
+        assert img.size == (result['width'], result['height'])
+
+
+def test_exif_orientation_is_applied(tmp_path):
+    exif = Image.Exif()
+    exif[0x0112] = 6  # 顺时针旋转90度
+    path = _save(tmp_path / 'rotated.jpg', (1200, 900), exif=exif)
+
+    result = prepare_image(path)
+
+    assert result['valid']
+    assert (result['width'], result['height']) == (900, 1200)
+
+
+def test_prepare_images_keeps_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(ImageConfig, 'WORKERS', 2)
+    paths = [_save(tmp_path / f'{i}.jpg', (800 + i, 800)) for i in range(3)]
+    paths.append(str(tmp_path / 'missing.jpg'))
+
+    results = ImageProcessor().prepare_images(paths)
+
+    assert [result['path'] for result in results] == paths
+    assert [result['valid'] for result in results] == [True, True, True, False]
+    assert [result['width'] for result in results[:3]] == [800, 801, 802]
+    assert os.path.exists(paths[0])
+
+
+def test_blank_image_is_rejected(tmp_path):
+    path = str(tmp_path / 'blank.jpg')
+    Image.new('RGB', (1000, 1000), (250, 250, 250)).save(path, 'JPEG')
+
+    result = prepare_image(path)
+
+    assert not result['valid']
+    assert 'blank' in result['error']
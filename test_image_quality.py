@@ -0,0 +1,94 @@
+import shutil
+
+import pytest
+from PIL import Image, ImageFilter
+
+import image_quality
+import image_store
+from conftest import random_photo
+from image_handler import ImageProcessor, quality_thresholds
+from image_store import ImageStore
+
+
+@pytest.fixture(autouse=True)
+def _quality_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_quality, 'QUALITY_DB', str(tmp_path / 'quality.db'))
+    monkeypatch.setattr(image_quality, '_conn', None)
+
+
+def _photo(size=(1200, 900), seed=0):
+    return random_photo(size, seed)
+
+
+def _save(img, path):
+    img.save(path, 'JPEG', quality=90)
+    return str(path)
+
+
+def test_good_photo_passes(tmp_path):
+    result = image_quality.assess(_save(_photo(), tmp_path / 'good.jpg'), quality_thresholds())
+    assert result['ok'], result
+
+
+@pytest.mark.parametrize('name, make, reason', [
+    ('blank', lambda: Image.new('RGB', (1200, 900), (255, 255, 255)), 'blank'),
+    ('blurred', lambda: _photo().filter(ImageFilter.GaussianBlur(12)), 'blurred'),
+    ('tiny', lambda: _tiny_subject(), 'subject too small'),
+])
+def test_bad_photo_is_rejected(tmp_path, name, make, reason):
+    result = image_quality.assess(_save(make(), tmp_path / f'{name}.jpg'), quality_thresholds())
+    assert not result['ok']
+    assert reason in result['reasons']
+
+
+def _tiny_subject():
+    img = Image.new('RGB', (1200, 900), (240, 240, 240))
+    img.paste(_photo((80, 60)), (560, 420))
+    return img
+
+
+def test_scores_are_cached_by_content(tmp_path, monkeypatch):
+    path = _save(_photo(), tmp_path / 'a.jpg')
+    copy = str(tmp_path / 'b.jpg')
+    shutil.copyfile(path, copy)
+    first = image_quality.assess(path, quality_thresholds())
+
+    def fail(path):
+        raise AssertionError('scored twice')
+    monkeypatch.setattr(image_quality, 'score_image', fail)
+
+    assert image_quality.assess(copy, quality_thresholds())['scores'] == first['scores']
+
+
+def test_known_digest_is_not_recomputed(tmp_path, monkeypatch):
+    store = ImageStore(str(tmp_path / 'store'))
+    digest, path = store.put(_save(_photo(), tmp_path / 'a.jpg'))
+
+    def fail(path):
+        raise AssertionError('hashed again')
+    monkeypatch.setattr(image_store, 'file_digest', fail)
+
+    results = ImageProcessor().check_quality([path], [digest])
+    assert results[0]['ok'], results
+    assert image_quality.assess(path, quality_thresholds(), digest)['scores'] == results[0]['scores']
+
+
+def test_check_quality_keeps_order(tmp_path):
+    paths = [_save(_photo(seed=1), tmp_path / '1.jpg'),
+             _save(Image.new('RGB', (1200, 900), (0, 0, 0)), tmp_path / '2.jpg'),
+             _save(_photo(seed=3), tmp_path / '3.jpg')]
+
+    results = ImageProcessor().check_quality(paths)
+
+    assert [result['path'] for result in results] == paths
+    assert [result['ok'] for result in results] == [True, False, True]
+
+
+def test_check_quality_rejects_small_photos(tmp_path):
+    # save_all_pics 只经过这一步检查，尺寸和 prepare_image 一样只读文件头
+    paths = [_save(_photo((1200, 600)), tmp_path / 'small.jpg'), _save(_photo(), tmp_path / 'big.jpg')]
+
+    results = ImageProcessor().check_quality(paths)
+
+    assert [result['ok'] for result in results] == [False, True]
+    assert results[0]['reasons'] == ['too small: 1200x600']
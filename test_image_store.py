@@ -0,0 +1,83 @@
+import os
+
+from image_store import ImageStore
+
+
+def _write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+def test_put_dedupes_by_content(tmp_path):
+    store = ImageStore(str(tmp_path / 'store'))
+    a = _write(tmp_path / 'A_1.jpg', b'\xff\xd8\xff same')
+    b = _write(tmp_path / 'B_1.jpg', b'\xff\xd8\xff same')
+
+    digest_a, object_a = store.put(a)
+    digest_b, object_b = store.put(b)
+
+    assert digest_a == digest_b
+    assert object_a == object_b
+
+    # 原图不是硬链接，修改原图不会改变 store 里的文件
+    assert not os.path.samefile(a, object_a)
+    _write(a, b'\xff\xd8\xff edited')
+    with open(object_a, 'rb') as f:
+        assert f.read() == b'\xff\xd8\xff same'
+
+
+def test_hard_linked_object_is_replaced(tmp_path):
+    store = ImageStore(str(tmp_path / 'store'))
+    a = _write(tmp_path / 'A_1.jpg', b'\xff\xd8\xff data')
+    digest = store.digest(a)
+    os.makedirs(os.path.dirname(store.object_path(digest)))
+    os.link(a, store.object_path(digest))  # 旧版本放进来的
+
+    assert store.put(a) == (digest, store.object_path(digest))
+    assert not os.path.samefile(a, store.object_path(digest))
+
+
+def test_downloads_are_moved_without_a_digest_entry(tmp_path):
+    root = str(tmp_path / 'store')
+    store = ImageStore(root)
+    downloaded = _write(os.path.join(store.incoming_dir, '1.jpg'), b'\xff\xd8\xff download')
+
+    digest, object_path = store.put(downloaded, move=True)
+
+    assert not os.path.exists(downloaded)
+    assert os.path.exists(object_path)
+    assert store.digests == {}
+
+    # 旧版本保存的 incoming/ 记录在加载时去掉
+    store.digests[os.path.abspath(downloaded)] = [1, 1, digest]
+    store._digests_changed = True
+    store.save_digests()
+    assert ImageStore(root).digests == {}
+
+
+def test_stage_links_in_order(tmp_path):
+    store = ImageStore(str(tmp_path / 'store'))
+    staging = tmp_path / 'download'
+    objects = [store.put(_write(tmp_path / f'R_{i}.jpg', bytes([i]) * 10))[1] for i in (1, 2)]
+
+    staged = store.stage(objects, str(staging))
+
+    assert [os.path.basename(path) for path in staged] == ['1.jpg', '2.jpg']
+    assert os.path.samefile(staged[0], objects[0])
+
+    # 重新暂存会替换链接，store 里的文件不受影响
+    staged = store.stage(objects[::-1], str(staging))
+    assert os.path.samefile(staged[0], objects[1])
+    assert os.path.exists(objects[0])
+
+
+def test_digest_cache_is_persisted(tmp_path):
+    root = str(tmp_path / 'store')
+    path = _write(tmp_path / 'A_1.jpg', b'data')
+
+    store = ImageStore(root)
+    digest = store.digest(path)
+    store.save_digests()
+
+    assert ImageStore(root).digests[os.path.abspath(path)][2] == digest
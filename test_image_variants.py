@@ -0,0 +1,60 @@
+import os
+
+from PIL import Image
+
+from conftest import random_photo
+from image_store import ImageStore
+from image_variants import upload_params, upload_variants
+
+
+def _photo(path, size, quality=95):
+    # 有细节的图片，压缩后的大小才和质量有关
+    exif = Image.Exif()
+    exif[0x010F] = 'Camera'
+    random_photo(size, cells=size).save(path, 'JPEG', quality=quality, exif=exif)
+    return str(path)
+
+
+def test_variant_is_small_progressive_and_stripped(tmp_path):
+    store = ImageStore(str(tmp_path / 'store'))
+    params = {**upload_params(), 'max_dimension': 600, 'target_bytes': 150_000}
+    source = store.put(_photo(tmp_path / 'A_1.jpg', (1200, 900)))[1]
+
+    variant, = upload_variants([source], store, params)
+
+    assert variant != source
+    assert os.path.getsize(variant) <= 150_000
+    with Image.open(variant) as img:
+        assert max(img.size) == 600
+        assert img.info.get('progressive')
+        assert not img.getexif()
+
+
+def test_variant_is_cached(tmp_path):
+    store = ImageStore(str(tmp_path / 'store'))
+    params = {**upload_params(), 'max_dimension': 400}
+    source = store.put(_photo(tmp_path / 'A_1.jpg', (800, 600)))[1]
+
+    first, = upload_variants([source], store, params)
+    mtime = os.stat(first).st_mtime_ns
+    second, = upload_variants([source], store, params)
+
+    assert first == second
+    assert os.stat(second).st_mtime_ns == mtime
+
+    # 参数不同是另一个变体
+    other, = upload_variants([source], store, {**params, 'max_dimension': 300})
+    assert other != first
+
+
+def test_small_source_is_still_stripped(tmp_path):
+    # 原图的质量很低，重新编码不会更小，上传的仍然是去掉 EXIF 的渐进式图片
+    store = ImageStore(str(tmp_path / 'store'))
+    source = store.put(_photo(tmp_path / 'A_1.jpg', (200, 150), quality=30))[1]
+
+    variant, = upload_variants([source], store, upload_params())
+
+    with Image.open(variant) as img:
+        assert img.size == (200, 150)
+        assert img.info.get('progressive')
+        assert not img.getexif()
@@ -0,0 +1,162 @@
+import json
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from llm_client import LLMClient
+
+
+OPTIONS = ['Saint Laurent', 'Yves Saint Laurent', 'Louis Vuitton', 'Other']
+
+
+@pytest.fixture
+def stub():
+    """Local OpenAI-compatible server, answers[i] is used for the i-th request: (status, content, delay)"""
+    state = {'answers': [], 'requests': [], 'running': 0, 'most': 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            with lock:
+                index = len(state['requests'])
+                state['requests'].append(body)
+                state['running'] += 1
+                state['most'] = max(state['most'], state['running'])
+            status, content, delay = state['answers'][min(index, len(state['answers']) - 1)]
+            time.sleep(delay)
+            with lock:
+                state['running'] -= 1
+
+            data = json.dumps({
+                'id': f'chatcmpl-{index}', 'object': 'chat.completion', 'created': 0, 'model': body['model'],
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2},
+            } if status == 200 else {'error': {'message': content, 'type': 'server_error'}}).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    state['url'] = f'http://127.0.0.1:{httpd.server_port}/v1'
+    yield state
+    httpd.shutdown()
+
+
+def _client(stub, **kwargs):
+    return LLMClient(api_key='test', base_url=stub['url'], **kwargs)
+
+
+def test_answer(stub):
+    stub['answers'] = [(200, 'Saint Laurent', 0)]
+    client = _client(stub)
+    try:
+        decision = client.choose_sync('YSL', OPTIONS)
+    finally:
+        client.close()
+
+    assert decision.name == 'Saint Laurent'
+    assert not decision.degraded
+    assert 'YSL' in stub['requests'][0]['messages'][1]['content']
+
+
+def test_server_error_is_retried(stub):
+    stub['answers'] = [(500, 'overloaded', 0), (200, 'Saint Laurent', 0)]
+    client = _client(stub)
+    try:
+        decision = client.choose_sync('YSL', OPTIONS)
+    finally:
+        client.close()
+
+    assert decision.name == 'Saint Laurent'
+    assert len(stub['requests']) == 2
+
+
+def test_deadline_degrades_to_fuzzy_match(stub):
+    stub['answers'] = [(200, 'Louis Vuitton', 5)]
+    client = _client(stub, deadline=0.5)
+    try:
+        started = time.monotonic()
+        decision = client.choose_sync('Louis Vuiton', OPTIONS)
+        elapsed = time.monotonic() - started
+    finally:
+        client.close()
+
+    assert decision.degraded
+    assert decision.name == 'Louis Vuitton'
+    assert elapsed < 1.5
+    assert client.stats()['degraded'] == 1
+
+
+def test_invalid_answer_degrades(stub):
+    stub['answers'] = [(200, 'Prada', 0)]
+    client = _client(stub)
+    try:
+        decision = client.choose_sync('Hermes', OPTIONS)
+    finally:
+        client.close()
+
+    assert decision.degraded
+    assert decision.name == 'Other'
+
+
+def test_batch(stub):
+    stub['answers'] = [(200, json.dumps({'YSL': 'Saint Laurent', 'LV': 'Prada'}), 0)]
+    client = _client(stub)
+    try:
+        answers = client.choose_batch_sync('brand', {'YSL': OPTIONS, 'LV': OPTIONS})
+    finally:
+        client.close()
+
+    assert answers == {'YSL': 'Saint Laurent'}
+
+
+def test_batch_answer_in_a_code_fence(stub):
+    answer = json.dumps({'YSL': 'Saint Laurent'})
+    stub['answers'] = [(200, f'Here you go:\n```json\n{answer}\n```', 0)]
+    client = _client(stub)
+    try:
+        answers = client.choose_batch_sync('brand', {'YSL': OPTIONS})
+    finally:
+        client.close()
+
+    assert answers == {'YSL': 'Saint Laurent'}
+    assert stub['requests'][0]['response_format'] == {'type': 'json_object'}
+
+
+def test_batch_deadline_grows_with_the_batch(stub):
+    stub['answers'] = [(200, json.dumps({'YSL': 'Saint Laurent', 'LV': 'Louis Vuitton'}), 0.8)]
+    client = _client(stub, deadline=0.4, batch_seconds_per_value=1)
+    try:
+        # 单个匹配的期限内等不到，两个值的批量请求有 2.4 秒
+        assert client.choose_sync('YSL', OPTIONS).degraded
+        answers = client.choose_batch_sync('brand', {'YSL': OPTIONS, 'LV': OPTIONS})
+    finally:
+        client.close()
+
+    assert answers == {'YSL': 'Saint Laurent', 'LV': 'Louis Vuitton'}
+
+
+def test_concurrency_is_bounded(stub):
+    stub['answers'] = [(200, 'Other', 0.1)]
+    client = _client(stub, max_concurrent=2)
+
+    async def run():
+        return await asyncio.gather(*(client.choose(f'Brand {i}', OPTIONS) for i in range(6)))
+
+    try:
+        decisions = asyncio.run(run())
+    finally:
+        client.close()
+
+    assert [decision.name for decision in decisions] == ['Other'] * 6
+    assert stub['most'] == 2
@@ -0,0 +1,85 @@
+import csv
+import json
+
+import odoo_manifest
+from odoo_manifest import OdooManifest, load_manifest
+
+
+def _write_csv(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _detailed(ref, urls, main=None):
+    return [{'产品编号': ref, '图片序号': number, 'CDN_URL': url, '是否主图': '是' if url == main else '否'}
+            for number, url in urls]
+
+
+def test_main_image_first(tmp_path):
+    # 序号打乱，主图不是第一张
+    _write_csv(tmp_path / odoo_manifest.DETAILED_IMAGES_FILE,
+               _detailed('A1', [(3, 'https://cdn/a3.jpg'), (1, 'https://cdn/a1.jpg'), (2, 'https://cdn/a2.jpg')],
+                         main='https://cdn/a2.jpg'))
+    (tmp_path / odoo_manifest.ODOO_JSON_FILE).write_text(json.dumps({
+        'B1': {'main_image_url': 'https://cdn/main.jpg', 'spaces_image_urls': 'https://cdn/b1.jpg\nhttps://cdn/b2.jpg'},
+    }))
+
+    manifest = OdooManifest(str(tmp_path))
+
+    assert manifest.get('A1')['images'] == ['https://cdn/a2.jpg', 'https://cdn/a1.jpg', 'https://cdn/a3.jpg']
+    assert manifest.get(' B1 ')['images'] == ['https://cdn/main.jpg', 'https://cdn/b1.jpg', 'https://cdn/b2.jpg']
+    assert manifest.get('B1')['main_image'] == 'https://cdn/main.jpg'
+
+
+def test_detailed_images_win_over_json_and_csv(tmp_path):
+    _write_csv(tmp_path / odoo_manifest.DETAILED_IMAGES_FILE, _detailed('A1', [(1, 'https://cdn/detailed.jpg')]))
+    (tmp_path / odoo_manifest.ODOO_JSON_FILE).write_text(json.dumps({
+        'A1': {'spaces_image_urls': 'https://cdn/json-a.jpg'},
+        'B1': {'spaces_image_urls': '', 'gallery_image_urls': 'https://cdn/json-b.jpg'},
+    }))
+    _write_csv(tmp_path / odoo_manifest.ODOO_CSV_FILE, [
+        {'产品编号': 'A1', '主图URL': '', '所有图片URLs': 'https://cdn/csv-a.jpg', '展示图片URLs': '', '图片数量': ''},
+        {'产品编号': 'B1', '主图URL': '', '所有图片URLs': 'https://cdn/csv-b.jpg', '展示图片URLs': '', '图片数量': ''},
+        {'产品编号': 'C1', '主图URL': '', '所有图片URLs': 'https://cdn/c1.jpg | https://cdn/c2.jpg', '展示图片URLs': '',
+         '图片数量': '2'},
+    ])
+
+    manifest = load_manifest(str(tmp_path))
+
+    assert len(manifest) == 3
+    assert manifest.get('A1')['images'] == ['https://cdn/detailed.jpg']
+    assert manifest.get('B1')['images'] == ['https://cdn/json-b.jpg']
+    assert manifest.get('C1')['images'] == ['https://cdn/c1.jpg', 'https://cdn/c2.jpg']
+
+
+def test_merge_keeps_the_workbook_images(tmp_path):
+    _write_csv(tmp_path / odoo_manifest.DETAILED_IMAGES_FILE,
+               _detailed('A1', [(1, 'https://cdn/a1.jpg')]) + _detailed('B1', [(1, 'https://cdn/b1.jpg')]))
+    manifest = OdooManifest(str(tmp_path))
+    rows = [
+        {'External reference': 'A1', 'Image 1': ''},
+        {'External reference': 'B1', 'Image 1': 'https://drive/b1.jpg'},
+        {'External reference': 'Z9', 'Image 1': ''},
+    ]
+
+    assert list(manifest.merge(rows)) == [
+        {'External reference': 'A1', 'Image 1': 'https://cdn/a1.jpg'},
+        {'External reference': 'B1', 'Image 1': 'https://drive/b1.jpg'},
+        {'External reference': 'Z9', 'Image 1': ''},
+    ]
+
+
+def test_image_fields_are_capped(tmp_path):
+    urls = [(i, f'https://cdn/a{i}.jpg') for i in range(1, odoo_manifest.MAX_IMAGES + 5)]
+    _write_csv(tmp_path / odoo_manifest.DETAILED_IMAGES_FILE, _detailed('A1', urls))
+
+    fields = OdooManifest(str(tmp_path)).image_fields('A1')
+
+    assert list(fields) == [f'Image {i}' for i in range(1, odoo_manifest.MAX_IMAGES + 1)]
+    assert fields['Image 1'] == 'https://cdn/a1.jpg'
+
+
+def test_no_manifest(tmp_path):
+    assert load_manifest(str(tmp_path)) is None
@@ -0,0 +1,113 @@
+import pytest
+
+import decision_cache
+import option_catalog
+import smart
+from decision_cache import DecisionCache
+from option_catalog import OptionCatalog
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    catalog = OptionCatalog(str(tmp_path / 'catalog.db'))
+    monkeypatch.setattr(option_catalog, '_catalog', catalog)
+    monkeypatch.setattr(decision_cache, '_cache', DecisionCache(str(tmp_path / 'decisions.db')))
+    return catalog
+
+
+def test_options_accumulate(catalog):
+    assert catalog.record('brand', ['Hermès', 'Hermès X Apple']) == 2
+    assert catalog.record('brand', ['Hermès', 'No Results Found']) == 0
+    assert catalog.field_version('brand') == 1
+    assert catalog.record('brand', ['Gucci']) == 1
+
+    reopened = OptionCatalog(catalog.path)
+    assert reopened.options('brand') == ['Hermès', 'Hermès X Apple', 'Gucci']
+    assert reopened.field_version('brand') == 2
+    assert OptionCatalog(catalog.path, version=2).options('brand') == []
+
+
+def test_resolve(catalog):
+    catalog.record('brand', ['Hermès', 'Hermès X Apple', 'Saint Laurent', 'Yves Saint Laurent'])
+
+    assert catalog.resolve('brand', 'HERMES') == 'Hermès'
+    assert catalog.resolve('brand', 'YSL') is None
+    assert catalog.resolve('color', 'Black') is None
+
+    catalog.remember('brand', 'YSL', 'Saint Laurent', 'ai')
+    assert OptionCatalog(catalog.path).resolve('brand', ' ysl') == 'Saint Laurent'
+
+
+def test_resolve_product(catalog):
+    catalog.record(option_catalog.category_field('Women'), ['Bags', 'Shoes'])
+    catalog.record(option_catalog.subcategory_field('Bags'), ['Handbags', 'Others'])
+    catalog.record('color', ['Black', 'Other'])
+    product = {'Gender': 'Women', 'Category': 'Bags', 'Details - Category': 'handbags', 'Brand': 'Gucci',
+               'Material': 'Leather', 'Color': 'black', 'Pattern': ''}
+
+    assert catalog.resolve_product(product) == {
+        'category/Women': 'Bags',
+        'subcategory/bags': 'Handbags',
+        'color': 'Black',
+    }
+
+
+class _Element:
+    def __init__(self, tab, text=''):
+        self.tab = tab
+        self.text = text
+
+    def click(self):
+        self.tab.clicked.append(self.text)
+
+
+class _Tab:
+    """The list of li options of an autocomplete field"""
+
+    def __init__(self, options):
+        self.options = options
+        self.clicked = []
+        self.lists_read = 0
+
+    def ele(self, locator, timeout=None):
+        if '{replace_name}' not in locator and '=' in locator and locator.endswith("']"):
+            name = locator.rsplit("='", 1)[1][:-2]
+            return _Element(self, name) if name in self.options else None
+        self.lists_read += 1
+        return _Element(self, '\n'.join(self.options))
+
+
+OPTIONS_XPATH = "xpath://ul/li[@data-component-id='color']/.."
+CLICK_RULE = "xpath://ul/li[@data-component-id='color' and normalize-space()='{replace_name}']"
+
+
+def test_smart_click_records_and_resolves(catalog):
+    tab = _Tab(['Black', 'Navy', 'Other'])
+    smart.smart_click(tab, 'click', OPTIONS_XPATH, CLICK_RULE, 'black', field='color')
+
+    assert tab.clicked == ['Black']
+    assert catalog.options('color') == ['Black', 'Navy', 'Other']
+
+    # 第二次直接点击，不再读列表
+    tab = _Tab(['Black', 'Navy', 'Other'])
+    smart.smart_click(tab, 'click', OPTIONS_XPATH, CLICK_RULE, 'black', field='color',
+                      resolved=catalog.resolve('color', 'black'))
+
+    assert tab.clicked == ['Black']
+    assert tab.lists_read == 0
+
+
+def test_hint_is_checked_against_the_page(catalog):
+    catalog.record('brand', ['Saint Laurent', 'Other'])
+    catalog.remember_hint('brand', 'YSL', 'Saint Laurent')
+    assert not catalog.remember_hint('brand', 'Prada', 'Other')
+
+    tab = _Tab(['Saint Laurent', 'Yves Saint Laurent', 'Other'])
+    smart.smart_click(tab, 'click', OPTIONS_XPATH, CLICK_RULE, 'YSL', field='brand')
+    assert tab.clicked == ['Saint Laurent']
+
+    # 提示的选项不在页面的列表里时照常匹配
+    catalog.remember_hint('brand', 'LV', 'Lanvin')
+    tab = _Tab(['Louis Vuitton', 'Other'])
+    smart.smart_click(tab, 'click', OPTIONS_XPATH, CLICK_RULE, 'LV', field='brand')
+    assert tab.clicked == ['Other']
@@ -0,0 +1,73 @@
+import time
+import threading
+
+import pre_resolve
+from option_catalog import OptionCatalog
+
+
+BRANDS = ['Hermès', 'Saint Laurent', 'Louis Vuitton', 'Gucci', 'Other']
+
+
+def _product(brand, color='Black'):
+    return {'Gender': 'Women', 'Category': 'Bags', 'Brand': brand, 'Color': color}
+
+
+def test_distinct_pairs():
+    pairs = pre_resolve.distinct_pairs([_product('Gucci'), _product(' gucci'), _product('Prada', '')])
+
+    assert pairs[('brand', 'Gucci')] == 2
+    assert pairs[('brand', 'Prada')] == 1
+    assert pairs[('color', 'Other')] == 1
+    assert len([pair for pair in pairs if pair[0] == 'brand']) == 2
+
+
+def test_unresolved_values_are_asked_in_batches(tmp_path):
+    catalog = OptionCatalog(str(tmp_path / 'catalog.db'))
+    catalog.record('brand', BRANDS)
+    requests = []
+
+    def ask(field, candidates):
+        requests.append((field, dict(candidates)))
+        return {'YSL': 'Saint Laurent', 'LV': 'Louis Vuitton', 'Prada': 'Other'}
+
+    products = [_product('Hermes'), _product('YSL'), _product('LV'), _product('Prada'), _product('YSL')]
+    stats = pre_resolve.pre_resolve(products, catalog, ask=ask, batch_size=2)
+
+    # Hermes 能直接确定；颜色还没有选项，不问 AI
+    assert [field for field, _ in requests] == ['brand', 'brand']
+    assert sorted(value for _, batch in requests for value in batch) == ['LV', 'Prada', 'YSL']
+    assert all('Other' in options for _, batch in requests for options in batch.values())
+    assert stats == {'values': 9, 'resolved': 1, 'ai': 2, 'unresolved': 6}  # 4 个品牌，还有分类、子分类、材料、颜色、图案
+
+    # 只是提示，浏览器在页面的列表里确认；从部分选项里选的 Other 不保存
+    assert catalog.resolve('brand', 'ysl') is None
+    assert catalog.hint('brand', 'ysl') == 'Saint Laurent'
+    assert catalog.hint('brand', 'Prada') is None
+
+    # 下次只问还没有提示的值
+    requests.clear()
+    assert pre_resolve.pre_resolve(products, catalog, ask=ask)['ai'] == 2
+    assert [sorted(batch) for _, batch in requests] == [['Prada']]
+
+
+def test_concurrent_requests_are_limited(tmp_path):
+    catalog = OptionCatalog(str(tmp_path / 'catalog.db'))
+    catalog.record('brand', BRANDS)
+    lock = threading.Lock()
+    running = []
+    most = []
+
+    def ask(field, candidates):
+        with lock:
+            running.append(1)
+            most.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+        return {}
+
+    products = [_product(f'Brand {i}') for i in range(8)]
+    pre_resolve.pre_resolve(products, catalog, ask=ask, batch_size=1, max_concurrent=2)
+
+    assert len(most) == 8
+    assert max(most) == 2
@@ -0,0 +1,131 @@
+import csv
+
+import pandas as pd
+from openpyxl import Workbook
+
+import preflight
+import table
+from work_queue import WorkQueue, DONE, PENDING
+
+
+def _product(**values):
+    product = {
+        'External reference': '802419 RENE WS04SH',
+        'Gender': 'Women',
+        'Category': 'Shoes',
+        'Brand': 'Rene Caovilla',
+        'Conditions': 'Never worn, with tag',
+        'Price': 1200,
+        'Size - standard': 'EU',
+        'Size - value': '38',
+        'Bracelet': '',
+        'Mechanism': '',
+    }
+    product.update(values)
+    return product
+
+
+def test_normalize_frame():
+    df = pd.DataFrame({
+        'Brand': ['  Hermès ', 'Gucci'],
+        'Price': ['€ 1,200', '99,5'],
+        'Size - value': ['38,5 EU', 'Medium'],
+    })
+
+    df = preflight.normalize_frame(df)
+
+    assert df['Brand'].tolist() == ['Hermès', 'Gucci']
+    assert df['Price'].tolist() == [1200.0, 99.5]
+    assert df['Size - value'].tolist() == ['38.5', 'Medium']
+
+
+def test_validate_rows(tmp_path):
+    report_path = str(tmp_path / 'Preflight.csv')
+    rows = [
+        _product(),
+        _product(**{'External reference': 'A', 'Price': 'on request'}),
+        _product(**{'External reference': 'B', 'Category': 'Watches', 'Mechanism': 'Automatic'}),
+        _product(**{'External reference': 'C', 'Conditions': ' '}),
+    ]
+
+    valid = list(preflight.validate_rows(rows, report_path, chunk_size=2))
+
+    assert [row['External reference'] for row in valid] == ['802419 RENE WS04SH']
+    with open(report_path, newline='', encoding='utf-8') as report_file:
+        report = list(csv.DictReader(report_file))
+    assert report == [
+        {'Row': '2', 'External reference': 'A', 'Errors': 'Price is not a number', 'Warnings': ''},
+        {'Row': '3', 'External reference': 'B', 'Errors': 'Missing Bracelet for watches', 'Warnings': ''},
+        {'Row': '4', 'External reference': 'C', 'Errors': 'Missing Conditions', 'Warnings': ''},
+    ]
+
+
+def test_validate_rows_reports_warnings(tmp_path):
+    report_path = str(tmp_path / 'Preflight.csv')
+    rows = [_product(), _product(**{'External reference': 'A', 'Price': ''})]
+    warnings = {'802419 RENE WS04SH': ['_3.jpg looks like B_1.jpg'], 'A': ['_1.jpg looks like C_1.jpg']}
+
+    valid = list(preflight.validate_rows(rows, report_path, warnings=warnings))
+
+    # 警告不会让产品被跳过
+    assert [row['External reference'] for row in valid] == ['802419 RENE WS04SH']
+    with open(report_path, newline='', encoding='utf-8') as report_file:
+        report = list(csv.DictReader(report_file))
+    assert report == [
+        {'Row': '1', 'External reference': '802419 RENE WS04SH', 'Errors': '', 'Warnings': '_3.jpg looks like B_1.jpg'},
+        {'Row': '2', 'External reference': 'A', 'Errors': 'Missing Price', 'Warnings': '_1.jpg looks like C_1.jpg'},
+    ]
+
+
+def test_report_uses_the_excel_row_numbers(tmp_path):
+    path = tmp_path / 'products.xlsx'
+    report_path = str(tmp_path / 'Preflight.csv')
+    columns = list(_product())
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(columns)
+    sheet.append(list(_product().values()))
+    sheet.append([])  # 空行
+    sheet.append(list(_product(**{'External reference': 'A', 'Price': None}).values()))
+    sheet.append(list(_product(**{'External reference': 'B', 'Price': 'on request'}).values()))
+    workbook.save(path)
+
+    valid = list(preflight.validate_rows(table.iter_excel_rows(path, row_numbers=True), report_path, chunk_size=2))
+
+    assert [row['External reference'] for row in valid] == ['802419 RENE WS04SH']
+    with open(report_path, newline='', encoding='utf-8') as report_file:
+        report = list(csv.DictReader(report_file))
+    assert report == [
+        {'Row': '4', 'External reference': 'A', 'Errors': 'Missing Price', 'Warnings': ''},
+        {'Row': '5', 'External reference': 'B', 'Errors': 'Price is not a number', 'Warnings': ''},
+    ]
+
+
+def test_rows_do_not_depend_on_the_chunk(tmp_path):
+    report_path = str(tmp_path / 'Preflight.csv')
+    product = _product(**{'External reference': 'A', 'Price': 100})
+    other = _product(**{'External reference': 'B', 'Price': '99,5', 'Image 1': 'https://a/1.jpg'})
+
+    alone, = preflight.validate_rows([product], report_path)
+    together, _ = preflight.validate_rows([product, other], report_path)
+
+    assert alone == together
+    assert together['Price'] == 100 and isinstance(together['Price'], int)
+    assert 'Image 1' not in together
+
+
+def test_fixed_row_does_not_requeue_finished_rows(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.db'))
+    report_path = str(tmp_path / 'Preflight.csv')
+    valid = _product(**{'External reference': 'A', 'Price': 100, 'Image 1': 'https://a/1.jpg'})
+    sheet = [valid, _product(**{'External reference': 'B', 'Price': 'on request'})]
+
+    queue.push_many(preflight.validate_rows(sheet, report_path))
+    item_id, _, _ = queue.claim()
+    queue.complete(item_id)
+
+    # B 的价格改好之后重新导入，A 没有变化，不会再排队
+    sheet[1]['Price'] = 1200
+    queue.push_many(preflight.validate_rows(sheet, report_path))
+
+    assert queue.counts() == {DONE: 1, PENDING: 1}
@@ -0,0 +1,28 @@
+import csv
+
+from openpyxl import load_workbook
+
+from result_sink import ResultSink, export_results
+
+
+def test_export_fixed_schema(tmp_path):
+    db_path = str(tmp_path / 'results.db')
+    sink = ResultSink('2025-01-01 10_00_00', path=db_path)
+
+    sink.write(1, {'Unfinished Steps': 0, 'Draft URL': 'https://x/?id=1', 'Error': 'Success', 'Brand': 'Hermès', 'Price': 100})
+    # 第二行的字段顺序和数量都不一样
+    sink.write(2, {'Unfinished Steps': 4, 'Draft URL': 'https://x/', 'Error': 'Failed', 'Price': 200, 'Bracelet': 'Steel'})
+    sink.close()
+
+    save_path = export_results('2025-01-01 10_00_00', 'csv', db_path, str(tmp_path))
+    with open(save_path, newline='', encoding='utf-8') as csvfile:
+        rows = list(csv.reader(csvfile))
+
+    assert rows[0] == ['Unfinished Steps', 'Draft URL', 'Error', 'Brand', 'Price', 'Bracelet']
+    assert rows[1] == ['0', 'https://x/?id=1', 'Success', 'Hermès', '100', '']
+    assert rows[2] == ['4', 'https://x/', 'Failed', '', '200', 'Steel']
+
+    save_path = export_results('2025-01-01 10_00_00', 'xlsx', db_path, str(tmp_path))
+    sheet = load_workbook(save_path).active
+    assert sheet.max_row == 3
+    assert [path.name for path in tmp_path.iterdir() if path.name.startswith('.Result_')] == []
@@ -0,0 +1,109 @@
+import pytest
+
+import page_state
+import pics
+import vestiaire
+
+
+class _Wait:
+    def __init__(self, tab):
+        self.tab = tab
+
+    def __call__(self, seconds=0):
+        pass
+
+    def ele_displayed(self, locator, timeout=None, raise_err=None):
+        return self.tab.ele(locator)
+
+    def ele_deleted(self, locator, timeout=None):
+        return True
+
+
+class _Click:
+    def __init__(self, element):
+        self.element = element
+
+    def __call__(self, by_js=None):
+        self.element.tab.clicked.append(self.element.locator)
+
+    def to_upload(self, files):
+        self.element.tab.uploaded += files
+
+
+class _Element:
+    def __init__(self, tab, locator, tag='button', text=''):
+        self.tab = tab
+        self.locator = locator
+        self.tag = tag
+        self.text = text
+        self.click = _Click(self)
+
+    def clear(self, by_js=False):
+        self.tab.values[self.locator] = ''
+
+
+class _Actions:
+    def __init__(self, tab):
+        self.tab = tab
+        self.target = None
+
+    def click(self, locator):
+        self.target = locator
+        return self
+
+    def type(self, text):
+        self.tab.values[self.target] = self.tab.values.get(self.target, '') + text  # 和浏览器一样接在后面
+        return self
+
+
+class _Tab:
+    """A draft reopened by resume_draft, part of the step was filled by the crashed run"""
+
+    def __init__(self, values=None, photos=0):
+        self.values = dict(values or {})
+        self.photos = photos
+        self.clicked = []
+        self.uploaded = []
+        self.wait = _Wait(self)
+        self.actions = _Actions(self)
+
+    def ele(self, locator, timeout=None):
+        if locator in self.values:
+            return _Element(self, locator, tag='input')
+        if 'photoSection' in locator:
+            return _Element(self, locator, tag='p', text='Add at least 3 photos')
+        if 'data-component-id' in locator or 'input' in locator:
+            return None
+        return _Element(self, locator)
+
+    def run_js(self, script, *args):
+        if script == page_state.PROBE_JS:
+            return {'url': '', 'title': '', 'ready_state': 'complete', 'completed_steps': 1, 'step': 2,
+                    'photos': self.photos, 'errors': [], 'continue_button': 'enabled'}
+
+
+COLOR_INPUT = 'css:input[id="color"]'
+
+
+def test_partly_filled_input_is_typed_again(monkeypatch):
+    tab = _Tab({COLOR_INPUT: 'Bla'})
+    monkeypatch.setattr(vestiaire.smart, 'smart_click', lambda *args, **kwargs: None)
+
+    vestiaire.input_search_click(tab, COLOR_INPUT, "xpath://ul/li[@data-component-id='color']/..",
+                                 "xpath://ul/li[@data-component-id='color' and normalize-space()='{replace_name}']",
+                                 'Black')
+
+    assert tab.values[COLOR_INPUT] == 'Black'
+
+
+@pytest.mark.parametrize('photos, uploaded', [
+    (0, ['1.jpg', '2.jpg', '3.jpg']),
+    (2, ['3.jpg']),
+    (3, []),
+])
+def test_photos_already_on_the_draft_are_not_uploaded_again(monkeypatch, photos, uploaded):
+    tab = _Tab(photos=photos)
+    monkeypatch.setattr(pics, 'save_all_pics', lambda product_data: ['1.jpg', '2.jpg', '3.jpg'])
+
+    assert vestiaire.submit_step2_photos(tab, {'External reference': 'A'}) is True
+    assert tab.uploaded == uploaded
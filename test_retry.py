@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+import retry
+
+
+FAST = retry.RetryPolicy(attempts=4, base_delay=0, max_delay=0)
+
+
+def _flaky(failures, error):
+    calls = []
+
+    def func():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise error
+        return 'ok'
+
+    return func, calls
+
+
+def test_retryable_error_is_retried():
+    func, calls = _flaky(2, ConnectionError('reset'))
+    assert retry.call(func, policy=FAST) == 'ok'
+    assert len(calls) == 3
+
+
+@pytest.mark.parametrize('error', [retry.PermanentError('not an image'), retry.HTTPStatusError(404)])
+def test_permanent_error_is_not_retried(error):
+    func, calls = _flaky(5, error)
+    with pytest.raises(type(error)):
+        retry.call(func, policy=FAST)
+    assert len(calls) == 1
+
+
+def test_throttling_is_retried():
+    func, calls = _flaky(1, retry.HTTPStatusError(429))
+    assert retry.call(func, policy=FAST) == 'ok'
+
+
+def test_budget_stops_retries():
+    policy = retry.RetryPolicy(attempts=10, base_delay=5, min_delay=5, max_delay=5, budget=1)
+    func, calls = _flaky(5, TimeoutError())
+    with pytest.raises(TimeoutError):
+        retry.call(func, policy=policy)
+    assert len(calls) == 1
+
+
+def test_circuit_breaker_fails_fast(monkeypatch):
+    breaker = retry.CircuitBreaker('cdn', failure_threshold=2, reset_timeout=60)
+    func, calls = _flaky(100, ConnectionError('down'))
+
+    with pytest.raises(ConnectionError):
+        retry.call(func, policy=FAST, breaker=breaker)
+    assert len(calls) == 2  # 第二次失败后打开
+    with pytest.raises(retry.CircuitOpenError):
+        retry.call(func, policy=FAST, breaker=breaker)
+    assert len(calls) == 2
+
+    # reset_timeout 之后半开，试探成功就关闭
+    monkeypatch.setattr(breaker, 'opened_at', breaker.opened_at - 61)
+    assert breaker.state == 'half-open'
+    assert retry.call(lambda: 'ok', policy=FAST, breaker=breaker) == 'ok'
+    assert breaker.state == 'closed'
+
+
+def test_permanent_error_during_probe_closes_the_breaker(monkeypatch):
+    breaker = retry.CircuitBreaker('cdn', failure_threshold=1, reset_timeout=60)
+    with pytest.raises(retry.HTTPStatusError):
+        retry.call(_flaky(1, retry.HTTPStatusError(503))[0], policy=FAST, breaker=breaker)
+    assert breaker.state == 'open'
+
+    # 半开时试探的是一张不存在的图片 (404)，主机本身是正常的
+    monkeypatch.setattr(breaker, 'opened_at', breaker.opened_at - 61)
+    with pytest.raises(retry.HTTPStatusError):
+        retry.call(_flaky(1, retry.HTTPStatusError(404))[0], policy=FAST, breaker=breaker)
+
+    assert breaker.state == 'closed'
+    assert retry.call(lambda: 'ok', policy=FAST, breaker=breaker) == 'ok'
+
+
+def test_call_async():
+    calls = []
+
+    async def func():
+        calls.append(1)
+        if len(calls) < 2:
+            raise ConnectionError()
+        return 'ok'
+
+    assert asyncio.run(retry.call_async(func, policy=FAST)) == 'ok'
+    assert len(calls) == 2
@@ -0,0 +1,72 @@
+import re
+import zipfile
+
+from openpyxl import Workbook
+
+import table
+from work_queue import WorkQueue
+
+
+def _make_workbook(path, rows):
+    workbook = Workbook()
+    sheet = workbook.active
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+
+def test_iter_excel_rows(tmp_path):
+    path = tmp_path / 'products.xlsx'
+    _make_workbook(path, [
+        ['External reference', 'Brand', 'Price', 'Size - value'],
+        ['802419 RENE WS04SH', 'Rene Caovilla', 1200.0, None],
+        [None, None, None, None],
+        ['802551 RENE WS04SH', 'Rene Caovilla', 950.5, '38'],
+    ])
+
+    rows = table.iter_excel_rows(path)
+
+    # 生成器按行读取，而不是一次性返回列表
+    assert not isinstance(rows, list)
+    assert list(rows) == [
+        {'External reference': '802419 RENE WS04SH', 'Brand': 'Rene Caovilla', 'Price': 1200, 'Size - value': ''},
+        {'External reference': '802551 RENE WS04SH', 'Brand': 'Rene Caovilla', 'Price': 950.5, 'Size - value': '38'},
+    ]
+
+
+def test_wrong_sheet_dimension(tmp_path):
+    path = tmp_path / 'products.xlsx'
+    _make_workbook(path, [
+        ['External reference', 'Brand', 'Price'],
+        ['802419 RENE WS04SH', 'Rene Caovilla', 1200],
+        ['802551 RENE WS04SH', 'Rene Caovilla', 950],
+    ])
+
+    # 保存的范围只有前两列、两行，和其他工具写的文件一样
+    with zipfile.ZipFile(path) as original:
+        files = {name: original.read(name) for name in original.namelist()}
+    sheet = files['xl/worksheets/sheet1.xml'].decode()
+    files['xl/worksheets/sheet1.xml'] = re.sub(r'<dimension ref="[^"]*"', '<dimension ref="A1:B2"', sheet).encode()
+    with zipfile.ZipFile(path, 'w') as broken:
+        for name, data in files.items():
+            broken.writestr(name, data)
+
+    assert list(table.iter_excel_rows(path)) == [
+        {'External reference': '802419 RENE WS04SH', 'Brand': 'Rene Caovilla', 'Price': 1200},
+        {'External reference': '802551 RENE WS04SH', 'Brand': 'Rene Caovilla', 'Price': 950},
+    ]
+
+
+def test_excel_to_list_of_dicts(tmp_path):
+    path = tmp_path / 'products.xlsx'
+    _make_workbook(path, [['Brand', 'Color'], ['Hermès', 'Black']])
+
+    assert table.excel_to_list_of_dicts(path) == [{'Brand': 'Hermès', 'Color': 'Black'}]
+
+
+def test_dicts_to_queue(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.db'))
+    products = ({'External reference': f'REF{i}'} for i in range(1, 1200))
+
+    assert table.dicts_to_queue(products, queue) == 1199
+    assert queue.next_pending_index() == 1
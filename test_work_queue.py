@@ -0,0 +1,138 @@
+from work_queue import WorkQueue, DONE, FAILED, PENDING
+
+
+def test_claim_in_row_order(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.db'))
+    queue.push_many([{'External reference': 'A'}, {'External reference': 'B'}, {'External reference': 'C'}])
+
+    first = queue.claim()
+    second = queue.claim()
+    assert first[1:] == (1, {'External reference': 'A'})
+    assert second[1:] == (2, {'External reference': 'B'})
+
+    queue.complete(first[0])
+    queue.fail(second[0], 'Failed in the Category step')
+
+    assert queue.counts() == {DONE: 1, FAILED: 1, PENDING: 1}
+    assert queue.claim()[1] == 3
+    assert queue.claim() is None
+
+
+def test_recover_in_progress(tmp_path):
+    path = str(tmp_path / 'queue.db')
+    queue = WorkQueue(path)
+    queue.push_many([{'External reference': 'A'}, {'External reference': 'B'}])
+    queue.claim()
+    queue.close()
+
+    # 模拟程序崩溃后重新启动
+    queue = WorkQueue(path)
+    assert queue.recover() == 1
+    assert queue.claim()[1:] == (1, {'External reference': 'A'})
+
+
+
+def test_checkpoint_survives_recover(tmp_path):
+    path = str(tmp_path / 'queue.db')
+    draft_url = 'https://www.vestiairecollective.com/sell-clothes-online/?id=123'
+
+    queue = WorkQueue(path)
+    queue.push_many([{'External reference': 'A'}])
+    item_id = queue.claim()[0]
+    assert queue.get_checkpoint(item_id) == (0, '')
+
+    queue.save_checkpoint(item_id, 2, draft_url)
+    queue.close()
+
+    queue = WorkQueue(path)
+    queue.recover()
+    item_id = queue.claim()[0]
+    assert queue.get_checkpoint(item_id) == (2, draft_url)
+
+
+def test_push_only_new_or_changed_rows(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.db'))
+    rows = [{'External reference': f'REF{i}', 'Price': 100} for i in range(1, 6)]
+
+    assert queue.push_many(rows) == (5, [])
+
+    # 同一个表格修正了一行，再次导入时只有这一行进入队列
+    rows[2] = {'External reference': 'REF3', 'Price': 120}
+    count, skipped = queue.push_many(rows)
+    assert count == 1
+    assert skipped == ['REF1', 'REF2', 'REF4', 'REF5']
+
+    # 修改后的行替换了队列中还未处理的旧版本，而不是重复排队
+    assert queue.counts() == {PENDING: 5}
+    claimed = [queue.claim() for _ in range(5)]
+    assert claimed[2][2] == {'External reference': 'REF3', 'Price': 120}
+
+
+def test_failed_row_can_be_pushed_again(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.db'))
+    rows = [{'External reference': 'A'}, {'External reference': 'B'}]
+    queue.push_many(rows)
+
+    queue.complete(queue.claim()[0])
+    queue.fail(queue.claim()[0], 'submit_step2_photos failed')
+
+    assert queue.push_many(rows) == (1, ['A'])
+
+
+def test_iter_pending(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.db'))
+    queue.push_many([{'External reference': ref} for ref in 'ABCDE'])
+    queue.claim()
+
+    assert [row['External reference'] for row in queue.iter_pending(batch_size=2)] == ['B', 'C', 'D', 'E']
+
+
+def test_interrupted_item_keeps_its_draft(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.db'))
+    queue.push_many([{'External reference': 'A'}, {'External reference': 'B'}])
+    item_id = queue.claim()[0]
+    queue.save_checkpoint(item_id, 2, 'https://a/draft')
+
+    # main.py: Ctrl-C 时产品放回队列，不算完成也不算失败
+    try:
+        raise KeyboardInterrupt
+    except BaseException:
+        queue.release(item_id)
+
+    assert queue.counts() == {PENDING: 2}
+    item = queue.claim()
+    assert item[0] == item_id
+    assert queue.get_checkpoint(item_id) == (2, 'https://a/draft')
+
+
+def test_failed_row_pushed_again_continues_its_draft(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.db'))
+    row = {'External reference': 'A', 'Material': 'Leather'}
+    queue.push_many([row])
+    item_id = queue.claim()[0]
+    queue.save_checkpoint(item_id, 3, 'https://a/draft')
+    queue.fail(item_id, 'Browser disconnected')
+
+    # 同样的行：从下一步继续同一个草稿
+    queue.push_many([row])
+    item_id = queue.claim()[0]
+    assert queue.get_checkpoint(item_id) == (3, 'https://a/draft')
+    queue.fail(item_id, 'Browser disconnected')
+
+    # 修改过的行：填过的草稿不能再填一次，从新的草稿开始
+    queue.push_many([{'External reference': 'A', 'Material': 'Suede'}])
+    item_id = queue.claim()[0]
+    assert queue.get_checkpoint(item_id) == (0, '')
+
+
+def test_changed_pending_row_starts_a_new_draft(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.db'))
+    queue.push_many([{'External reference': 'A', 'Material': 'Leather'}])
+    item_id = queue.claim()[0]
+    queue.save_checkpoint(item_id, 3, 'https://a/draft')
+    queue.recover()  # 第 3 步之后程序崩溃
+
+    queue.push_many([{'External reference': 'A', 'Material': 'Suede'}])
+
+    assert queue.counts() == {PENDING: 1}
+    assert queue.get_checkpoint(item_id) == (0, '')
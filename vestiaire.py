@@ -1,6 +1,9 @@
 import time
 import smart
+import option_catalog
 import pics
+import page_state
+import retry
 import platform
 import os
 import sys
@@ -13,6 +16,13 @@ from DrissionPage import ChromiumPage, ChromiumOptions, SessionPage, SessionOpti
 from dotenv import load_dotenv
 
 
+def _wait_before_retry(tab, attempt):
+    """登录重试前按指数退避等待，不再每次固定等30秒"""
+    delay = retry.BROWSER_POLICY.delay(attempt)
+    logger.info(f"等待{delay:.0f}秒后重试...")
+    tab.wait(delay)
+
+
 def login(tab, username, password, max_retries=3):
     """登录到 Vestiaire Collective"""
     for attempt in range(max_retries):
@@ -94,10 +104,9 @@ def login(tab, username, password, max_retries=3):
                     
             if not login_button:
                 logger.error("未找到登录按钮")
-                logger.debug(f"页面内容: {tab.html}")
+                logger.debug(f"页面状态: {page_state.probe(tab)}")
                 if attempt < max_retries - 1:
-                    logger.info("等待30秒后重试...")
-                    tab.wait(30)
+                    _wait_before_retry(tab, attempt)
                     continue
                 raise Exception("未找到登录按钮")
                 
@@ -161,7 +170,7 @@ def login(tab, username, password, max_retries=3):
             
             # 记录登录表单页面URL
             logger.debug(f'登录表单页面URL: {tab.url}')
-            logger.debug(f'登录表单页面HTML: {tab.html}')
+            logger.debug(f'登录表单页面状态: {page_state.probe(tab)}')
             
             # 输入邮箱
             email_selectors = [
@@ -184,10 +193,9 @@ def login(tab, username, password, max_retries=3):
                     
             if not email_input:
                 logger.error("未找到邮箱输入框")
-                logger.debug(f"页面内容: {tab.html}")
+                logger.debug(f"页面状态: {page_state.probe(tab)}")
                 if attempt < max_retries - 1:
-                    logger.info("等待30秒后重试...")
-                    tab.wait(30)
+                    _wait_before_retry(tab, attempt)
                     continue
                 raise Exception("未找到邮箱输入框")
                 
@@ -221,10 +229,9 @@ def login(tab, username, password, max_retries=3):
                     
             if not continue_button:
                 logger.error("未找到继续按钮")
-                logger.debug(f"页面内容: {tab.html}")
+                logger.debug(f"页面状态: {page_state.probe(tab)}")
                 if attempt < max_retries - 1:
-                    logger.info("等待30秒后重试...")
-                    tab.wait(30)
+                    _wait_before_retry(tab, attempt)
                     continue
                 raise Exception("未找到继续按钮")
                 
@@ -237,7 +244,7 @@ def login(tab, username, password, max_retries=3):
                 logger.debug("登录对话框已加载")
             except Exception as e:
                 logger.warning(f"等待登录对话框超时: {e}")
-                logger.debug(f"当前页面内容: {tab.html}")
+                logger.debug(f"当前页面状态: {page_state.probe(tab)}")
             
             # 记录密码输入页面URL和状态
             logger.debug(f'密码输入页面URL: {tab.url}')
@@ -254,8 +261,8 @@ def login(tab, username, password, max_retries=3):
                 'css:input[class*="password"]'
             ]
             
-            # 记录当前页面内容以便调试
-            logger.debug(f"当前页面HTML: {tab.html}")
+            # 记录当前页面状态以便调试
+            logger.debug(f"当前页面状态: {page_state.probe(tab)}")
             
             password_input = None
             for selector in password_selectors:
@@ -304,10 +311,9 @@ def login(tab, username, password, max_retries=3):
                                 
             if not password_input:
                 logger.error("未找到密码输入框")
-                logger.debug(f"页面内容: {tab.html}")
+                logger.debug(f"页面状态: {page_state.probe(tab)}")
                 if attempt < max_retries - 1:
-                    logger.info("等待30秒后重试...")
-                    tab.wait(30)
+                    _wait_before_retry(tab, attempt)
                     continue
                 raise Exception("未找到密码输入框")
                 
@@ -347,10 +353,9 @@ def login(tab, username, password, max_retries=3):
                     
             if not submit_button:
                 logger.error("未找到提交按钮")
-                logger.debug(f"页面内容: {tab.html}")
+                logger.debug(f"页面状态: {page_state.probe(tab)}")
                 if attempt < max_retries - 1:
-                    logger.info("等待30秒后重试...")
-                    tab.wait(30)
+                    _wait_before_retry(tab, attempt)
                     continue
                 raise Exception("未找到提交按钮")
                 
@@ -408,11 +413,10 @@ def login(tab, username, password, max_retries=3):
                 # 如果没有找到错误消息，检查页面状态
                 logger.debug(f"当前页面URL: {tab.url}")
                 logger.debug(f"页面标题: {tab.title}")
-                logger.debug(f"页面HTML: {tab.html}")
+                logger.debug(f"页面状态: {page_state.probe(tab)}")
                 
                 if attempt < max_retries - 1:
-                    logger.info("等待30秒后重试...")
-                    tab.wait(30)
+                    _wait_before_retry(tab, attempt)
                     continue
                 raise Exception("登录失败，未检测到成功标志")
             
@@ -421,10 +425,8 @@ def login(tab, username, password, max_retries=3):
         except Exception as e:
             logger.error(f"登录过程中出错: {e}")
             if attempt < max_retries - 1:
-                logger.info("等待30秒后重试...")
-            tab.wait(30)
+                _wait_before_retry(tab, attempt)
             continue
-            raise Exception(f"登录失败: {e}")
             
     return False
 
@@ -457,8 +459,13 @@ def goto_the_position(tab, type, cat, brand):
 
         tab.wait(1)
 
+        # 之前见过的选项直接选择，不需要读列表再匹配
+        catalog = option_catalog.get_catalog()
+        category_field = option_catalog.category_field(type)
+
         logger.debug(f'Choose the Category: {cat}')
-        smart.smart_click(tab, mode='select', options_css_xpath='css:#preductAddCategory', click_rule='', org_name=cat)
+        smart.smart_click(tab, mode='select', options_css_xpath='css:#preductAddCategory', click_rule='', org_name=cat,
+                          field=category_field, resolved=catalog.resolve(category_field, cat))
         # tab.ele('css:#preductAddCategory').select.by_text(cat)
 
         tab.wait(1)
@@ -466,13 +473,15 @@ def goto_the_position(tab, type, cat, brand):
         logger.debug(f'Input the brand: {brand}')
         # tab.ele(f"xpath://div[contains(@class, 'brand-search_depositForm_') and text()='{brand}']/..").click(by_js=True)
         # tab.ele(f"xpath://div[contains(@class, 'brand-search_depositForm_') and text()='{brand}']/..").click(by_js=True)
-        tab.ele(f'xpath://input[@id="depositForm__form__brands-input"]').input(brand)
+        resolved_brand = catalog.resolve('brand', brand)
+        tab.ele(f'xpath://input[@id="depositForm__form__brands-input"]').input(resolved_brand or brand)
 
         tab.wait(1)
         # options_css_xpath = "xpath://span[contains(@class, 'brand-search_depositForm_')]/../../../.."  # 定位到选项列表
         options_css_xpath = "xpath://*[contains(@class, 'brand-search_depositForm__form__optionsList__item__value')]/../../.."  # 定位到选项列表
         click_rule = "xpath://*[contains(@class, 'brand-search_depositForm__form__optionsList__item__value__') and normalize-space() = '{replace_name}']/.."  # 选项点击规则，{replace_name} 会被替换成最匹配名称
-        smart.smart_click(tab, mode='click', options_css_xpath=options_css_xpath, click_rule=click_rule, org_name=brand)
+        smart.smart_click(tab, mode='click', options_css_xpath=options_css_xpath, click_rule=click_rule, org_name=brand,
+                          field='brand', resolved=resolved_brand)
 
         tab.wait.ele_displayed('xpath://button[@id="vc-preduct-add-submit" and not(@disabled)]', timeout=15)
         tab.wait(1)
@@ -491,13 +500,41 @@ def goto_the_position(tab, type, cat, brand):
         raise Exception(f"Filter step failed, {e}")
 
 
+def resume_draft(tab, draft_url, finished_steps):
+    """
+    Reopen an existing draft and go to the first unfinished step
+    :param draft_url: the draft URL saved by the last run
+    :param finished_steps: number of finished steps, 0 means only the category was chosen
+    """
+    logger.debug(f'Reopen the draft {draft_url}, finished steps: {finished_steps}')
+
+    try:
+        tab.get(draft_url)
+
+        # 左侧的步骤菜单，每一项对应表单的一步
+        step_items = 'xpath://li[contains(@class, "AsideMenu_aside__menu__li")]'
+        tab.wait.ele_displayed(step_items, timeout=15, raise_err=True)
+        tab.wait(1)
+
+        steps = tab.eles(step_items)
+        if 0 < finished_steps < len(steps):
+            logger.debug(f'Go to the step {finished_steps + 1}')
+            steps[finished_steps].click(by_js=True)
+            tab.wait(2)
+
+        return True
+
+    except Exception as e:
+        raise Exception(f"Resume draft failed, {e}")
+
+
 def submit_step1_details(tab, product_data):
     """fill the form for the 1st step"""
     logger.success('Enter 1st step')
 
     if tab.ele("xpath://label[text()='External reference']", timeout=1):
         logger.debug(f'Input External reference: {product_data["External reference"]}')
-        tab.ele(f"xpath:input[id='external_reference']").input(product_data["External reference"])
+        tab.ele(f"xpath:input[id='external_reference']").input(product_data["External reference"], clear=True)
 
     if tab.ele("xpath://div/label[text()='Category']", timeout=1):
 
@@ -512,7 +549,8 @@ def submit_step1_details(tab, product_data):
         input_xpath_css = 'css:input[id="subcategory"]'
         option_css_xpath = "xpath://ul/li[@data-component-id='subcategory']/.."
         click_xpath_css = "xpath://ul/li[@data-component-id='subcategory' and normalize-space()='{replace_name}']"
-        input_search_click(tab, input_xpath_css, option_css_xpath, click_xpath_css, details_cat)
+        input_search_click(tab, input_xpath_css, option_css_xpath, click_xpath_css, details_cat,
+                           field=option_catalog.subcategory_field(product_data['Category']))
 
         tab.wait(1)
 
@@ -533,7 +571,7 @@ def submit_step1_details(tab, product_data):
         tab.ele(f"xpath://label[text()='Model']/following-sibling::*").click()
         tab.wait(5)
 
-        tab.ele(f"xpath://input[@placeholder='Find your item model']").input(product_data['Model'])
+        tab.ele(f"xpath://input[@placeholder='Find your item model']").input(product_data['Model'], clear=True)
         tab.wait(1)
 
         is_model_none = tab.ele(f"xpath://button[text()='None of these']")
@@ -550,19 +588,19 @@ def submit_step1_details(tab, product_data):
     input_xpath_css = 'css:div[data-component-id="material"] > button'
     option_css_xpath = "xpath://ul/li[@data-component-id='material']/.."
     click_xpath_css = "xpath://ul/li[@data-component-id='material' and normalize-space()='{replace_name}']"
-    input_search_click(tab, input_xpath_css, option_css_xpath, click_xpath_css, product_data["Material"])
+    input_search_click(tab, input_xpath_css, option_css_xpath, click_xpath_css, product_data["Material"], field='material')
 
     # input color
     input_xpath_css = 'css:input[id="color"]'
     option_css_xpath = "xpath://ul/li[@data-component-id='color']/.."
     click_xpath_css = "xpath://ul/li[@data-component-id='color' and normalize-space()='{replace_name}']"
-    input_search_click(tab, input_xpath_css, option_css_xpath, click_xpath_css, product_data["Color"])
+    input_search_click(tab, input_xpath_css, option_css_xpath, click_xpath_css, product_data["Color"], field='color')
 
     # input Pattern
     input_xpath_css = 'css:input[id="pattern"]'
     option_css_xpath = "xpath://ul/li[@data-component-id='pattern']/.."
     click_xpath_css = "xpath://ul/li[@data-component-id='pattern' and normalize-space()='{replace_name}']"
-    input_search_click(tab, input_xpath_css, option_css_xpath, click_xpath_css, product_data["Pattern"])
+    input_search_click(tab, input_xpath_css, option_css_xpath, click_xpath_css, product_data["Pattern"], field='pattern')
 
     # 只有在商品类别为手表时才处理手表相关字段
     if product_data["Category"].lower() in ["watches", "watch"]:
@@ -570,13 +608,13 @@ def submit_step1_details(tab, product_data):
         input_xpath_css = 'css:input[id="material_watch_strap"]'
         option_css_xpath = "xpath://ul/li[@data-component-id='material_watch_strap']/.."
         click_xpath_css = "xpath://ul/li[@data-component-id='material_watch_strap' and normalize-space()='{replace_name}']"
-        input_search_click(tab, input_xpath_css, option_css_xpath, click_xpath_css, product_data["Bracelet"])
+        input_search_click(tab, input_xpath_css, option_css_xpath, click_xpath_css, product_data["Bracelet"], field='material_watch_strap')
 
         # input Mechanism
         input_xpath_css = 'css:input[id="watch_mechanism"]'
         option_css_xpath = "xpath://ul/li[@data-component-id='watch_mechanism']/.."
         click_xpath_css = "xpath://ul/li[@data-component-id='watch_mechanism' and normalize-space()='{replace_name}']"
-        input_search_click(tab, input_xpath_css, option_css_xpath, click_xpath_css, product_data["Mechanism"])
+        input_search_click(tab, input_xpath_css, option_css_xpath, click_xpath_css, product_data["Mechanism"], field='watch_mechanism')
 
     tab.wait(1)
 
@@ -629,8 +667,11 @@ def submit_step2_photos(tab, product_data):
         file_list = pics.save_all_pics(product_data)
         if not file_list:
             raise Exception("未能获取到有效的照片文件")
-            
-        logger.debug(f'准备上传 {len(file_list)} 张照片')
+
+        # 继续的草稿里可能已经上传了一部分照片，只上传剩下的
+        uploaded = page_state.probe(tab).get('photos', 0)
+        remaining = file_list[uploaded:]
+        logger.debug(f'准备上传 {len(remaining)} 张照片，草稿里已有 {uploaded} 张')
         
         # 查找上传按钮
         upload_button_selectors = [
@@ -655,8 +696,9 @@ def submit_step2_photos(tab, product_data):
             
         # 执行上传
         try:
-            upload_button.click.to_upload(file_list)
-            logger.info(f'开始上传 {len(file_list)} 张照片')
+            if remaining:
+                upload_button.click.to_upload(remaining)
+                logger.info(f'开始上传 {len(remaining)} 张照片')
             
             # 等待上传完成
             loading_indicators = [
@@ -676,16 +718,9 @@ def submit_step2_photos(tab, product_data):
             tab.wait(2)  # 等待页面状态更新
             
             # 检查是否有错误提示
-            error_selectors = [
-                'css:[class*="error"]',
-                'css:[class*="alert"]',
-                'xpath://div[contains(text(), "error")]'
-            ]
-            
-            for selector in error_selectors:
-                if error_ele := tab.ele(selector, timeout=1):
-                    error_text = error_ele.text
-                    raise Exception(f"上传出现错误：{error_text}")
+            state = page_state.probe(tab)
+            if state['errors']:
+                raise Exception(f"上传出现错误：{'; '.join(state['errors'])}")
                     
             # 检查是否达到最小照片数量要求
             photo_count_text = tab.ele('css:.Photo_photoSection__text__juAIc', timeout=5).text
@@ -698,7 +733,7 @@ def submit_step2_photos(tab, product_data):
             # 点击继续按钮
             continue_button = tab.ele('xpath://button[text()="Continue" and not(@disabled)]')
             if not continue_button:
-                raise Exception("未找到可点击的继续按钮")
+                raise Exception(f"未找到可点击的继续按钮，继续按钮状态：{state['continue_button']}")
                 
             continue_button.click()
             
@@ -714,6 +749,7 @@ def submit_step2_photos(tab, product_data):
             
     except Exception as e:
         logger.error(f'照片上传步骤失败：{e}')
+        logger.debug(f'页面状态: {page_state.probe(tab)}')
         return False
 
 
@@ -805,12 +841,12 @@ def submit_step3_description(tab, product_data):
         if actual_value != description:
             logger.warning(f'描述文本验证失败，期望值：{description}，实际值：{actual_value}')
             # 尝试直接输入作为备选方案
-            description_ele.input(description)
+            description_ele.input(description, clear=True)
             
         # 点击继续按钮
         continue_button = tab.ele('xpath://button[text()="Continue" and not(@disabled)]')
         if not continue_button:
-            raise Exception("未找到可点击的继续按钮")
+            raise Exception(f"未找到可点击的继续按钮，继续按钮状态：{page_state.probe(tab)['continue_button']}")
             
         continue_button.click()
         
@@ -821,6 +857,7 @@ def submit_step3_description(tab, product_data):
         
     except Exception as e:
         logger.error(f'提交描述信息失败: {e}')
+        logger.debug(f'页面状态: {page_state.probe(tab)}')
         return False
 
 
@@ -975,23 +1012,34 @@ def submit_step5_price(tab, product_data):
         
     except Exception as e:
         logger.error(f'价格输入步骤发生错误：{e}')
+        logger.debug(f'页面状态: {page_state.probe(tab)}')
         return False
             
 
-def input_search_click(tab, input_xpath_css, option_css_xpath, click_xpath_css, the_name):
+def input_search_click(tab, input_xpath_css, option_css_xpath, click_xpath_css, the_name, field=''):
+    """
+    field: 表单字段的名字 (option_catalog)，之前见过的选项直接输入完整的名字并点击
+    """
     if not the_name:
         the_name = 'Other'
 
-    if not tab.ele(input_xpath_css, timeout=0):
+    target = tab.ele(input_xpath_css, timeout=0)
+    if not target:
         logger.warning(f'Can not locate the param {option_css_xpath}')
         tab.wait(1)
         return
 
-    tab.actions.click(input_xpath_css).type(the_name)
+    # 继续的草稿里输入框可能已经有内容，type 会接在后面
+    if target.tag == 'input':
+        target.clear()
+
+    resolved = option_catalog.get_catalog().resolve(field, the_name) if field else None
+    tab.actions.click(input_xpath_css).type(resolved or the_name)
 
     tab.wait(2)
 
-    smart.smart_click(tab, mode='click', options_css_xpath=option_css_xpath, click_rule=click_xpath_css, org_name=the_name)
+    smart.smart_click(tab, mode='click', options_css_xpath=option_css_xpath, click_rule=click_xpath_css, org_name=the_name,
+                      field=field, resolved=resolved)
 
     tab.wait(1)
 
@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+from loguru import logger
+
+
+QUEUE_DB = 'queue/queue.db'
+
+# 队列状态
+PENDING = 'pending'
+IN_PROGRESS = 'in_progress'
+DONE = 'done'
+FAILED = 'failed'
+
+REF_COLUMN = 'External reference'
+
+
+def row_fingerprint(product):
+    """Content hash of a product row, independent of the column order"""
+    data = json.dumps(product, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class WorkQueue:
+    """
+    SQLite (WAL) 产品队列，替代 queue 文件夹里面一行一个 Json 文件的方式
+    每个产品只有一行记录，按写入顺序（即 Excel 行顺序）领取
+    """
+
+    def __init__(self, path=QUEUE_DB):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # isolation_level=None: 自己控制事务，每条 UPDATE 本身就是原子操作
+        self.conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                row_index INTEGER NOT NULL,
+                external_ref TEXT NOT NULL DEFAULT '',
+                data TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                error TEXT NOT NULL DEFAULT '',
+                step INTEGER NOT NULL DEFAULT 0,
+                draft_url TEXT NOT NULL DEFAULT '',
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_items_status ON items (status, id);
+            CREATE TABLE IF NOT EXISTS row_hashes (
+                external_ref TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+        ''')
+        self._migrate()
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_items_ref ON items (external_ref, status)')
+
+    def _migrate(self):
+        """Add the newer columns to a queue created by an older version"""
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(items)')}
+        if 'external_ref' not in columns:
+            self.conn.execute("ALTER TABLE items ADD COLUMN external_ref TEXT NOT NULL DEFAULT ''")
+        if 'step' not in columns:
+            self.conn.execute('ALTER TABLE items ADD COLUMN step INTEGER NOT NULL DEFAULT 0')
+        if 'draft_url' not in columns:
+            self.conn.execute("ALTER TABLE items ADD COLUMN draft_url TEXT NOT NULL DEFAULT ''")
+
+    def push_many(self, products, start=1, batch_size=500):
+        """
+        Push the products to the queue, products can be any iterable and is consumed lazily.
+
+        Every product with an External reference is checked against the persistent content hash index:
+        rows that were already queued with exactly the same content are skipped, a changed row replaces
+        its still pending older version instead of being queued twice.
+        :return: (the number of pushed products, the External references of the skipped products)
+        """
+        count = 0
+        skipped = []
+        batch = []
+
+        for index, product in enumerate(products, start=start):
+            ref = str(product.get(REF_COLUMN, '')).strip()
+            fingerprint = row_fingerprint(product)
+
+            if ref and self.is_unchanged(ref, fingerprint):
+                skipped.append(ref)
+                continue
+
+            batch.append((index, ref, fingerprint, product))
+            if len(batch) >= batch_size:
+                self._insert(batch)
+                count += len(batch)
+                batch = []
+
+        if batch:
+            self._insert(batch)
+            count += len(batch)
+
+        return count, skipped
+
+    def _insert(self, batch):
+        with self.conn:
+            self.conn.execute('BEGIN')
+            for index, ref, fingerprint, product in batch:
+                now = time.time()
+                data = json.dumps(product, ensure_ascii=False)
+
+                updated = 0
+                if ref:
+                    # 行的内容变了，已经填过的草稿不再使用（输入框和照片会重复填写），从新的草稿开始
+                    self._abandon_drafts(ref, PENDING)
+                    updated = self.conn.execute(
+                        "UPDATE items SET row_index = ?, data = ?, step = 0, draft_url = '', updated_at = ? WHERE external_ref = ? AND status = ?",
+                        (index, data, now, ref, PENDING)
+                    ).rowcount
+                    self.conn.execute(
+                        'INSERT OR REPLACE INTO row_hashes (external_ref, fingerprint, updated_at) VALUES (?, ?, ?)',
+                        (ref, fingerprint, now)
+                    )
+
+                if not updated:
+                    step, draft_url = self._failed_draft(ref, data)
+                    self.conn.execute(
+                        '''INSERT INTO items (row_index, external_ref, data, status, step, draft_url, created_at, updated_at)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                        (index, ref, data, PENDING, step, draft_url, now, now)
+                    )
+
+    def _abandon_drafts(self, ref, status):
+        for (draft_url,) in self.conn.execute(
+                "SELECT draft_url FROM items WHERE external_ref = ? AND status = ? AND draft_url != ''", (ref, status)):
+            logger.warning(f'The row of {ref} changed, a new draft is created; delete the old draft {draft_url}')
+
+    def _failed_draft(self, ref, data):
+        """
+        The checkpoint of the last failed item of a product, so pushing the row again continues its draft
+        instead of creating a second one. A changed row starts a new draft.
+        :return: (step, draft_url), (0, '') when there is no draft
+        """
+        if not ref:
+            return 0, ''
+        row = self.conn.execute(
+            "SELECT step, draft_url, data FROM items WHERE external_ref = ? AND status = ? AND draft_url != '' ORDER BY id DESC LIMIT 1",
+            (ref, FAILED)
+        ).fetchone()
+        if row is None:
+            return 0, ''
+        step, draft_url, old_data = row
+        if old_data != data:
+            logger.warning(f'The row of {ref} changed, a new draft is created; delete the old draft {draft_url}')
+            return 0, ''
+        return step, draft_url
+
+    def is_unchanged(self, ref, fingerprint):
+        row = self.conn.execute('SELECT fingerprint FROM row_hashes WHERE external_ref = ?', (ref,)).fetchone()
+        return row is not None and row[0] == fingerprint
+
+    def forget(self, ref):
+        """Drop the content hash of a product, so the same row will be queued again next time"""
+        self.conn.execute('DELETE FROM row_hashes WHERE external_ref = ?', (ref,))
+
+    def claim(self):
+        """
+        Atomically take the next pending product and mark it as in progress.
+        :return: (item_id, row_index, product_data) or None when the queue is empty
+        """
+        row = self.conn.execute(
+            '''UPDATE items SET status = ?, updated_at = ?
+               WHERE id = (SELECT id FROM items WHERE status = ? ORDER BY id LIMIT 1)
+               RETURNING id, row_index, data''',
+            (IN_PROGRESS, time.time(), PENDING)
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        item_id, row_index, data = row
+        return item_id, row_index, json.loads(data)
+
+    def complete(self, item_id):
+        self._set_status(item_id, DONE)
+
+    def fail(self, item_id, reason=''):
+        self._set_status(item_id, FAILED, reason)
+
+        # A failed product can be queued again by pushing the same row
+        row = self.conn.execute('SELECT external_ref FROM items WHERE id = ?', (item_id,)).fetchone()
+        if row and row[0]:
+            self.forget(row[0])
+
+    def release(self, item_id):
+        """Put an interrupted product (e.g. Ctrl-C) back to pending, its checkpoint is kept"""
+        self._set_status(item_id, PENDING)
+
+    def _set_status(self, item_id, status, error=''):
+        self.conn.execute(
+            'UPDATE items SET status = ?, error = ?, updated_at = ? WHERE id = ?',
+            (status, error, time.time(), item_id)
+        )
+
+    def save_checkpoint(self, item_id, step, draft_url):
+        """
+        Persist the last finished form step (0 = category chosen, 1-5 = submit_step1 ... submit_step5)
+        and the draft URL, so a crashed run can continue the same draft.
+        """
+        self.conn.execute(
+            'UPDATE items SET step = ?, draft_url = ?, updated_at = ? WHERE id = ?',
+            (step, draft_url, time.time(), item_id)
+        )
+
+    def get_checkpoint(self, item_id):
+        """
+        :return: (last finished step, draft URL), the draft URL is '' when no draft was created yet
+        """
+        row = self.conn.execute('SELECT step, draft_url FROM items WHERE id = ?', (item_id,)).fetchone()
+        return (row[0], row[1]) if row else (0, '')
+
+    def recover(self):
+        """
+        Put the products left in progress by a crashed run back to pending.
+        :return: the number of recovered products
+        """
+        cursor = self.conn.execute(
+            'UPDATE items SET status = ?, updated_at = ? WHERE status = ?',
+            (PENDING, time.time(), IN_PROGRESS)
+        )
+        if cursor.rowcount:
+            logger.warning(f'Recovered {cursor.rowcount} unfinished products from the last run')
+        return cursor.rowcount
+
+    def has_pending(self):
+        row = self.conn.execute('SELECT 1 FROM items WHERE status = ? LIMIT 1', (PENDING,)).fetchone()
+        return row is not None
+
+    def iter_pending(self, batch_size=500):
+        """Yield the data of the pending products in queue order, read in batches"""
+        last_id = 0
+        while rows := self.conn.execute(
+            'SELECT id, data FROM items WHERE status = ? AND id > ? ORDER BY id LIMIT ?', (PENDING, last_id, batch_size)
+        ).fetchall():
+            for last_id, data in rows:
+                yield json.loads(data)
+
+    def next_pending_index(self):
+        row = self.conn.execute(
+            'SELECT row_index FROM items WHERE status = ? ORDER BY id LIMIT 1', (PENDING,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def counts(self):
+        """Number of products per status"""
+        rows = self.conn.execute('SELECT status, COUNT(*) FROM items GROUP BY status').fetchall()
+        return dict(rows)
+
+    def clear(self):
+        self.conn.execute('DELETE FROM items')
+
+    def close(self):
+        self.conn.close()